@@ -9,46 +9,72 @@ import random
 import time
 import logging
 import os
+import sys
+import uuid
 from datetime import datetime, timedelta
-from faker import Faker
 from pythonjsonlogger import jsonlogger
 
-# Настройка Faker для русских данных
-fake = Faker('ru_RU')
+# Общие модули лежат в generators/common (в контейнере - в /app/common)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import population, schema
+from common.probe import canary_from_env
+from common.profiling import install_profiling
+from common.routing import pre_routing_from_env
+from common.sampling import WeightedChoice, picker_from_env
+from common.sink import FileOutput, SinkHandler, exit_on_sigterm, outputs_from_env, sink_from_env
 
 # Конфигурация логирования
 log_dir = "/app/logs"
 os.makedirs(log_dir, exist_ok=True)
 
+# Запись на диск идет в фоновом потоке: генератор только кладет события в очередь.
+# Размер очереди и политика переполнения задаются SINK_CAPACITY / SINK_POLICY.
+sink = sink_from_env('auth-service')
+
 # JSON logger для структурированных логов
-json_handler = logging.FileHandler(f"{log_dir}/auth-service.json")
 json_formatter = jsonlogger.JsonFormatter(
     fmt='%(asctime)s %(levelname)s %(name)s %(message)s'
 )
-json_handler.setFormatter(json_formatter)
+# JSON события: файл для Logstash file input и/или прямая отправка (LOG_OUTPUT=file,tcp)
+json_handlers = [
+    SinkHandler(sink, output)
+    for output in outputs_from_env(f"{log_dir}/auth-service.json", json_formatter)
+]
 
 # Plain text logger для обычных логов
-text_handler = logging.FileHandler(f"{log_dir}/auth-service.log")
 text_formatter = logging.Formatter(
     '%(asctime)s [%(levelname)s] %(name)s: %(message)s'
 )
-text_handler.setFormatter(text_formatter)
+text_handler = SinkHandler(sink, FileOutput(f"{log_dir}/auth-service.log", text_formatter))
 
 # Создаём логгеры
 json_logger = logging.getLogger('auth-service-json')
-json_logger.addHandler(json_handler)
+for handler in json_handlers:
+    json_logger.addHandler(handler)
 json_logger.setLevel(logging.INFO)
+# index_suffix, tags и @timestamp проставляются здесь, а не в Logstash (PRE_ROUTING)
+pre_routing_from_env(json_logger)
+
+# Канареечные события для замера задержки доставки до Elasticsearch (CANARY_RATE в секунду)
+canary = canary_from_env('auth-service', json_logger)
 
 text_logger = logging.getLogger('auth-service')
 text_logger.addHandler(text_handler)
 text_logger.setLevel(logging.INFO)
 
-# Пользователи банка (симуляция)
-BANK_USERS = [
-    {'user_id': f'user_{i:04d}', 'username': fake.user_name(), 'email': fake.email(), 
-     'phone': fake.phone_number(), 'full_name': fake.name()}
-    for i in range(1, 501)  # 500 пользователей
-]
+# В режиме отладки каждое событие проверяется по общей схеме
+validate_event = None
+if os.getenv('LOG_LEVEL', 'INFO').upper() == 'DEBUG':
+    validate_event = schema.compile_validator('auth-service')
+
+# Пользователи банка и города: снимки популяций (python -m common.population build),
+# открываются через mmap без Faker
+BANK_USERS = population.load('users')
+CITIES = population.load('cities').column('name')
+
+# Активность пользователей и городов неравномерна: распределение задает ENTITY_SKEW / SKEW_<NAME>
+USER_PICKER = picker_from_env(BANK_USERS, 'users')
+CITY_PICKER = picker_from_env(CITIES, 'cities')
 
 # IP адреса (симуляция разных регионов)
 IP_POOLS = {
@@ -69,6 +95,9 @@ AUTH_EVENTS = {
     'logout': {'level': 'INFO', 'weight': 1}
 }
 
+# Alias таблица по весам событий строится один раз
+AUTH_EVENT_PICKER = WeightedChoice({event: info['weight'] for event, info in AUTH_EVENTS.items()})
+
 def get_random_ip(region='random'):
     """Генерирует случайный IP адрес"""
     if region == 'random':
@@ -92,16 +121,15 @@ def get_current_hour_activity_multiplier():
 
 def generate_auth_event():
     """Генерирует одно событие аутентификации"""
-    user = random.choice(BANK_USERS)
+    user = USER_PICKER.pick()
     
     # Выбираем тип события на основе весов
-    event_weights = [AUTH_EVENTS[event]['weight'] for event in AUTH_EVENTS]
-    event_type = random.choices(list(AUTH_EVENTS.keys()), weights=event_weights)[0]
+    event_type = AUTH_EVENT_PICKER.pick()
     event_info = AUTH_EVENTS[event_type]
     
     # Базовые данные события
     timestamp = datetime.now()
-    session_id = fake.uuid4()
+    session_id = str(uuid.uuid4())
     
     # IP адрес (подозрительные логины чаще с подозрительных IP)
     if event_type == 'suspicious_login':
@@ -136,8 +164,8 @@ def generate_auth_event():
     if event_type == 'login_success':
         event_data.update({
             'message': f"User {user['username']} successfully logged in",
-            'location': fake.city(),
-            'device_fingerprint': fake.sha256()[:16],
+            'location': CITY_PICKER.pick(),
+            'device_fingerprint': f"{random.getrandbits(64):016x}",
             'two_factor_used': random.choice([True, False])
         })
         
@@ -179,6 +207,10 @@ def generate_auth_event():
 
 def log_event(event_data):
     """Записывает событие в логи"""
+    if validate_event:
+        for error in validate_event(event_data):
+            print(f"⚠️ Schema violation: {error}")
+
     level = event_data['level']
     message = event_data.get('message', f"Auth event: {event_data['event_type']}")
     
@@ -197,32 +229,43 @@ def log_event(event_data):
         json_logger.error(message, extra=log_data)
         text_logger.error(message)
 
+# Счетчик событий процесса: run_cycle вызывают и main, и общий runner (python -m common.runner)
+event_count = 0
+
+def run_cycle():
+    """Один цикл генерации; возвращает паузу до следующего цикла в секундах"""
+    global event_count
+    
+    # Учитываем активность по времени суток
+    activity_multiplier = get_current_hour_activity_multiplier()
+    
+    # Генерируем события
+    events_per_cycle = max(1, int(random.randint(1, 5) * activity_multiplier))
+    
+    for _ in range(events_per_cycle):
+        event = generate_auth_event()
+        log_event(event)
+        event_count += 1
+        
+        if event_count % 100 == 0:
+            print(f"📊 Generated {event_count} auth events ({sink.describe()})")
+    
+    # Пауза между циклами (от 1 до 10 секунд)
+    return random.uniform(1.0, 10.0) / activity_multiplier
+
 def main():
     """Основной цикл генерации логов"""
     print("🔐 Starting Banking Auth Service Log Generator...")
     print(f"📁 Logs will be written to: {log_dir}")
-    
-    event_count = 0
+    # Профилирование по SIGUSR1/SIGUSR2 или PROFILE_ON_START (common/profiling.py)
+    install_profiling('auth-service')
+    # docker stop: дописать очередь sink'а перед выходом
+    exit_on_sigterm()
+    canary.start()
     
     try:
         while True:
-            # Учитываем активность по времени суток
-            activity_multiplier = get_current_hour_activity_multiplier()
-            
-            # Генерируем события
-            events_per_cycle = max(1, int(random.randint(1, 5) * activity_multiplier))
-            
-            for _ in range(events_per_cycle):
-                event = generate_auth_event()
-                log_event(event)
-                event_count += 1
-                
-                if event_count % 100 == 0:
-                    print(f"📊 Generated {event_count} auth events")
-            
-            # Пауза между циклами (от 1 до 10 секунд)
-            sleep_time = random.uniform(1.0, 10.0) / activity_multiplier
-            time.sleep(sleep_time)
+            time.sleep(run_cycle())
             
     except KeyboardInterrupt:
         print(f"\n✅ Auth service generator stopped. Total events: {event_count}")
@@ -0,0 +1,3 @@
+"""
+Общие модули генераторов банковских логов
+"""
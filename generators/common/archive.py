@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+Banking Log Archive
+Архив событий для офлайн-аналитики и тестов холодного хранения:
+zstd/gzip NDJSON сегменты фиксированного размера или Parquet файлы
+(по сервису и часу) из колоночных пачек событий
+
+Запуск из каталога generators: python -m common.archive scan|stats
+"""
+
+import argparse
+import gzip
+import io
+import json
+import os
+import time
+import zlib
+from datetime import datetime
+
+try:
+    import zstandard
+except ImportError:  # zstd формат недоступен, gzip остается
+    zstandard = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pip install pyarrow для формата parquet
+    pyarrow = None
+
+from common import schema
+
+# Формат -> расширение файла
+ARCHIVE_FORMATS = {
+    'zstd': '.ndjson.zst',
+    'gzip': '.ndjson.gz',
+    'parquet': '.parquet',
+}
+
+# Уровень сжатия по умолчанию
+DEFAULT_LEVELS = {'zstd': 9, 'gzip': 6}
+
+MANIFEST_NAME = '_manifest.jsonl'
+
+def _partition(created):
+    """Каталог дня и час для записи (локальное время, как в timestamp событий)"""
+    moment = datetime.fromtimestamp(created)
+    return moment.strftime('%Y-%m-%d'), moment.strftime('%H')
+
+class _Segment:
+    """Открытый NDJSON сегмент; пишется во временный файл и переименовывается при закрытии"""
+
+    def __init__(self, path, fmt, level):
+        self.path = path
+        self.tmp_path = path + '.tmp'
+        self.raw_bytes = 0
+        self.events = 0
+        self._file = open(self.tmp_path, 'wb')
+        if fmt == 'zstd':
+            self._stream = zstandard.ZstdCompressor(level=level).stream_writer(self._file)
+        else:
+            self._stream = gzip.GzipFile(fileobj=self._file, mode='wb', compresslevel=level)
+
+    def write(self, data, events):
+        self._stream.write(data)
+        self.raw_bytes += len(data)
+        self.events += events
+
+    def flush(self):
+        """Дописывает сжатый блок в файл: после сбоя процесса .tmp читается до этого места"""
+        self._stream.flush()  # zstd FLUSH_BLOCK / gzip Z_SYNC_FLUSH: кадр не закрывается
+        self._file.flush()
+
+    def close(self):
+        self._stream.close()
+        if not self._file.closed:
+            self._file.close()
+        os.replace(self.tmp_path, self.path)
+        return os.path.getsize(self.path)
+
+class ArchiveOutput:
+    """
+    Выход для BackgroundSink. Раскладывает события по <base>/<service>/<день>/<час>...
+    и ведет _manifest.jsonl с числом событий и размером каждого закрытого файла
+    """
+
+    def __init__(self, service, base_dir, formatter, fmt='zstd', segment_bytes=16 * 1024 * 1024,
+                 row_group_size=50000, level=None, flush_seconds=60.0):
+        if fmt not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unknown archive format: {fmt}")
+        if fmt == 'zstd' and zstandard is None:
+            raise RuntimeError("zstd archive requires the zstandard package")
+        if fmt == 'parquet' and pyarrow is None:
+            raise RuntimeError("parquet archive requires pyarrow (pip install pyarrow)")
+
+        self.service = service
+        self.base_dir = os.path.join(base_dir, service)
+        self.formatter = formatter
+        self.fmt = fmt
+        self.segment_bytes = segment_bytes
+        self.row_group_size = row_group_size
+        self.level = level if level is not None else DEFAULT_LEVELS.get(fmt)
+        # Не дольше flush_seconds в памяти: сжатый блок сегмента или row group parquet
+        self.flush_seconds = flush_seconds
+        self._flushed_at = time.monotonic()
+        # Строки parquet, отброшенные из-за значений не по схеме
+        self.dropped_rows = 0
+
+        self._hour = None
+        self._segment = None
+        self._segment_seq = 0
+        # Parquet: буфер строк по колонкам и открытый writer текущего часа
+        self._fields = schema.service_fields(service) if fmt == 'parquet' else None
+        self._columns = None
+        self._writer = None
+        self._writer_path = None
+        self._writer_rows = 0
+        self._recover_leftovers()
+
+    # ---------- общее ----------
+
+    def write_batch(self, records):
+        start = 0
+        # Пачка может пересекать границу часа - режем ее на куски
+        for i, record in enumerate(records):
+            hour = _partition(record.created)
+            if hour != self._hour:
+                if i > start:
+                    self._write_chunk(records[start:i])
+                self._roll_hour(hour)
+                start = i
+        if start < len(records):
+            self._write_chunk(records[start:])
+        if time.monotonic() - self._flushed_at >= self.flush_seconds:
+            self._flush_pending()
+
+    def _flush_pending(self):
+        if self._segment:
+            self._segment.flush()
+        if self._columns:
+            self._flush_row_group()
+        self._flushed_at = time.monotonic()
+
+    def _write_chunk(self, records):
+        if self.fmt == 'parquet':
+            self._append_columns(records)
+        else:
+            self._append_lines(records)
+
+    def _roll_hour(self, hour):
+        self._close_current()
+        self._hour = hour
+        self._segment_seq = 0
+        os.makedirs(os.path.join(self.base_dir, hour[0]), exist_ok=True)
+
+    def _file_path(self, suffix=''):
+        day, hour = self._hour
+        return os.path.join(self.base_dir, day, f"{hour}{suffix}{ARCHIVE_FORMATS[self.fmt]}")
+
+    def _record_manifest(self, path, events, raw_bytes, size, fmt=None):
+        entry = {
+            'file': os.path.basename(path),
+            'format': fmt or self.fmt,
+            'events': events,
+            'raw_bytes': raw_bytes,
+            'bytes': size,
+        }
+        with open(os.path.join(os.path.dirname(path), MANIFEST_NAME), 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+
+    def _close_current(self):
+        if self._segment:
+            size = self._segment.close()
+            self._record_manifest(self._segment.path, self._segment.events,
+                                  self._segment.raw_bytes, size)
+            self._segment = None
+        if self._columns:
+            self._flush_row_group()
+        if self._writer:
+            self._writer.close()
+            os.replace(self._writer_path + '.tmp', self._writer_path)
+            self._record_manifest(self._writer_path, self._writer_rows, None,
+                                  os.path.getsize(self._writer_path))
+            self._writer = None
+            self._writer_rows = 0
+
+    def close(self):
+        self._close_current()
+
+    def _recover_leftovers(self):
+        """
+        .tmp от процесса, убитого без close() (SIGKILL, OOM): NDJSON сегмент
+        дочитывается до последней целой строки и закрывается как обычный,
+        parquet без footer не читается - удаляется с предупреждением
+        """
+        for root, _, names in os.walk(self.base_dir):
+            for name in sorted(names):
+                if not name.endswith('.tmp'):
+                    continue
+                tmp_path = os.path.join(root, name)
+                path = tmp_path[:-len('.tmp')]
+                fmt = next((f for f, ext in ARCHIVE_FORMATS.items() if path.endswith(ext)), None)
+                if fmt is None or (fmt == 'zstd' and zstandard is None):
+                    print(f"⚠️ Archive {self.service}: leftover {tmp_path} left as is")
+                elif fmt == 'parquet':
+                    os.remove(tmp_path)
+                    print(f"⚠️ Archive {self.service}: removed unfinished {tmp_path} (no parquet footer)")
+                else:
+                    self._recover_segment(tmp_path, path, fmt)
+
+    def _recover_segment(self, tmp_path, path, fmt):
+        opener = _open_zstd if fmt == 'zstd' else gzip.open
+        chunks = []
+        try:
+            with opener(tmp_path) as stream:
+                for chunk in iter(lambda: stream.read(1024 * 1024), b''):
+                    chunks.append(chunk)
+        except (OSError, EOFError, zlib.error) + ((zstandard.ZstdError,) if zstandard else ()):
+            pass  # обрыв после последнего сброшенного блока
+        data = b''.join(chunks)
+        data = data[:data.rfind(b'\n') + 1]
+        os.remove(tmp_path)
+        if not data:
+            return
+        segment = _Segment(path, fmt, DEFAULT_LEVELS[fmt])
+        segment.write(data, data.count(b'\n'))
+        size = segment.close()
+        self._record_manifest(path, segment.events, segment.raw_bytes, size, fmt)
+        print(f"♻️ Archive {self.service}: recovered {segment.events} events into {path}")
+
+    # ---------- NDJSON сегменты ----------
+
+    def _append_lines(self, records):
+        data = ''.join(self.formatter.format(r) + '\n' for r in records).encode('utf-8')
+        if self._segment is None:
+            # После рестарта генератора номера сегментов часа продолжаются
+            self._segment_seq += 1
+            while os.path.exists(self._file_path(f"-{self._segment_seq:03d}")):
+                self._segment_seq += 1
+            self._segment = _Segment(self._file_path(f"-{self._segment_seq:03d}"), self.fmt, self.level)
+        self._segment.write(data, len(records))
+        if self._segment.raw_bytes >= self.segment_bytes:
+            size = self._segment.close()
+            self._record_manifest(self._segment.path, self._segment.events,
+                                  self._segment.raw_bytes, size)
+            self._segment = None
+
+    # ---------- Parquet ----------
+
+    def _arrow_schema(self):
+        types = {
+            'integer': pyarrow.int32(),
+            'long': pyarrow.int64(),
+            'double': pyarrow.float64(),
+            'boolean': pyarrow.bool_(),
+            'date': pyarrow.timestamp('us'),
+        }
+        fields = [pyarrow.field('levelname', pyarrow.string())]
+        for name, spec in self._fields.items():
+            arrow_type = types.get(spec['kind'], pyarrow.string())
+            if spec['many']:
+                arrow_type = pyarrow.list_(arrow_type)
+            fields.append(pyarrow.field(name, arrow_type))
+        return pyarrow.schema(fields)
+
+    def _append_columns(self, records):
+        if self._columns is None:
+            self._columns = {'levelname': []}
+            self._columns.update((name, []) for name in self._fields)
+        columns = self._columns
+        dates = [name for name, spec in self._fields.items() if spec['kind'] == 'date']
+        for record in records:
+            columns['levelname'].append(record.levelname)
+            for name in self._fields:
+                columns[name].append(getattr(record, name, None))
+            columns['message'][-1] = record.getMessage()
+            for name in dates:
+                value = columns[name][-1]
+                if isinstance(value, str):
+                    columns[name][-1] = datetime.fromisoformat(value)
+        if len(columns['levelname']) >= self.row_group_size:
+            self._flush_row_group()
+
+    def _flush_row_group(self):
+        # Буфер сбрасывается при любом исходе: плохое значение не должно валить все следующие сбросы
+        columns, self._columns = self._columns, None
+        try:
+            table = pyarrow.Table.from_pydict(columns, schema=self._arrow_schema())
+        except (pyarrow.ArrowException, TypeError, ValueError) as e:
+            rows = len(columns['levelname'])
+            self.dropped_rows += rows
+            print(f"❌ Archive {self.service}: dropped {rows} rows not matching the schema: {e}")
+            return
+        if self._writer is None:
+            self._writer_path = self._file_path()
+            # Файл часа уже есть (рестарт генератора) - пишем рядом новый
+            seq = 1
+            while os.path.exists(self._writer_path):
+                seq += 1
+                self._writer_path = self._file_path(f"-{seq:03d}")
+            self._writer = pyarrow.parquet.ParquetWriter(
+                self._writer_path + '.tmp', table.schema, compression='zstd'
+            )
+        self._writer.write_table(table)
+        self._writer_rows += table.num_rows
+
+    @classmethod
+    def from_env(cls, service, formatter):
+        """Параметры из ARCHIVE_DIR / ARCHIVE_FORMAT / ARCHIVE_SEGMENT_MB / ARCHIVE_ROW_GROUP / ARCHIVE_FLUSH_SECONDS"""
+        return cls(
+            service,
+            os.getenv('ARCHIVE_DIR', '/app/logs/archive'),
+            formatter,
+            fmt=os.getenv('ARCHIVE_FORMAT', 'zstd'),
+            segment_bytes=int(float(os.getenv('ARCHIVE_SEGMENT_MB', '16')) * 1024 * 1024),
+            row_group_size=int(os.getenv('ARCHIVE_ROW_GROUP', '50000')),
+            flush_seconds=float(os.getenv('ARCHIVE_FLUSH_SECONDS', '60')),
+        )
+
+# ---------- чтение ----------
+
+def iter_files(base_dir, service, day):
+    """Закрытые файлы архива за день в порядке времени"""
+    day_dir = os.path.join(base_dir, service, day)
+    if not os.path.isdir(day_dir):
+        return []
+    return [
+        os.path.join(day_dir, name) for name in sorted(os.listdir(day_dir))
+        if name.endswith(tuple(ARCHIVE_FORMATS.values()))
+    ]
+
+def read_archive(base_dir, service, day, columns=None):
+    """
+    Итерирует события архива за день. Для parquet читаются только нужные колонки
+    и события отдаются пачками dict'ов колонок; для NDJSON - построчно dict'ами.
+    """
+    for path in iter_files(base_dir, service, day):
+        if path.endswith('.parquet'):
+            parquet_file = pyarrow.parquet.ParquetFile(path)
+            for batch in parquet_file.iter_batches(columns=columns, batch_size=65536):
+                yield batch.to_pydict()
+            continue
+
+        opener = _open_zstd if path.endswith('.zst') else gzip.open
+        with opener(path) as stream:
+            batch = []
+            for line in stream:
+                event = json.loads(line)
+                batch.append({k: event.get(k) for k in columns} if columns else event)
+                if len(batch) == 65536:
+                    yield _rows_to_columns(batch)
+                    batch = []
+            if batch:
+                yield _rows_to_columns(batch)
+
+def _open_zstd(path):
+    return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True))
+
+def _rows_to_columns(rows):
+    columns = {}
+    for row in rows:
+        for key, value in row.items():
+            columns.setdefault(key, []).append(value)
+    # Выравниваем колонки, если в части строк поля не было
+    size = len(rows)
+    for values in columns.values():
+        values.extend([None] * (size - len(values)))
+    return columns
+
+def manifest_stats(base_dir, service):
+    """Сводка по формату: события, байты на диске и байт/событие"""
+    totals = {}
+    service_dir = os.path.join(base_dir, service)
+    for day in sorted(os.listdir(service_dir)) if os.path.isdir(service_dir) else []:
+        manifest = os.path.join(service_dir, day, MANIFEST_NAME)
+        if not os.path.exists(manifest):
+            continue
+        with open(manifest) as f:
+            for line in f:
+                entry = json.loads(line)
+                total = totals.setdefault(entry['format'], {'files': 0, 'events': 0, 'bytes': 0})
+                total['files'] += 1
+                total['events'] += entry['events']
+                total['bytes'] += entry['bytes']
+    for total in totals.values():
+        total['bytes_per_event'] = round(total['bytes'] / total['events'], 1) if total['events'] else None
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description='Banking log archive tools')
+    parser.add_argument('--dir', default=os.getenv('ARCHIVE_DIR', '/app/logs/archive'))
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    scan = sub.add_parser('scan', help='просканировать день архива сервиса')
+    scan.add_argument('--service', default='payment-service')
+    scan.add_argument('--day', default=datetime.now().strftime('%Y-%m-%d'))
+
+    stats = sub.add_parser('stats', help='байт на событие по форматам')
+    stats.add_argument('--service', default='payment-service')
+    stats.add_argument('--raw', help='исходный .json файл для сравнения')
+    args = parser.parse_args()
+
+    if args.command == 'scan':
+        started = time.perf_counter()
+        events = 0
+        amount = 0.0
+        for batch in read_archive(args.dir, args.service, args.day, columns=['amount', 'status']):
+            events += len(batch['status'])
+            amount += sum(a for a in batch['amount'] if a)
+        elapsed = time.perf_counter() - started
+        print(f"📦 {args.service} {args.day}: {events} events, amount {amount:,.2f} "
+              f"in {elapsed:.2f}s ({events / max(elapsed, 1e-9):,.0f} events/s)")
+    else:
+        if args.raw:
+            with open(args.raw, 'rb') as f:
+                lines = sum(1 for _ in f)
+            size = os.path.getsize(args.raw)
+            print(f"📄 raw json: {lines} events, {size} bytes, {size / max(lines, 1):.1f} bytes/event")
+        for fmt, total in manifest_stats(args.dir, args.service).items():
+            print(f"📦 {fmt}: {total['events']} events in {total['files']} files, "
+                  f"{total['bytes']} bytes, {total['bytes_per_event']} bytes/event")
+
+if __name__ == "__main__":
+    main()
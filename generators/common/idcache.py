@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Recent ID Caches
+Ограниченные по памяти множества недавних id для обнаружения дубликатов:
+LRU на заданное число id, окно по времени из корзин (set или Bloom filter).
+Корзины окна выбрасываются целиком, поэтому удаление старых id - O(1).
+
+Проверка из каталога generators: python -m common.idcache --ids 1000000
+"""
+
+import argparse
+import hashlib
+import math
+import os
+import sys
+import time
+import uuid
+from collections import OrderedDict, deque
+
+class LRUIdCache:
+    """Последние capacity id; при переполнении вытесняется давно не встречавшийся"""
+
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self._ids = OrderedDict()
+
+    def __contains__(self, key):
+        if key in self._ids:
+            self._ids.move_to_end(key)
+            return True
+        return False
+
+    def add(self, key):
+        self._ids[key] = None
+        self._ids.move_to_end(key)
+        if len(self._ids) > self.capacity:
+            self._ids.popitem(last=False)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def describe(self):
+        return f"lru {len(self)}/{self.capacity}"
+
+class BloomFilter:
+    """Множество фиксированного размера с ложноположительными ответами с вероятностью ~error_rate"""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Двойное хеширование: k позиций из двух 64-битных половин одного дайджеста
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def __contains__(self, key):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def add(self, key):
+        for p in self._positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+class TimeBucketedIdCache:
+    """
+    id за последние window секунд: buckets корзин по window / buckets секунд.
+    Корзина - set либо BloomFilter (bloom=True) на bucket_capacity id. Переполненная
+    корзина закрывается досрочно: под нагрузкой окно сжимается, память - нет.
+    """
+
+    def __init__(self, window=3600.0, buckets=12, bucket_capacity=10000, bloom=False,
+                 error_rate=0.001, clock=time.monotonic):
+        self.window = window
+        self.bucket_seconds = window / buckets
+        self.bucket_capacity = bucket_capacity
+        self.bloom = bloom
+        self.error_rate = error_rate
+        self.clock = clock
+        self._buckets = deque(maxlen=buckets)
+        self._opened = None
+        self._rotate()
+
+    def _new_bucket(self):
+        if not self.bloom:
+            return set()
+        # Проверка идет по всем корзинам, поэтому бюджет ошибки делится между ними
+        return BloomFilter(self.bucket_capacity, self.error_rate / self._buckets.maxlen)
+
+    def _rotate(self):
+        self._buckets.append(self._new_bucket())
+        self._opened = self.clock()
+
+    def _expire(self):
+        now = self.clock()
+        elapsed = now - self._opened
+        if elapsed < self.bucket_seconds:
+            return
+        # После долгой паузы все корзины устарели - начинаем окно заново
+        for _ in range(min(int(elapsed // self.bucket_seconds), self._buckets.maxlen)):
+            self._rotate()
+
+    def __contains__(self, key):
+        self._expire()
+        return any(key in bucket for bucket in self._buckets)
+
+    def add(self, key):
+        self._expire()
+        if len(self._buckets[-1]) >= self.bucket_capacity:
+            self._rotate()
+        self._buckets[-1].add(key)
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self._buckets)
+
+    def describe(self):
+        kind = 'bloom' if self.bloom else 'buckets'
+        return f"{kind} {len(self)} ids in {len(self._buckets)} buckets"
+
+def id_cache_from_env():
+    """
+    DEDUP_CACHE: lru (по умолчанию), buckets или bloom.
+    DEDUP_CAPACITY - всего id, DEDUP_WINDOW_SECONDS / DEDUP_BUCKETS - окно для buckets и bloom.
+    """
+    kind = os.getenv('DEDUP_CACHE', 'lru')
+    capacity = int(os.getenv('DEDUP_CAPACITY', '100000'))
+    if kind == 'lru':
+        return LRUIdCache(capacity)
+    buckets = int(os.getenv('DEDUP_BUCKETS', '12'))
+    return TimeBucketedIdCache(
+        window=float(os.getenv('DEDUP_WINDOW_SECONDS', '3600')),
+        buckets=buckets,
+        bucket_capacity=max(1, capacity // buckets),
+        bloom=(kind == 'bloom'),
+        error_rate=float(os.getenv('DEDUP_ERROR_RATE', '0.001')),
+    )
+
+def _deep_size(cache):
+    if isinstance(cache, LRUIdCache):
+        return sys.getsizeof(cache._ids) + sum(sys.getsizeof(k) for k in cache._ids)
+    return sum(len(b.bits) if isinstance(b, BloomFilter) else
+               sys.getsizeof(b) + sum(sys.getsizeof(k) for k in b) for b in cache._buckets)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare recent id caches')
+    parser.add_argument('--ids', type=int, default=1000000)
+    parser.add_argument('--capacity', type=int, default=1000000)
+    args = parser.parse_args()
+
+    ids = [str(uuid.uuid4()) for _ in range(args.ids)]
+    probes = [str(uuid.uuid4()) for _ in range(100000)]
+    caches = {
+        'lru': LRUIdCache(args.capacity),
+        'buckets': TimeBucketedIdCache(bucket_capacity=args.capacity // 12),
+        'bloom': TimeBucketedIdCache(bucket_capacity=args.capacity // 12, bloom=True),
+    }
+    for name, cache in caches.items():
+        started = time.perf_counter()
+        for key in ids:
+            cache.add(key)
+        added = time.perf_counter() - started
+        false_hits = sum(key in cache for key in probes)
+        recent_hits = sum(key in cache for key in ids[-10000:])
+        print(f"📊 {name:<8} add {added / len(ids) * 1e9:,.0f} ns/id, "
+              f"memory {_deep_size(cache) / 2**20:,.1f} MB, recent hits {recent_hits}/10000, "
+              f"false positives {false_hits / len(probes) * 100:.3f}%")
+
+if __name__ == "__main__":
+    main()
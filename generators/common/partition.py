@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Hour-Partitioned Event Files
+Файлы событий по часам (<service>/2026-10-16T14.json) и sidecar индекс
+(2026-10-16T14.idx) секунда -> смещение в байтах. Выборка окна времени
+идет через mmap и бинарный поиск, без чтения всего файла.
+
+Запуск из каталога generators: python -m common.partition query ...
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+from datetime import datetime, timedelta
+
+# Запись индекса: (секунда от начала часа, смещение строки в файле данных)
+INDEX_ENTRY = struct.Struct('<QQ')
+
+# Так jsonlogger пишет поле timestamp события
+TIMESTAMP_MARKER = b'"timestamp": "'
+
+# Насколько событие может опоздать в файле: канарейки и цикл генератора пишут
+# в один файл из разных потоков, timestamp берется до очереди sink'а. Чтение окна
+# останавливается только на событии позже конца окна больше чем на это время
+MAX_LATENESS = timedelta(seconds=60)
+
+def _second_of_hour(timestamp):
+    """'2026-10-16T14:05:09.123' -> 5 * 60 + 9 без разбора даты"""
+    return int(timestamp[14:16]) * 60 + int(timestamp[17:19])
+
+class PartitionedFileOutput:
+    """
+    Выход для BackgroundSink: пишет события в файл своего часа и добавляет в индекс
+    запись на первое событие каждой секунды и еще каждые index_every событий
+    """
+
+    def __init__(self, base_dir, service, formatter, index_every=1000):
+        self.dir = os.path.join(base_dir, service)
+        self.formatter = formatter
+        self.index_every = index_every
+        os.makedirs(self.dir, exist_ok=True)
+
+        self._hour = None
+        self._data = None
+        self._index = None
+        self._offset = 0
+        self._last_second = None
+        self._since_entry = 0
+
+    def _roll(self, hour):
+        self._close_files()
+        self._hour = hour
+        self._data = open(os.path.join(self.dir, f"{hour}.json"), 'ab')
+        self._index = open(os.path.join(self.dir, f"{hour}.idx"), 'ab')
+        # После рестарта дописываем в конец: смещения продолжаются с текущего размера
+        self._offset = self._data.seek(0, os.SEEK_END)
+        # Шаг разреженного индекса считается заново в каждом файле часа
+        self._last_second = None
+        self._since_entry = 0
+        # Файл часа уже есть (рестарт, опоздавшее событие прошлого часа): индекс продолжает его максимум
+        entries = self._index.seek(0, os.SEEK_END) // INDEX_ENTRY.size
+        if entries:
+            with open(self._index.name, 'rb') as f:
+                f.seek((entries - 1) * INDEX_ENTRY.size)
+                second = INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))[0]
+            self._last_second = f"{hour}:{second // 60:02d}:{second % 60:02d}"
+
+    def write_batch(self, records):
+        lines = []
+        entries = []
+        for record in records:
+            timestamp = getattr(record, 'timestamp', None)
+            if not isinstance(timestamp, str):
+                timestamp = datetime.fromtimestamp(record.created).isoformat()
+
+            hour = timestamp[:13]
+            if hour != self._hour:
+                self._flush(lines, entries)
+                lines, entries = [], []
+                self._roll(hour)
+
+            # Секунды индекса не убывают: опоздавшее событие (запись другого потока) помечается
+            # максимальной секундой, иначе бинарный поиск по индексу мог бы проскочить окно
+            second = timestamp[:19]
+            if self._last_second is None or second > self._last_second or self._since_entry >= self.index_every:
+                self._last_second = max(second, self._last_second or second)
+                entries.append(INDEX_ENTRY.pack(_second_of_hour(self._last_second), self._offset))
+                self._since_entry = 0
+
+            line = self.formatter.format(record).encode('utf-8') + b'\n'
+            lines.append(line)
+            self._offset += len(line)
+            self._since_entry += 1
+        self._flush(lines, entries)
+
+    def _flush(self, lines, entries):
+        if not lines:
+            return
+        # Сначала данные, потом индекс: индекс никогда не указывает за конец файла
+        self._data.write(b''.join(lines))
+        self._data.flush()
+        self._index.write(b''.join(entries))
+        self._index.flush()
+
+    def _close_files(self):
+        for f in (self._data, self._index):
+            if f:
+                f.close()
+        self._data = self._index = None
+
+    def close(self):
+        self._close_files()
+
+    @classmethod
+    def from_env(cls, base_dir, service, formatter):
+        """Параметры из PARTITION_DIR / PARTITION_INDEX_EVERY"""
+        return cls(
+            os.getenv('PARTITION_DIR', base_dir),
+            service,
+            formatter,
+            index_every=int(os.getenv('PARTITION_INDEX_EVERY', '1000')),
+        )
+
+# ---------- чтение ----------
+
+def _find_offset(index_path, second):
+    """Смещение первой строки с секундой >= second (бинарный поиск по mmap индекса)"""
+    size = os.path.getsize(index_path) if os.path.exists(index_path) else 0
+    count = size // INDEX_ENTRY.size
+    if count == 0:
+        return None
+    with open(index_path, 'rb') as f, mmap.mmap(f.fileno(), count * INDEX_ENTRY.size,
+                                                access=mmap.ACCESS_READ) as mm:
+        entries = memoryview(mm).cast('Q')
+        try:
+            lo, hi = 0, count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if entries[mid * 2] < second:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            return entries[lo * 2 + 1] if lo < count else None
+        finally:
+            entries.release()
+
+def _line_timestamp(line):
+    start = line.find(TIMESTAMP_MARKER)
+    if start < 0:
+        return None
+    start += len(TIMESTAMP_MARKER)
+    return line[start:line.index(b'"', start)].decode()
+
+def query(base_dir, service, start, end, lateness=MAX_LATENESS):
+    """
+    Отдает сырые JSON строки (bytes) событий сервиса с start <= timestamp < end.
+    start/end - datetime или ISO строки в локальном времени событий. Строки идут в порядке
+    файла; события, опоздавшие больше чем на lateness, в выборку могут не попасть
+    """
+    # Приводим к полному виду YYYY-MM-DDTHH:MM:SS[.ffffff], как в событиях
+    start = (start if isinstance(start, datetime) else datetime.fromisoformat(start)).isoformat()
+    end = end if isinstance(end, datetime) else datetime.fromisoformat(end)
+    stop = (end + lateness).isoformat()
+    end = end.isoformat()
+    hour = datetime.fromisoformat(start[:13])
+    last_hour = datetime.fromisoformat(end[:13])
+
+    while hour <= last_hour:
+        name = hour.strftime('%Y-%m-%dT%H')
+        data_path = os.path.join(base_dir, service, f"{name}.json")
+        hour += timedelta(hours=1)
+        if not os.path.exists(data_path) or os.path.getsize(data_path) == 0:
+            continue
+
+        offset = 0
+        if start[:13] == name:
+            offset = _find_offset(os.path.join(base_dir, service, f"{name}.idx"),
+                                  _second_of_hour(start))
+            if offset is None:
+                continue
+
+        with open(data_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            position = offset
+            while position < len(mm):
+                newline = mm.find(b'\n', position)
+                if newline < 0:
+                    break  # недописанная строка в конце файла
+                line = mm[position:newline]
+                position = newline + 1
+                timestamp = _line_timestamp(line)
+                if timestamp is None or timestamp < start:
+                    continue
+                if timestamp >= stop:
+                    return
+                if timestamp >= end:
+                    continue  # за концом окна, но до него еще могут быть опоздавшие
+                yield line
+
+def main():
+    parser = argparse.ArgumentParser(description='Hour-partitioned event files')
+    parser.add_argument('--dir', default=os.getenv('PARTITION_DIR', '/app/logs'))
+    sub = parser.add_subparsers(dest='command', required=True)
+    q = sub.add_parser('query', help='вывести события за окно времени')
+    q.add_argument('--service', default='payment-service')
+    q.add_argument('--from', dest='start', required=True, help='например 2026-10-16T14:00')
+    q.add_argument('--to', dest='end', required=True, help='например 2026-10-16T14:05')
+    q.add_argument('--count', action='store_true', help='только посчитать события')
+    args = parser.parse_args()
+
+    count = 0
+    out = sys.stdout.buffer
+    for line in query(args.dir, args.service, args.start, args.end):
+        count += 1
+        if not args.count:
+            out.write(line + b'\n')
+    if args.count:
+        print(f"📊 {count} events between {args.start} and {args.end}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Logstash Pipeline Benchmark
+Прогоняет один и тот же корпус событий через полный (logstash/pipeline) и
+облегченный (logstash/pipeline-slim) pipeline и сравнивает пропускную
+способность и CPU Logstash по его monitoring API (:9600).
+
+Полному pipeline отдаются события без полей маршрутизации, облегченному -
+те же события с полями из common.routing. Генераторы на время замера нужно
+остановить: их события попадают в те же счетчики.
+
+Запуск из каталога generators:
+  python -m common.pipeline_bench build --from '/app/logs/*.json' --events 50000
+  python -m common.pipeline_bench run --recreate --variants pipeline,pipeline-slim
+"""
+
+import argparse
+import glob
+import json
+import os
+import socket
+import subprocess
+import time
+
+import requests
+
+from common.routing import routing_fields
+from common.shipper import LumberjackOutput
+
+VARIANTS = ['pipeline', 'pipeline-slim']
+
+# Поля, которые в полном pipeline вычисляет сам Logstash
+ROUTING_FIELDS = ('index_suffix', 'tags', '@timestamp', 'log_format')
+
+def build_corpus(patterns, events, out_dir):
+    """Берет первые events JSON строк и пишет raw.ndjson и routed.ndjson"""
+    paths = sorted({p for pattern in patterns for p in glob.glob(pattern)})
+    os.makedirs(out_dir, exist_ok=True)
+    count = 0
+    with open(os.path.join(out_dir, 'raw.ndjson'), 'w', encoding='utf-8') as raw_file, \
+            open(os.path.join(out_dir, 'routed.ndjson'), 'w', encoding='utf-8') as routed_file:
+        for path in paths:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if count >= events:
+                        return count
+                    if not line.endswith('\n'):
+                        break  # недописанная строка
+                    event = json.loads(line)
+                    for name in ROUTING_FIELDS:
+                        event.pop(name, None)
+                    raw_file.write(json.dumps(event, ensure_ascii=False) + '\n')
+                    routed = {**event, **routing_fields(event)}
+                    routed_file.write(json.dumps(routed, ensure_ascii=False) + '\n')
+                    count += 1
+    return count
+
+def load_corpus(corpus_dir, variant):
+    name = 'raw.ndjson' if variant == 'pipeline' else 'routed.ndjson'
+    with open(os.path.join(corpus_dir, name), 'rb') as f:
+        return [line.rstrip(b'\n') for line in f if line.strip()]
+
+def node_stats(api, pipeline_id='main'):
+    """Счетчики Logstash: события на выходе, время воркеров, CPU процесса, время фильтров"""
+    stats = requests.get(f"{api}/_node/stats/pipelines,process", timeout=10).json()
+    pipeline = stats['pipelines'][pipeline_id]
+    filters = {}
+    for plugin in pipeline['plugins']['filters']:
+        key = plugin.get('name', 'filter')
+        filters[key] = filters.get(key, 0) + plugin.get('events', {}).get('duration_in_millis', 0)
+    return {
+        'out': pipeline['events']['out'],
+        'worker_ms': pipeline['events']['duration_in_millis'],
+        'cpu_ms': stats['process']['cpu']['total_in_millis'],
+        'filters': filters,
+    }
+
+def wait_for_logstash(api, host, port, timeout=180):
+    """Ждет monitoring API и beats input после пересоздания контейнера"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            node_stats(api)
+            socket.create_connection((host, port), timeout=2).close()
+            return True
+        except (requests.RequestException, KeyError, OSError):
+            time.sleep(2)
+    return False
+
+def recreate_logstash(variant, compose_dir):
+    """Пересоздает контейнер logstash с нужным каталогом pipeline"""
+    print(f"🔁 Recreating logstash with {variant}")
+    subprocess.run(
+        ['docker-compose', 'up', '-d', '--force-recreate', 'logstash'],
+        cwd=compose_dir, env={**os.environ, 'LOGSTASH_PIPELINE': variant}, check=True
+    )
+
+def measure(lines, host, port, api, timeout=600):
+    """Отправляет корпус в beats input и ждет, пока все события выйдут из pipeline"""
+    idle = node_stats(api)
+    time.sleep(2)
+    before = node_stats(api)
+    if before['out'] != idle['out']:
+        print(f"⚠️ Logstash is not idle ({before['out'] - idle['out']} events in 2s), results will be skewed")
+
+    started = time.monotonic()
+    output = LumberjackOutput(host, port, formatter=None, spool_capacity=len(lines))
+    output.write_payloads(lines)
+    output.close()
+
+    deadline = started + timeout
+    after = node_stats(api)
+    while after['out'] - before['out'] < len(lines) and time.monotonic() < deadline:
+        time.sleep(0.25)
+        after = node_stats(api)
+    elapsed = time.monotonic() - started
+
+    events = after['out'] - before['out']
+    per_1k = 1000 / max(events, 1)
+    return {
+        'events': events,
+        'seconds': round(elapsed, 2),
+        'events_per_sec': round(events / elapsed, 1),
+        'cpu_ms_per_1k': round((after['cpu_ms'] - before['cpu_ms']) * per_1k, 2),
+        'worker_ms_per_1k': round((after['worker_ms'] - before['worker_ms']) * per_1k, 2),
+        'filter_ms_per_1k': {
+            name: round((ms - before['filters'].get(name, 0)) * per_1k, 2)
+            for name, ms in sorted(after['filters'].items())
+        },
+    }
+
+def format_results(results):
+    lines = [f"{'variant':<16}{'events/s':>10}{'cpu ms/1k':>11}{'worker ms/1k':>14}"]
+    for variant, r in results.items():
+        lines.append(f"{variant:<16}{r['events_per_sec']:>10,.0f}{r['cpu_ms_per_1k']:>11.1f}"
+                     f"{r['worker_ms_per_1k']:>14.1f}")
+        for name, ms in r['filter_ms_per_1k'].items():
+            lines.append(f"  {name:<26}{ms:>12.1f}")
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare full and slim Logstash pipelines')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    build = sub.add_parser('build', help='собрать фиксированный корпус из логов генераторов')
+    build.add_argument('--from', dest='patterns', nargs='+', default=['/app/logs/*.json'])
+    build.add_argument('--events', type=int, default=50000)
+    build.add_argument('--corpus', default='/app/logs/bench-corpus')
+
+    run = sub.add_parser('run', help='прогнать корпус через pipeline и снять метрики')
+    run.add_argument('--corpus', default='/app/logs/bench-corpus')
+    run.add_argument('--variants', default='pipeline,pipeline-slim')
+    run.add_argument('--logstash', default='localhost:5044')
+    run.add_argument('--api', default='http://localhost:9600')
+    run.add_argument('--recreate', action='store_true',
+                     help='пересоздавать контейнер logstash под каждый вариант (нужен docker-compose)')
+    run.add_argument('--compose-dir', default='..')
+    run.add_argument('--report', help='записать результаты в JSON')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        count = build_corpus(args.patterns, args.events, args.corpus)
+        print(f"✅ Corpus of {count} events written to {args.corpus}")
+        return
+
+    host, port = args.logstash.rsplit(':', 1)
+    results = {}
+    for variant in args.variants.split(','):
+        if variant not in VARIANTS:
+            parser.error(f"unknown variant {variant}, expected one of {VARIANTS}")
+        if args.recreate:
+            recreate_logstash(variant, args.compose_dir)
+            if not wait_for_logstash(args.api, host, int(port)):
+                print(f"❌ Logstash did not come up with {variant}")
+                return
+        lines = load_corpus(args.corpus, variant)
+        print(f"🚀 Sending {len(lines)} events through {variant}")
+        results[variant] = measure(lines, host, int(port), args.api)
+
+    print(format_results(results))
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Population Snapshots
+Популяции генераторов (пользователи, счета, города, компании) собираются
+один раз через Faker в бинарный снимок: числовые колонки лежат массивами,
+строковые - кодами в таблицу уникальных строк. Генераторы открывают снимок
+через mmap и разбирают только заголовок; строки декодируются при обращении.
+Страницы файла общие для всех процессов, читающих один снимок.
+
+Сборка из каталога generators: python -m common.population build
+"""
+
+import argparse
+import array
+import io
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+
+# Версия формата файла; версия популяции хранится в заголовке отдельно.
+# Массивы пишутся в порядке байт машины (little-endian на x86/arm64)
+FORMAT_VERSION = 1
+MAGIC = b'BANKPOP\x00'
+
+# magic, версия формата, версия популяции, число колонок, число строк
+HEADER = struct.Struct('<8sHHIQ')
+# имя, вид (d - double, q - int64, s - строка), смещение данных, смещение таблицы строк, строк в таблице
+COLUMN = struct.Struct('<32sc7xQQQ')
+
+ARRAY_TYPES = {b'd': 'd', b'q': 'q'}
+STRING_CODE = 'I'
+
+DEFAULT_DIR = os.getenv('POPULATION_DIR', '/app/data/populations')
+
+def _align(f):
+    """Выравнивает позицию файла на 8 байт, чтобы массивы можно было cast'ить"""
+    padding = -f.tell() % 8
+    f.write(b'\x00' * padding)
+    return f.tell()
+
+def write_snapshot(path, columns, version):
+    """
+    Пишет снимок. columns - {имя: (вид, значения)}, все колонки одной длины.
+    Файл пишется во временный и переименовывается: читатели не видят половину.
+    """
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        _write_columns(f, columns, version)
+    os.replace(tmp_path, path)
+
+def _write_columns(f, columns, version):
+    """Пишет снимок в файловый объект с seek/tell (файл или io.BytesIO)"""
+    rows = len(next(iter(columns.values()))[1]) if columns else 0
+    directory = []
+    f.write(b'\x00' * (HEADER.size + COLUMN.size * len(columns)))
+    for name, (kind, values) in columns.items():
+        if len(values) != rows:
+            raise ValueError(f"Column {name} has {len(values)} rows, expected {rows}")
+        if kind in ARRAY_TYPES:
+            data_offset = _align(f)
+            f.write(array.array(ARRAY_TYPES[kind], values).tobytes())
+            directory.append((name, kind, data_offset, 0, 0))
+            continue
+        # Строки: коды -> таблица уникальных значений (смещения + блоб utf-8)
+        table = {}
+        codes = [table.setdefault(value, len(table)) for value in values]
+        encoded = [value.encode('utf-8') for value in table]
+        data_offset = _align(f)
+        f.write(array.array(STRING_CODE, codes).tobytes())
+        table_offset = _align(f)
+        offsets = [0]
+        for item in encoded:
+            offsets.append(offsets[-1] + len(item))
+        f.write(array.array('Q', offsets).tobytes())
+        f.write(b''.join(encoded))
+        directory.append((name, b's', data_offset, table_offset, len(table)))
+
+    f.seek(0)
+    f.write(HEADER.pack(MAGIC, FORMAT_VERSION, version, len(columns), rows))
+    for name, kind, data_offset, table_offset, table_size in directory:
+        f.write(COLUMN.pack(name.encode(), kind, data_offset, table_offset, table_size))
+
+class Column:
+    """Одна колонка снимка, индексируется как список"""
+
+    def __init__(self, buffer, kind, rows, data_offset, table_offset, table_size):
+        self.kind = kind
+        self.rows = rows
+        if kind in ARRAY_TYPES:
+            self._values = buffer[data_offset:data_offset + rows * 8].cast(ARRAY_TYPES[kind])
+            return
+        self._codes = buffer[data_offset:data_offset + rows * 4].cast(STRING_CODE)
+        self._offsets = buffer[table_offset:table_offset + (table_size + 1) * 8].cast('Q')
+        self._blob = buffer[table_offset + (table_size + 1) * 8:]
+        self._strings = {}
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, index):
+        if self.kind in ARRAY_TYPES:
+            return self._values[index]
+        code = self._codes[index]
+        value = self._strings.get(code)
+        if value is None:
+            value = str(self._blob[self._offsets[code]:self._offsets[code + 1]], 'utf-8')
+            self._strings[code] = value
+        return value
+
+class Snapshot:
+    """
+    Снимок популяции: len() и [i] -> dict строки, column(имя) -> Column.
+    data - готовые байты снимка вместо файла (сборка в памяти, см. load)
+    """
+
+    def __init__(self, path, version=None, data=None):
+        self.path = path
+        if data is None:
+            with open(path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._mm = data
+        buffer = memoryview(self._mm)
+        magic, format_version, self.version, column_count, self.rows = HEADER.unpack_from(buffer)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError(f"{path}: not a population snapshot v{FORMAT_VERSION}")
+        if version is not None and self.version != version:
+            raise ValueError(f"{path}: population version {self.version}, expected {version}")
+
+        self.columns = {}
+        for i in range(column_count):
+            name, kind, data_offset, table_offset, table_size = COLUMN.unpack_from(
+                buffer, HEADER.size + i * COLUMN.size)
+            self.columns[name.rstrip(b'\x00').decode()] = Column(
+                buffer, kind, self.rows, data_offset, table_offset, table_size)
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, index):
+        if not -self.rows <= index < self.rows:
+            raise IndexError(index)
+        return {name: column[index] for name, column in self.columns.items()}
+
+    def column(self, name):
+        return self.columns[name]
+
+# ---------- описания популяций ----------
+
+def _generate_iban(rng):
+    """Российский IBAN (та же схема, что была в payment_generator)"""
+    bank_code = rng.choice(['044525974', '044525225', '044525593'])  # ВТБ, Сбербанк, Альфа
+    account = ''.join(str(rng.randint(0, 9)) for _ in range(20))
+    return f"RU{rng.randint(10, 99)}{bank_code}{account}"
+
+def _build_users(fake, rng, size):
+    return {
+        'user_id': (b's', [f'user_{i:04d}' for i in range(1, size + 1)]),
+        'username': (b's', [fake.user_name() for _ in range(size)]),
+        'email': (b's', [fake.email() for _ in range(size)]),
+        'phone': (b's', [fake.phone_number() for _ in range(size)]),
+        'full_name': (b's', [fake.name() for _ in range(size)]),
+    }
+
+def _build_accounts(fake, rng, size):
+    return {
+        'account_id': (b's', [f'acc_{i:06d}' for i in range(1, size + 1)]),
+        'iban': (b's', [_generate_iban(rng) for _ in range(size)]),
+        'balance': (b'd', [rng.uniform(1000, 1000000) for _ in range(size)]),
+        'owner_name': (b's', [fake.name() for _ in range(size)]),
+        'account_type': (b's', [rng.choice(['current', 'savings', 'business']) for _ in range(size)]),
+    }
+
+def _build_cities(fake, rng, size):
+    return {'name': (b's', [fake.city() for _ in range(size)])}
+
+def _build_companies(fake, rng, size):
+    return {'name': (b's', [fake.company() for _ in range(size)])}
+
+# Имя -> размер по умолчанию, версия (поднимать при изменении колонок), функция сборки
+POPULATIONS = {
+    'users': {'size': 500, 'version': 1, 'build': _build_users},
+    'accounts': {'size': 1000, 'version': 1, 'build': _build_accounts},
+    'cities': {'size': 300, 'version': 1, 'build': _build_cities},
+    'companies': {'size': 1000, 'version': 1, 'build': _build_companies},
+}
+
+def snapshot_path(name, directory=None):
+    return os.path.join(directory or DEFAULT_DIR, f"{name}.pop")
+
+def _build_columns(name, size=None, seed=42):
+    from faker import Faker  # нужен только при сборке, генераторы его не загружают
+
+    spec = POPULATIONS[name]
+    Faker.seed(seed)
+    fake = Faker('ru_RU')
+    rng = random.Random(seed)
+    return spec['build'](fake, rng, size or spec['size'])
+
+def build(name, directory=None, size=None, seed=42):
+    """Собирает популяцию через Faker и записывает снимок; возвращает путь"""
+    path = snapshot_path(name, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_snapshot(path, _build_columns(name, size, seed), POPULATIONS[name]['version'])
+    return path
+
+def build_in_memory(name, size=None, seed=42):
+    """Собирает снимок в памяти, без файла (каталог недоступен на запись)"""
+    buffer = io.BytesIO()
+    _write_columns(buffer, _build_columns(name, size, seed), POPULATIONS[name]['version'])
+    return buffer.getvalue()
+
+# Открытые снимки процесса: генераторы в одном процессе (common.runner) делят один mmap
+_opened = {}
+
+def load(name, directory=None):
+    """
+    Открывает снимок популяции. Если снимка нет (локальный запуск без сборки образа),
+    он старой версии или не читается - собирает его один раз. Если каталог недоступен
+    на запись (read-only том, нет прав), снимок собирается в памяти процесса.
+    """
+    path = snapshot_path(name, directory)
+    if path in _opened:
+        return _opened[path]
+    version = POPULATIONS[name]['version']
+    try:
+        snapshot = Snapshot(path, version)
+    except (OSError, ValueError, struct.error) as e:
+        print(f"⚠️ Population {name}: {e}; building snapshot", file=sys.stderr)
+        try:
+            snapshot = Snapshot(build(name, directory), version)
+        except OSError as e:
+            print(f"⚠️ Population {name}: {e}; keeping snapshot in memory", file=sys.stderr)
+            snapshot = Snapshot(path, version, data=build_in_memory(name))
+    _opened[path] = snapshot
+    return snapshot
+
+def main():
+    parser = argparse.ArgumentParser(description='Population snapshots')
+    parser.add_argument('--dir', default=DEFAULT_DIR)
+    sub = parser.add_subparsers(dest='command', required=True)
+    build_cmd = sub.add_parser('build', help='собрать снимки популяций')
+    build_cmd.add_argument('names', nargs='*', default=list(POPULATIONS))
+    build_cmd.add_argument('--size', action='append', default=[], metavar='NAME=N',
+                           help='размер популяции, например --size accounts=1000000')
+    build_cmd.add_argument('--seed', type=int, default=42)
+    info = sub.add_parser('info', help='показать заголовки снимков и первые строки')
+    info.add_argument('names', nargs='*', default=list(POPULATIONS))
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        sizes = {name: int(n) for name, n in (item.split('=', 1) for item in args.size)}
+        for name in args.names:
+            started = time.perf_counter()
+            path = build(name, args.dir, sizes.get(name), args.seed)
+            print(f"✅ {name}: {path} ({os.path.getsize(path) / 1024:,.0f} KB, "
+                  f"{time.perf_counter() - started:.1f}s)")
+        return
+
+    for name in args.names:
+        started = time.perf_counter()
+        snapshot = Snapshot(snapshot_path(name, args.dir))
+        opened_ms = (time.perf_counter() - started) * 1000
+        print(f"📦 {name}: {len(snapshot)} rows, v{snapshot.version}, "
+              f"columns {list(snapshot.columns)}, opened in {opened_ms:.2f} ms")
+        if len(snapshot):
+            print(f"   {snapshot[0]}")
+
+if __name__ == "__main__":
+    main()
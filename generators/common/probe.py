@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Ingest Lag Probe
+Генераторы с фиксированной частотой пишут канареечные события с номером
+и временем отправки в наносекундах; checker ищет их в Elasticsearch
+(или в файлах логов как локальной заглушке) и считает задержку
+доставки p50/p95/p99/max и потери.
+
+Запуск из каталога generators: python -m common.probe check --source es
+"""
+
+import argparse
+import glob
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+import requests
+
+CANARY_EVENT_TYPE = 'canary'
+
+# Через сколько секунд пропущенный номер считается потерянным
+LOSS_TIMEOUT = 120.0
+
+# Сколько интервалов канареек без новых находок до признания доставки остановленной
+STALL_INTERVALS = 10
+
+class CanaryEmitter:
+    """Фоновый поток: раз в 1/rate секунд пишет канарейку через json logger сервиса"""
+
+    def __init__(self, service, logger, rate):
+        self.service = service
+        self.logger = logger
+        self.rate = rate
+        self.run_id = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self._stop = threading.Event()
+
+    def start(self):
+        if self.rate <= 0:
+            return
+        threading.Thread(target=self._run, name=f"{self.service}-canary", daemon=True).start()
+
+    def _run(self):
+        interval = 1.0 / self.rate
+        next_emit = time.monotonic()
+        while not self._stop.is_set():
+            self.emit()
+            # Фиксированная сетка времени, без накопления дрейфа
+            next_emit += interval
+            self._stop.wait(max(0.0, next_emit - time.monotonic()))
+
+    def emit(self):
+        self.seq += 1
+        event = {
+            'timestamp': datetime.now().isoformat(),
+            'service': self.service,
+            'event_type': CANARY_EVENT_TYPE,
+            'level': 'INFO',
+            'canary_run': self.run_id,
+            'canary_seq': self.seq,
+            'canary_emitted_ns': time.time_ns(),
+        }
+        self.logger.info("Ingest lag probe", extra=event)
+
+    def stop(self):
+        self._stop.set()
+
+def canary_from_env(service, logger):
+    """Эмиттер с частотой CANARY_RATE событий/сек (0 - выключено)"""
+    return CanaryEmitter(service, logger, float(os.getenv('CANARY_RATE', '0.2')))
+
+# ---------- источники ----------
+
+class ElasticsearchCanarySource:
+    """Ищет в banking-logs-* канарейки, отправленные за последние LOSS_TIMEOUT секунд"""
+
+    def __init__(self, url, index='banking-logs-*', batch=10000):
+        self.url = url.rstrip('/')
+        self.index = index
+        self.batch = batch
+        self.session = requests.Session()
+
+    def poll(self):
+        # Окно поиска равно таймауту потери: опоздавшие канарейки тоже будут найдены,
+        # повторно увиденные отсекает checker
+        since_ns = time.time_ns() - int(LOSS_TIMEOUT * 1e9)
+        query = {
+            'size': self.batch,
+            '_source': ['service', 'canary_run', 'canary_seq', 'canary_emitted_ns'],
+            'sort': [{'canary_emitted_ns': {'order': 'desc', 'unmapped_type': 'long'}}],
+            'query': {'bool': {'filter': [
+                {'term': {'event_type': CANARY_EVENT_TYPE}},
+                {'range': {'canary_emitted_ns': {'gte': since_ns}}},
+            ]}},
+        }
+        response = self.session.post(f"{self.url}/{self.index}/_search", json=query, timeout=10)
+        hits = [hit['_source'] for hit in response.json().get('hits', {}).get('hits', [])]
+        return sorted(hits, key=lambda hit: hit['canary_emitted_ns'])
+
+class FileCanarySource:
+    """Локальная заглушка: читает канарейки из хвостов *.json файлов генераторов"""
+
+    def __init__(self, pattern='/app/logs/*.json'):
+        self.pattern = pattern
+        self._offsets = {}
+
+    def poll(self):
+        hits = []
+        for path in glob.glob(self.pattern):
+            with open(path, 'rb') as f:
+                f.seek(self._offsets.get(path, 0))
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    self._offsets[path] = f.tell()
+                    if b'"canary_seq"' in line:
+                        hits.append(json.loads(line))
+        return hits
+
+# ---------- checker ----------
+
+def percentile(sorted_values, q):
+    """Перцентиль по методу ближайшего ранга"""
+    if not sorted_values:
+        return None
+    rank = math.ceil(q / 100 * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+class LagChecker:
+    """
+    Опрашивает источник, считает задержку (время обнаружения - время отправки)
+    и потери по пропускам в номерах. on_lag(service, seconds) и
+    on_lost(service, count) позволяют выгружать результаты в метрики.
+    Пропуски видны только по следующим номерам, поэтому полную остановку доставки
+    ловит stall_after: если последняя найденная канарейка сервиса отправлена
+    раньше, задержка в отчете - время с ее отправки, а сервис помечен stalled.
+    poll_once и report можно звать из разных потоков.
+    """
+
+    def __init__(self, source, window=300.0, on_lag=None, on_lost=None, stall_after=None):
+        self.source = source
+        self.window = window
+        self.on_lag = on_lag
+        self.on_lost = on_lost
+        self.stall_after = stall_after
+        self._lock = threading.Lock()
+        self._samples = {}    # service -> deque[(время обнаружения, задержка)]
+        self._seen = {}       # (service, run) -> максимальный номер
+        self._missing = {}    # (service, run, seq) -> с какого момента не найден
+        self._last_emit = {}  # service -> время отправки последней найденной канарейки
+        self.received = {}
+        self.lost = {}
+
+    def poll_once(self):
+        hits = self.source.poll()  # сетевой запрос - без блокировки
+        now = time.time()
+        with self._lock:
+            for hit in hits:
+                self._observe(hit, now)
+            self._expire_missing(now)
+
+    def _observe(self, hit, now):
+        service = hit['service']
+        key = (service, hit['canary_run'])
+        seq = hit['canary_seq']
+
+        if (service, key[1], seq) in self._missing:
+            del self._missing[(service, key[1], seq)]
+        elif seq <= self._seen.get(key, 0):
+            return  # уже учтена
+        else:
+            for gap in range(self._seen.get(key, 0) + 1, seq):
+                self._missing[(service, key[1], gap)] = now
+            self._seen[key] = seq
+
+        emitted = hit['canary_emitted_ns'] / 1e9
+        self._last_emit[service] = max(self._last_emit.get(service, 0.0), emitted)
+        lag = now - emitted
+        self._samples.setdefault(service, deque()).append((now, lag))
+        self.received[service] = self.received.get(service, 0) + 1
+        if self.on_lag:
+            self.on_lag(service, lag)
+
+    def _expire_missing(self, now):
+        for key, since in list(self._missing.items()):
+            if now - since >= LOSS_TIMEOUT:
+                del self._missing[key]
+                self.lost[key[0]] = self.lost.get(key[0], 0) + 1
+                if self.on_lost:
+                    self.on_lost(key[0], 1)
+        for samples in self._samples.values():
+            while samples and now - samples[0][0] > self.window:
+                samples.popleft()
+
+    def report(self):
+        """{service: {p50, p95, p99, max, count, received, lost, stalled}} за окно"""
+        now = time.time()
+        result = {}
+        with self._lock:
+            for service in sorted(set(self._samples) | set(self.lost) | set(self._last_emit)):
+                lags = sorted(lag for _, lag in self._samples.get(service, ()))
+                r = {
+                    'p50': percentile(lags, 50),
+                    'p95': percentile(lags, 95),
+                    'p99': percentile(lags, 99),
+                    'max': lags[-1] if lags else None,
+                    'count': len(lags),
+                    'received': self.received.get(service, 0),
+                    'lost': self.lost.get(service, 0),
+                    'stalled': False,
+                }
+                age = now - self._last_emit[service] if service in self._last_emit else None
+                if self.stall_after and age is not None and age > self.stall_after:
+                    # Новых канареек нет: задержка не меньше, чем прошло с отправки последней
+                    r.update(stalled=True, **{k: max(r[k] or 0.0, age) for k in ('p50', 'p95', 'p99', 'max')})
+                result[service] = r
+        return result
+
+    def run(self, interval=1.0, stop=None):
+        """Цикл опроса; stop - threading.Event для остановки"""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            try:
+                self.poll_once()
+            except (requests.RequestException, ValueError, OSError) as e:
+                print(f"⚠️ Lag probe poll failed: {e}")
+            stop.wait(interval)
+
+def stall_after_from_env():
+    """STALL_INTERVALS интервалов канареек (CANARY_RATE); None, если канарейки выключены"""
+    rate = float(os.getenv('CANARY_RATE', '0.2'))
+    return STALL_INTERVALS / rate if rate > 0 else None
+
+def source_from_env():
+    """INGEST_PROBE_SOURCE: es (по умолчанию) или file"""
+    if os.getenv('INGEST_PROBE_SOURCE', 'es') == 'file':
+        return FileCanarySource(os.getenv('INGEST_PROBE_FILES', '/app/logs/*.json'))
+    return ElasticsearchCanarySource(os.getenv('ELASTICSEARCH_URL', 'http://elasticsearch:9200'))
+
+def format_report(report):
+    lines = [f"{'service':<22}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}{'recv':>7}{'lost':>6}"]
+    for service, r in report.items():
+        values = ''.join(f"{r[k]:>8.2f}" if r[k] is not None else f"{'-':>8}"
+                         for k in ('p50', 'p95', 'p99', 'max'))
+        stalled = '  STALLED' if r['stalled'] else ''
+        lines.append(f"{service:<22}{values}{r['received']:>7}{r['lost']:>6}{stalled}")
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest lag probe')
+    sub = parser.add_subparsers(dest='command', required=True)
+    check = sub.add_parser('check', help='следить за канарейками и печатать отчет')
+    check.add_argument('--source', choices=['es', 'file'], default='es')
+    check.add_argument('--es', default=os.getenv('ELASTICSEARCH_URL', 'http://elasticsearch:9200'))
+    check.add_argument('--files', default='/app/logs/*.json')
+    check.add_argument('--interval', type=float, default=0.5, help='период опроса, сек')
+    check.add_argument('--report-every', type=float, default=10.0)
+    check.add_argument('--duration', type=float, default=0, help='0 - до Ctrl+C')
+    check.add_argument('--stall-after', type=float, default=stall_after_from_env(),
+                       help='секунд без новых канареек до пометки stalled')
+    args = parser.parse_args()
+
+    source = (FileCanarySource(args.files) if args.source == 'file'
+              else ElasticsearchCanarySource(args.es))
+    checker = LagChecker(source, stall_after=args.stall_after)
+    started = last_report = time.monotonic()
+    try:
+        while not args.duration or time.monotonic() - started < args.duration:
+            try:
+                checker.poll_once()
+            except (requests.RequestException, ValueError, OSError) as e:
+                print(f"⚠️ Poll failed: {e}")
+            time.sleep(args.interval)
+            if time.monotonic() - last_report >= args.report_every:
+                print(format_report(checker.report()) + '\n')
+                last_report = time.monotonic()
+    except KeyboardInterrupt:
+        pass
+    print(format_report(checker.report()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Profiling Hooks
+Профилирование работающего генератора без перезапуска. Пока сессия не
+запущена, не работает ничего, кроме обработчиков сигналов.
+
+  SIGUSR1 - начать/закончить сессию профилирования (сама закончится через PROFILE_SECONDS)
+  SIGUSR2 - снимок tracemalloc и разница с предыдущим (первый сигнал включает трассировку)
+
+Что входит в сессию, задает PROFILE_MODES (через запятую):
+  cprofile    - cProfile главного потока и вызовов, обернутых в profiled() (циклы сервисов
+                в потоках common.runner) -> .pstats и .txt с топом по cumulative
+  sample      - выборка стеков всех потоков раз в PROFILE_SAMPLE_INTERVAL секунд ->
+                .collapsed (формат flamegraph.pl / speedscope)
+  tracemalloc - снимки памяти в начале и конце сессии -> .txt с топом прироста
+PROFILE_ON_START=1 запускает сессию сразу при старте. Результаты - в PROFILE_DIR
+(/app/logs/profiles), имена <сервис>-<время>.<вид>.
+
+Из контейнера: docker kill -s USR1 payment-service-logs
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import signal
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+PROFILE_MODES = ('cprofile', 'sample', 'tracemalloc')
+
+class Profiler:
+    """Сессии профилирования одного процесса; start/stop вызываются из главного потока"""
+
+    def __init__(self, name, directory='/app/logs/profiles', modes=('cprofile', 'sample'),
+                 seconds=60.0, sample_interval=0.01, trace_frames=10, top=30):
+        for mode in modes:
+            if mode not in PROFILE_MODES:
+                raise ValueError(f"Unknown profile mode: {mode}")
+        self.name = name
+        self.directory = directory
+        self.modes = modes
+        self.seconds = seconds
+        self.sample_interval = sample_interval
+        self.trace_frames = trace_frames
+        self.top = top
+
+        self.active = False
+        self._started = None
+        self._timer = None
+        self._profile = None
+        # Профили вызовов из других потоков (profiled), слитые за текущую сессию
+        self._lock = threading.Lock()
+        self._session = 0
+        self._worker_stats = None
+        self._sampler = None
+        self._sampler_stop = None
+        self._stacks = None
+        self._trace_start = None
+        self._last_snapshot = None
+
+    # ---------- сессия ----------
+
+    def toggle(self, *_):
+        if self.active:
+            self.stop()
+        else:
+            self.start()
+
+    def start(self):
+        if self.active:
+            return
+        self.active = True
+        self._started = datetime.now()
+        if 'tracemalloc' in self.modes:
+            self._trace_start = self._take_snapshot()
+        if 'sample' in self.modes:
+            self._stacks = Counter()
+            self._sampler_stop = threading.Event()
+            self._sampler = threading.Thread(target=self._sample, name=f"{self.name}-sampler", daemon=True)
+            self._sampler.start()
+        if 'cprofile' in self.modes:
+            with self._lock:
+                self._session += 1
+                self._worker_stats = pstats.Stats()
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        if self.seconds > 0 and hasattr(signal, 'SIGUSR1'):
+            # cProfile отключается только из профилируемого потока: таймер шлет сигнал процессу
+            self._timer = threading.Timer(self.seconds, os.kill, (os.getpid(), signal.SIGUSR1))
+            self._timer.daemon = True
+            self._timer.name = f"{self.name}-profile-timer"
+            self._timer.start()
+        print(f"🔬 Profiling {self.name} started ({', '.join(self.modes)}, {self.seconds:.0f}s)")
+
+    def stop(self):
+        if not self.active:
+            return
+        self.active = False
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._profile is not None:
+            self._profile.disable()
+        if self._sampler is not None:
+            self._sampler_stop.set()
+            self._sampler.join()
+
+        os.makedirs(self.directory, exist_ok=True)
+        prefix = os.path.join(self.directory, f"{self.name}-{self._started:%Y%m%d-%H%M%S}")
+        written = []
+        if self._profile is not None:
+            written += self._write_cprofile(prefix)
+            self._profile = None
+        if self._sampler is not None:
+            written.append(self._write_collapsed(prefix))
+            self._sampler = None
+        if self._trace_start is not None:
+            written.append(self._write_diff(f"{prefix}.tracemalloc.txt", self._trace_start,
+                                            self._take_snapshot()))
+            self._trace_start = None
+            if self._last_snapshot is None:
+                tracemalloc.stop()
+        print(f"🔬 Profiling {self.name} stopped: {', '.join(written)}")
+
+    # ---------- cProfile ----------
+
+    def profiled(self, func):
+        """
+        Обертка для func, которую вызывают из других потоков: cProfile включается только
+        в вызывающем потоке, поэтому пока идет сессия, каждый вызов профилируется своим
+        cProfile и сливается в отчет сессии. Вызов, начатый в одной сессии и законченный
+        после нее, в отчет не попадает
+        """
+        def call(*args, **kwargs):
+            with self._lock:
+                session = self._session if self._worker_stats is not None else None
+            if session is None:
+                return func(*args, **kwargs)
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.disable()
+                with self._lock:
+                    if self._worker_stats is not None and self._session == session:
+                        self._worker_stats.add(profile)
+        return call
+
+    def _write_cprofile(self, prefix):
+        report = io.StringIO()
+        stats = pstats.Stats(self._profile, stream=report)
+        with self._lock:
+            if self._worker_stats.stats:
+                stats.add(self._worker_stats)
+            self._worker_stats = None
+        stats.dump_stats(f"{prefix}.pstats")
+        stats.sort_stats('cumulative').print_stats(self.top)
+        with open(f"{prefix}.cprofile.txt", 'w', encoding='utf-8') as f:
+            f.write(report.getvalue())
+        return [f"{prefix}.pstats", f"{prefix}.cprofile.txt"]
+
+    # ---------- выборка стеков ----------
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._sampler_stop.wait(self.sample_interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if ident not in names:
+                    names.update((t.ident, t.name) for t in threading.enumerate())
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self._stacks[';'.join(reversed(stack))] += 1
+
+    def _write_collapsed(self, prefix):
+        path = f"{prefix}.collapsed"
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self._stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    # ---------- tracemalloc ----------
+
+    def _take_snapshot(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.trace_frames)
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+
+    def _write_diff(self, path, before, after):
+        lines = [f"Top {self.top} allocation changes, {self.name}, {datetime.now().isoformat()}"]
+        lines += [str(stat) for stat in after.compare_to(before, 'lineno')[:self.top]]
+        current, peak = tracemalloc.get_traced_memory()
+        lines.append(f"Traced memory: current {current / 2**20:.1f} MB, peak {peak / 2**20:.1f} MB")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        return path
+
+    def memory_snapshot(self, *_):
+        """SIGUSR2: первый вызов включает трассировку, следующие пишут разницу с предыдущим снимком"""
+        snapshot = self._take_snapshot()
+        if self._last_snapshot is None:
+            self._last_snapshot = snapshot
+            print(f"🔬 tracemalloc started for {self.name}, send SIGUSR2 again for a diff")
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._write_diff(
+            os.path.join(self.directory, f"{self.name}-{datetime.now():%Y%m%d-%H%M%S}.memdiff.txt"),
+            self._last_snapshot, snapshot)
+        self._last_snapshot = snapshot
+        print(f"🔬 Memory diff for {self.name}: {path}")
+
+    def install(self):
+        """Обработчики SIGUSR1/SIGUSR2; вызывать из главного потока"""
+        if not hasattr(signal, 'SIGUSR1'):
+            return self  # Windows: только PROFILE_ON_START
+        signal.signal(signal.SIGUSR1, self.toggle)
+        signal.signal(signal.SIGUSR2, self.memory_snapshot)
+        return self
+
+def install_profiling(name):
+    """Профилировщик с параметрами PROFILE_*; при PROFILE_ON_START=1 сессия стартует сразу"""
+    profiler = Profiler(
+        name,
+        directory=os.getenv('PROFILE_DIR', '/app/logs/profiles'),
+        modes=tuple(m.strip() for m in os.getenv('PROFILE_MODES', 'cprofile,sample').split(',') if m.strip()),
+        seconds=float(os.getenv('PROFILE_SECONDS', '60')),
+        sample_interval=float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.01')),
+    ).install()
+    if os.getenv('PROFILE_ON_START', '0') == '1':
+        profiler.start()
+    return profiler
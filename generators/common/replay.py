@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Banking Log Replay
+Повторное проигрывание сохраненных событий (*.json генераторов или
+продовые выгрузки той же схемы) в файл, Logstash по TCP или Elasticsearch _bulk.
+Исходные интервалы между событиями сохраняются (с ускорением --speed)
+или события идут с максимальной скоростью (--speed 0). Время событий
+подменяется на текущее прямо в байтах строки, без разбора JSON.
+
+Запуск из каталога generators: python -m common.replay /app/logs/*.json --sink es
+"""
+
+import argparse
+import glob
+import heapq
+import mmap
+import os
+import time
+from datetime import datetime
+
+import requests
+
+from common import schema
+from common.partition import MAX_LATENESS, TIMESTAMP_MARKER
+from common.routing import utc_timestamp
+
+ASCTIME_MARKER = b'"asctime": "'
+ROUTED_TIMESTAMP_MARKER = b'"@timestamp": "'
+SERVICE_MARKER = b'"service": "'
+
+# Окно отображения файла в память; строки на границе окна переотображаются
+MMAP_WINDOW = 64 * 1024 * 1024
+
+def _field_span(line, marker):
+    """(начало, конец) строкового значения поля в JSON строке или None"""
+    start = line.find(marker)
+    if start < 0:
+        return None
+    start += len(marker)
+    return start, line.index(b'"', start)
+
+def iter_lines(path, window=MMAP_WINDOW):
+    """Строки файла через скользящее mmap окно"""
+    size = os.path.getsize(path)
+    if size == 0:
+        return
+    granularity = mmap.ALLOCATIONGRANULARITY
+    window = max(window - window % granularity, granularity)
+    position = 0
+    with open(path, 'rb') as f:
+        while position < size:
+            base = position - position % granularity
+            length = min(window, size - base)
+            with mmap.mmap(f.fileno(), length, offset=base, access=mmap.ACCESS_READ) as mm:
+                local = position - base
+                while True:
+                    newline = mm.find(b'\n', local)
+                    if newline < 0:
+                        break
+                    if newline > local:
+                        yield mm[local:newline]
+                    local = newline + 1
+                consumed = base + local
+            if consumed == position:
+                if base + length >= size:
+                    # Хвост без перевода строки - недописанное событие, пропускаем
+                    return
+                # Строка длиннее окна - увеличиваем окно
+                window *= 2
+            position = consumed
+
+def iter_events(paths, start=None, end=None, lateness=MAX_LATENESS):
+    """
+    Строки всех файлов, слитые по timestamp; start/end - ISO строки или None.
+    Файл читается до события позже end больше чем на lateness: события,
+    записанные другим потоком с небольшим опозданием, в окно попадают
+    """
+    stop = (datetime.fromisoformat(end) + lateness).isoformat() if end else None
+
+    def keyed(path):
+        for line in iter_lines(path):
+            span = _field_span(line, TIMESTAMP_MARKER)
+            if span is None:
+                continue
+            timestamp = line[span[0]:span[1]].decode()
+            if start and timestamp < start:
+                continue
+            if end and timestamp >= end:
+                if timestamp >= stop:
+                    return
+                continue
+            yield timestamp, line
+    return heapq.merge(*(keyed(p) for p in paths), key=lambda item: item[0])
+
+def rewrite_timestamp(line, now):
+    """Подменяет timestamp, asctime и @timestamp (PRE_ROUTING, в UTC) на now, переставляя только байты"""
+    span = _field_span(line, TIMESTAMP_MARKER)
+    if span:
+        line = line[:span[0]] + now.isoformat(timespec='microseconds').encode() + line[span[1]:]
+    span = _field_span(line, ROUTED_TIMESTAMP_MARKER)
+    if span:
+        line = line[:span[0]] + utc_timestamp(now.isoformat()).encode() + line[span[1]:]
+    span = _field_span(line, ASCTIME_MARKER)
+    if span:
+        asctime = now.strftime('%Y-%m-%d %H:%M:%S') + f",{now.microsecond // 1000:03d}"
+        line = line[:span[0]] + asctime.encode() + line[span[1]:]
+    return line
+
+# ---------- приемники ----------
+
+class FileReplaySink:
+    def __init__(self, path):
+        self._file = open(path, 'ab')
+
+    def send(self, lines):
+        self._file.write(b'\n'.join(lines) + b'\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class TcpReplaySink:
+    def __init__(self, host, port):
+        from common.shipper import LumberjackOutput
+        self._output = LumberjackOutput(host, port, formatter=None)
+
+    def send(self, lines):
+        self._output.write_payloads(lines)
+
+    def close(self):
+        self._output.close()
+
+class BulkReplaySink:
+    """Elasticsearch _bulk в data streams banking-logs-<suffix>"""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.session = requests.Session()
+        self.errors = 0
+
+    def send(self, lines):
+        body = []
+        for line in lines:
+            span = _field_span(line, SERVICE_MARKER)
+            service = line[span[0]:span[1]].decode() if span else None
+            suffix = schema.INDEX_SUFFIXES.get(service, schema.DEFAULT_INDEX_SUFFIX)
+            body.append(b'{"create":{"_index":"banking-logs-%s"}}' % suffix.encode())
+            # Data stream требует @timestamp; в файлах его проставлял бы Logstash.
+            # Уже проставленный генератором (PRE_ROUTING) перезаписывается временем события
+            span = _field_span(line, TIMESTAMP_MARKER)
+            if span:
+                routed = utc_timestamp(line[span[0]:span[1]].decode()).encode()
+                routed_span = _field_span(line, ROUTED_TIMESTAMP_MARKER)
+                if routed_span:
+                    line = line[:routed_span[0]] + routed + line[routed_span[1]:]
+                else:
+                    line = b'{"@timestamp": "' + routed + b'", ' + line[1:]
+            body.append(line)
+        response = self.session.post(
+            f"{self.url}/_bulk",
+            data=b'\n'.join(body) + b'\n',
+            headers={'Content-Type': 'application/x-ndjson'},
+            timeout=60
+        )
+        result = response.json()
+        if result.get('errors'):
+            failed = [i for i in result['items'] if i['create'].get('error')]
+            self.errors += len(failed)
+            print(f"⚠️ Bulk: {len(failed)} failed, first: {failed[0]['create']['error']}")
+
+    def close(self):
+        self.session.close()
+
+def replay(paths, sink, speed=1.0, batch_size=500, start=None, end=None, rewrite=True):
+    """
+    Проигрывает события в sink. speed=1 - исходный темп, 10 - в 10 раз быстрее,
+    0 - без пауз. Возвращает (число событий, секунды)
+    """
+    started = time.monotonic()
+    first_event = None
+    batch = []
+    count = 0
+    max_lag = 0.0
+
+    for timestamp, line in iter_events(paths, start, end):
+        if speed > 0:
+            event_time = datetime.fromisoformat(timestamp)
+            if first_event is None:
+                first_event = event_time
+            due = started + (event_time - first_event).total_seconds() / speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                # Перед паузой отдаем накопленное, чтобы не копить задержку
+                if batch:
+                    sink.send(batch)
+                    batch = []
+                time.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+
+        batch.append(rewrite_timestamp(line, datetime.now()) if rewrite else line)
+        count += 1
+        if len(batch) >= batch_size:
+            sink.send(batch)
+            batch = []
+            if count % (batch_size * 20) == 0:
+                elapsed = time.monotonic() - started
+                print(f"📊 Replayed {count} events ({count / elapsed:,.0f} events/s, "
+                      f"max lag {max_lag:.2f}s)")
+
+    if batch:
+        sink.send(batch)
+    return count, time.monotonic() - started
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay banking events')
+    parser.add_argument('paths', nargs='*', default=['/app/logs/*.json'],
+                        help='файлы или glob шаблоны (по умолчанию /app/logs/*.json)')
+    parser.add_argument('--sink', choices=['file', 'tcp', 'es'], default='file')
+    parser.add_argument('--output', default='/app/logs/replay/replay.json',
+                        help='файл для --sink file')
+    parser.add_argument('--logstash', default=f"{os.getenv('LOGSTASH_HOST', 'logstash')}:"
+                                              f"{os.getenv('LOGSTASH_PORT', '5044')}")
+    parser.add_argument('--es', default=os.getenv('ELASTICSEARCH_URL', 'http://elasticsearch:9200'))
+    parser.add_argument('--speed', type=float, default=1.0, help='ускорение, 0 = максимально быстро')
+    parser.add_argument('--from', dest='start', help='начало окна, например 2026-10-16T14:00')
+    parser.add_argument('--to', dest='end', help='конец окна')
+    parser.add_argument('--batch', type=int, default=500)
+    parser.add_argument('--keep-timestamps', action='store_true', help='не подменять время на текущее')
+    args = parser.parse_args()
+
+    paths = sorted({p for pattern in args.paths for p in glob.glob(pattern)})
+    if not paths:
+        print(f"❌ No input files for {args.paths}")
+        return
+    start = datetime.fromisoformat(args.start).isoformat() if args.start else None
+    end = datetime.fromisoformat(args.end).isoformat() if args.end else None
+
+    if args.sink == 'file':
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        sink = FileReplaySink(args.output)
+    elif args.sink == 'tcp':
+        host, port = args.logstash.rsplit(':', 1)
+        sink = TcpReplaySink(host, int(port))
+    else:
+        sink = BulkReplaySink(args.es)
+
+    print(f"⏪ Replaying {len(paths)} files to {args.sink} at speed {args.speed or 'max'}")
+    try:
+        count, elapsed = replay(paths, sink, args.speed, args.batch, start, end,
+                                rewrite=not args.keep_timestamps)
+        print(f"✅ Replayed {count} events in {elapsed:.1f}s ({count / max(elapsed, 1e-9):,.0f} events/s)")
+    except KeyboardInterrupt:
+        print("\n⏹️ Replay stopped")
+    finally:
+        sink.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Delay Queue
+Очередь отложенных событий для имитации повторов: элемент становится
+доступен в момент due. Размер очереди ограничен, лишние повторы отбрасываются.
+"""
+
+import heapq
+import itertools
+import random
+
+def backoff_delay(attempt, base=1.0, cap=60.0, rng=random):
+    """Экспоненциальный backoff с полным jitter: uniform(0, min(cap, base * 2^attempt))"""
+    return rng.uniform(0, min(cap, base * 2 ** attempt))
+
+class DelayQueue:
+    """Min-heap по времени готовности; порядковый номер разрешает равные due"""
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.dropped = 0
+        self._heap = []
+        self._seq = itertools.count()
+
+    def push(self, due, item):
+        if len(self._heap) >= self.capacity:
+            self.dropped += 1
+            return False
+        heapq.heappush(self._heap, (due, next(self._seq), item))
+        return True
+
+    def pop_due(self, now):
+        """Все элементы с due <= now в порядке готовности"""
+        ready = []
+        while self._heap and self._heap[0][0] <= now:
+            ready.append(heapq.heappop(self._heap)[2])
+        return ready
+
+    def next_due(self):
+        return self._heap[0][0] if self._heap else None
+
+    def __len__(self):
+        return len(self._heap)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Generator-Side Pre-Routing
+Поля, которые раньше вычислял Logstash цепочками if/mutate, проставляются
+прямо в генераторе: index_suffix, tags, @timestamp (UTC) и log_format.
+Облегченный pipeline (logstash/pipeline-slim) доверяет этим полям.
+"""
+
+import logging
+import os
+from datetime import datetime, timezone
+
+from common import schema
+
+# Теги по сервису: (тег, условие над полями события) - те же правила, что в banking.conf
+TAG_RULES = {
+    'payment-service': [
+        ('suspicious_amount', lambda event: (event.get('amount') or 0) > 500000),
+        ('night_transaction', lambda event: bool(event.get('night_transaction'))),
+    ],
+    'fraud-service': [
+        ('security_alert', lambda event: True),
+        ('high_risk', lambda event: (event.get('risk_score') or 0) > 80),
+    ],
+}
+
+def utc_timestamp(timestamp):
+    """Локальное ISO время события -> '2026-10-16T11:00:00.123Z', как date фильтр Logstash"""
+    moment = datetime.fromisoformat(timestamp).astimezone(timezone.utc)
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+def routing_fields(event):
+    """Поля маршрутизации для события (dict или __dict__ записи лога)"""
+    service = event.get('service')
+    tags = list(event.get('tags') or ())
+    for tag, matches in TAG_RULES.get(service, ()):
+        if matches(event) and tag not in tags:
+            tags.append(tag)
+
+    fields = {
+        'index_suffix': schema.INDEX_SUFFIXES.get(service, schema.DEFAULT_INDEX_SUFFIX),
+        'log_format': 'json',
+    }
+    if tags:
+        fields['tags'] = tags
+    timestamp = event.get('timestamp')
+    if isinstance(timestamp, str):
+        fields['@timestamp'] = utc_timestamp(timestamp)
+    return fields
+
+class PreRoutingFilter(logging.Filter):
+    """Фильтр json logger'а: дописывает поля маршрутизации в каждую запись, включая канарейки"""
+
+    def filter(self, record):
+        record.__dict__.update(routing_fields(record.__dict__))
+        return True
+
+def pre_routing_from_env(logger):
+    """Включает предварительную маршрутизацию, если PRE_ROUTING=1 (по умолчанию)"""
+    if os.getenv('PRE_ROUTING', '1') == '1':
+        logger.addFilter(PreRoutingFilter())
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Single-process Runner
+Все генераторы и exporter метрик в одном процессе: цикл каждого сервиса -
+задача asyncio, пауза между циклами - await asyncio.sleep. Сам цикл идет
+в потоке пула: при SINK_POLICY=block put() ждет место в очереди и не должен
+останавливать event loop (остальные сервисы, канарейки, /metrics). Темп, файлы и
+логгеры сервисов те же, что у отдельных контейнеров. Снимки популяций,
+alias таблицы и sink с потоком-писателем общие, /metrics отдается с того
+же event loop.
+
+Запуск из каталога generators: python -m common.runner
+Только часть сервисов: --services auth-service,payment-service (или RUNNER_SERVICES)
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from common.profiling import install_profiling
+from common.sink import exit_on_sigterm, share_sink
+
+# Сервис -> файл генератора относительно каталога generators
+SERVICES = {
+    'auth-service': 'auth-service/auth_generator.py',
+    'payment-service': 'payment-service/payment_generator.py',
+    'fraud-service': 'fraud-service/fraud_generator.py',
+    'notification-service': 'notification-service/notification_generator.py',
+    'metrics-exporter': 'metrics-exporter/metrics_exporter.py',
+}
+
+# Пауза перед перезапуском упавшего сервиса, удваивается до максимума
+RESTART_DELAY = 1.0
+RESTART_DELAY_MAX = 60.0
+
+GENERATORS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_service(name):
+    """Импортирует модуль сервиса по пути: каталоги сервисов - не пакеты"""
+    path = os.path.join(GENERATORS_DIR, SERVICES[name])
+    module_name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+async def run_service(name, run_cycle):
+    """
+    run_cycle() пишет события цикла и возвращает паузу до следующего.
+    Ошибка цикла не останавливает остальные сервисы: сервис перезапускается
+    после паузы, пауза растет до RESTART_DELAY_MAX, пока циклы падают подряд.
+    """
+    delay = RESTART_DELAY
+    while True:
+        try:
+            pause = await asyncio.to_thread(run_cycle)
+        except Exception as e:
+            print(f"❌ {name}: {type(e).__name__}: {e}; restarting in {delay:.0f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RESTART_DELAY_MAX)
+            continue
+        delay = RESTART_DELAY
+        await asyncio.sleep(pause)
+
+async def run_canary(canary, emit):
+    """Канарейки сервиса на общем цикле вместо отдельного потока, та же сетка времени"""
+    if canary.rate <= 0:
+        return
+    loop = asyncio.get_running_loop()
+    interval = 1.0 / canary.rate
+    next_emit = loop.time()
+    while True:
+        try:
+            await asyncio.to_thread(emit)
+        except Exception as e:
+            print(f"⚠️ Canary {canary.service}: {type(e).__name__}: {e}")
+        next_emit += interval
+        await asyncio.sleep(max(0.0, next_emit - loop.time()))
+
+async def run_ingest_probe(checker, interval):
+    """Опрос канареек: блокирующий запрос к Elasticsearch уходит в поток пула"""
+    while True:
+        try:
+            await asyncio.to_thread(checker.poll_once)
+        except (requests.RequestException, ValueError, OSError) as e:
+            print(f"⚠️ Lag probe poll failed: {e}")
+        await asyncio.sleep(interval)
+
+async def serve_metrics(reader, writer):
+    """Ответ с метриками реестра prometheus_client на любой путь, как у start_http_server"""
+    from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+    try:
+        await reader.readline()
+        while await reader.readline() not in (b'\r\n', b'\n', b''):
+            pass  # заголовки запроса не нужны
+        body = generate_latest()
+        writer.write(f"HTTP/1.1 200 OK\r\nContent-Type: {CONTENT_TYPE_LATEST}\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def run(modules, port, profiler):
+    # cProfile сессии видит только свой поток: вызовы в потоках пула профилируются через profiled
+    tasks = []
+    for name, module in modules.items():
+        tasks.append(run_service(name, profiler.profiled(module.run_cycle)))
+        if hasattr(module, 'canary'):
+            tasks.append(run_canary(module.canary, profiler.profiled(module.canary.emit)))
+
+    exporter = modules.get('metrics-exporter')
+    if exporter:
+        await asyncio.start_server(serve_metrics, port=port)
+        print(f"🔗 Metrics available at: http://localhost:{port}/metrics")
+        exporter.checker = exporter.ingest_checker_from_env()
+        if exporter.checker:
+            interval = float(os.getenv('INGEST_PROBE_INTERVAL', '1'))
+            tasks.append(run_ingest_probe(exporter.checker, interval))
+            print(f"🐤 Ingest lag probe started ({type(exporter.checker.source).__name__})")
+
+    # Свой пул: у каждой задачи свой поток, циклы не ждут друг друга в очереди пула
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix='runner'))
+    await asyncio.gather(*tasks)
+
+def main():
+    parser = argparse.ArgumentParser(description='Run all generators in one process')
+    parser.add_argument('--services', default=os.getenv('RUNNER_SERVICES', ','.join(SERVICES)),
+                        help='сервисы через запятую')
+    parser.add_argument('--port', type=int, default=int(os.getenv('METRICS_PORT', '8080')))
+    args = parser.parse_args()
+    names = [name.strip() for name in args.services.split(',') if name.strip()]
+    for name in names:
+        if name not in SERVICES:
+            parser.error(f"unknown service {name}, expected one of {', '.join(SERVICES)}")
+
+    print("🏦 Starting Banking generators in one process...")
+    # Sink создается до импорта генераторов: их sink_from_env вернет его же
+    sink = share_sink('generators')
+    started = time.perf_counter()
+    modules = {name: load_service(name) for name in names}
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"📦 Loaded {', '.join(modules)} in {time.perf_counter() - started:.1f}s, RSS {rss_mb:.0f} MB")
+
+    # Один профилировщик на процесс: сессия видит циклы всех сервисов (cProfile - через profiled)
+    profiler = install_profiling('generators')
+    # docker stop: asyncio.run отменяет задачи, atexit дописывает очередь общего sink'а
+    exit_on_sigterm()
+    try:
+        asyncio.run(run(modules, args.port, profiler))
+    except KeyboardInterrupt:
+        totals = ', '.join(f"{name} {module.event_count}" for name, module in modules.items()
+                           if hasattr(module, 'event_count'))
+        print(f"\n✅ Generators stopped. Total events: {totals} ({sink.describe()})")
+    except Exception as e:
+        print(f"❌ Error in generators runner: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Skewed Sampling
+Выбор сущностей с перекосом, как в реальном трафике: несколько счетов и
+торговцев дают большую часть операций. Распределения сводятся к alias
+таблицам (метод Воза), поэтому выбор - O(1) при любом числе сущностей.
+
+Распределение задается строкой:
+  uniform            - равномерно
+  zipf:1.1           - Zipf с показателем 1.1
+  hot:0.01:0.8       - 1% сущностей получает 80% выборов
+Горячее множество меняется каждые SKEW_ROTATE_SECONDS секунд (0 - никогда).
+
+Проверка из каталога generators: python -m common.sampling --n 1000000 --spec zipf:1.1
+"""
+
+import argparse
+import array
+import os
+import random
+import time
+import zlib
+from collections import Counter
+
+# Таблицы от стольких сущностей кешируются на диск: построение на 10M занимает секунды
+CACHE_MIN_SIZE = 100000
+CACHE_DIR = os.getenv('SKEW_CACHE_DIR', os.getenv('POPULATION_DIR', '/app/data/populations'))
+
+# Таблицы процесса по (n, spec): picker'ы одной популяции в разных генераторах делят таблицу
+_tables = {}
+
+class AliasTable:
+    """Дискретное распределение по весам: построение O(n), выбор O(1)"""
+
+    def __init__(self, weights=None):
+        if weights is None:
+            return  # заполняется в load()
+        n = len(weights)
+        if n == 0:
+            raise ValueError("AliasTable needs at least one weight")
+        total = float(sum(weights))
+        scaled = array.array('d', (w * n / total for w in weights))
+        self.n = n
+        self.prob = array.array('d', bytes(8 * n))
+        self.alias = array.array('I', bytes(4 * n))
+
+        small = [i for i in range(n) if scaled[i] < 1.0]
+        large = [i for i in range(n) if scaled[i] >= 1.0]
+        while small and large:
+            s = small.pop()
+            g = large[-1]
+            self.prob[s] = scaled[s]
+            self.alias[s] = g
+            scaled[g] -= 1.0 - scaled[s]
+            if scaled[g] < 1.0:
+                small.append(large.pop())
+        # Остатки из-за погрешности округления - полные корзины
+        for i in large + small:
+            self.prob[i] = 1.0
+            self.alias[i] = i
+
+    def save(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            array.array('Q', [self.n]).tofile(f)
+            self.prob.tofile(f)
+            self.alias.tofile(f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        table = cls()
+        with open(path, 'rb') as f:
+            header = array.array('Q')
+            header.fromfile(f, 1)
+            table.n = header[0]
+            table.prob = array.array('d')
+            table.prob.fromfile(f, table.n)
+            table.alias = array.array('I')
+            table.alias.fromfile(f, table.n)
+        return table
+
+    def sample(self, rng=random):
+        i = int(rng.random() * self.n)
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+def zipf_weights(n, exponent):
+    """Вес ранга k (с 1) пропорционален 1 / k^exponent"""
+    return [1.0 / (k ** exponent) for k in range(1, n + 1)]
+
+def hot_set_weights(n, hot_fraction, hot_share):
+    """Первые hot_fraction * n рангов делят hot_share выборов, остальные - остаток"""
+    hot = min(n, max(1, int(n * hot_fraction)))
+    if hot == n:
+        return [1.0] * n
+    return [hot_share / hot] * hot + [(1.0 - hot_share) / (n - hot)] * (n - hot)
+
+def weights_from_spec(n, spec):
+    kind, *params = spec.split(':')
+    if kind == 'uniform':
+        return None
+    if kind == 'zipf':
+        return zipf_weights(n, float(params[0]) if params else 1.1)
+    if kind == 'hot':
+        return hot_set_weights(n, float(params[0]) if params else 0.01,
+                               float(params[1]) if len(params) > 1 else 0.8)
+    raise ValueError(f"Unknown skew spec: {spec}")
+
+def alias_table_for(n, spec):
+    """Alias таблица для n рангов; большие берутся из кеша или сохраняются в него"""
+    if (n, spec) not in _tables:
+        _tables[n, spec] = _build_alias_table(n, spec)
+    return _tables[n, spec]
+
+def _build_alias_table(n, spec):
+    if n < CACHE_MIN_SIZE:
+        return AliasTable(weights_from_spec(n, spec))
+    path = os.path.join(CACHE_DIR, f"alias-{spec.replace(':', '_')}-{n}.bin")
+    try:
+        return AliasTable.load(path)
+    except (OSError, EOFError):
+        table = AliasTable(weights_from_spec(n, spec))
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            table.save(path)
+        except OSError as e:
+            print(f"⚠️ Alias table cache {path} not saved: {e}")
+        return table
+
+def _coprime_stride(n, seed):
+    """
+    Шаг перестановки рангов: взаимно прост с n, чтобы (rank * stride) % n был биекцией.
+    Около n / золотое сечение - соседние ранги оказываются далеко друг от друга.
+    """
+    stride = int(n * 0.6180339887) + seed % 97
+    while _gcd(stride, n) != 1:
+        stride += 1
+    return stride
+
+def _gcd(a, b):
+    while b:
+        a, b = b, a % b
+    return a
+
+class SkewedPicker:
+    """
+    Выбирает элемент последовательности (список, снимок популяции) по рангу из
+    alias таблицы. Ранг -> индекс через перестановку (rank * stride + offset) % n:
+    горячие сущности разбросаны по id, а offset меняется с эпохой ротации.
+    Одинаковые name и spec дают одинаковое горячее множество во всех сервисах.
+    """
+
+    def __init__(self, items, spec='zipf:1.1', name='', rotate_seconds=0):
+        self.items = items
+        self.n = len(items)
+        self.spec = spec
+        self.rotate_seconds = rotate_seconds
+        self.table = None if spec == 'uniform' else alias_table_for(self.n, spec)
+
+        seed = zlib.crc32(name.encode())
+        self._seed = seed
+        self._stride = _coprime_stride(self.n, seed)
+        self._epoch = None
+        self._offset = 0
+
+    def _current_offset(self):
+        if not self.rotate_seconds:
+            return self._seed % self.n
+        epoch = int(time.time() // self.rotate_seconds)
+        if epoch != self._epoch:
+            self._epoch = epoch
+            self._offset = zlib.crc32(f"{self._seed}:{epoch}".encode()) % self.n
+        return self._offset
+
+    def index(self, rng=random):
+        if self.table is None:
+            return int(rng.random() * self.n)
+        rank = self.table.sample(rng)
+        return (rank * self._stride + self._current_offset()) % self.n
+
+    def pick(self, rng=random):
+        return self.items[self.index(rng)]
+
+    def cold_index(self, fraction=0.5, rng=random):
+        """Индекс из fraction самых редких рангов текущей эпохи"""
+        rank = self.n - 1 - int(rng.random() * self.n * fraction)
+        return (rank * self._stride + self._current_offset()) % self.n
+
+    def rank(self, index):
+        """Ранг индекса в текущей эпохе: 0 - самый частый"""
+        return (index - self._current_offset()) * pow(self._stride, -1, self.n) % self.n
+
+class WeightedChoice:
+    """Замена random.choices(keys, weights)[0]: alias таблица строится один раз"""
+
+    def __init__(self, weights):
+        self.keys = list(weights)
+        self.table = AliasTable(list(weights.values()))
+
+    def pick(self, rng=random):
+        return self.keys[self.table.sample(rng)]
+
+def picker_from_env(items, name):
+    """
+    Picker для популяции name. Распределение - SKEW_<NAME> или общее ENTITY_SKEW
+    (по умолчанию zipf:1.1), ротация горячего множества - SKEW_ROTATE_SECONDS.
+    """
+    key = name.split('-')[0].upper()
+    spec = os.getenv(f'SKEW_{key}', os.getenv('ENTITY_SKEW', 'zipf:1.1'))
+    return SkewedPicker(items, spec, name, float(os.getenv('SKEW_ROTATE_SECONDS', '0')))
+
+def main():
+    parser = argparse.ArgumentParser(description='Check skewed sampling')
+    parser.add_argument('--n', type=int, default=1000000, help='число сущностей')
+    parser.add_argument('--spec', default='zipf:1.1')
+    parser.add_argument('--samples', type=int, default=1000000)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    picker = SkewedPicker(range(args.n), args.spec, name='check')
+    built = time.perf_counter() - started
+
+    started = time.perf_counter()
+    counts = Counter(picker.index() for _ in range(args.samples))
+    elapsed = time.perf_counter() - started
+
+    top = counts.most_common()
+    share = lambda k: sum(c for _, c in top[:k]) / args.samples * 100
+    print(f"📊 {args.spec} over {args.n:,} entities: built in {built:.2f}s, "
+          f"{elapsed / args.samples * 1e9:,.0f} ns/sample")
+    print(f"   distinct {len(counts):,}, top-10 {share(10):.1f}%, top-1% {share(max(1, args.n // 100)):.1f}%")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+"""
+Ingest Saturation Finder
+Поднимает суммарный поток событий генераторов ступенями и на каждой ступени
+снимает состояние всего пути доставки:
+  - отставание Logstash file input в байтах по /logs/*.json (sincedb на общем томе)
+  - скорость индексации и отказы Elasticsearch (_nodes/stats, _cat/thread_pool/write)
+  - очередь sink генераторов и, если задан --exporter, очереди из /metrics exporter
+  - задержку доставки канареек p50/p95/p99
+Первая ступень, на которой что-то перестает справляться, - колено: поиск
+останавливается, в отчет пишутся максимальный устойчивый поток, задержка
+по ступеням и первое узкое место.
+
+События пишут сами генераторы (их generate_*_event и log_event) в своих долях
+обычного темпа, файлы и sink те же, что у контейнеров. Контейнеры генераторов
+на время замера нужно остановить: их события попадают в те же файлы.
+Замеряется путь через file input, поэтому в LOG_OUTPUT должен быть file (или both).
+Отчет пишется в PROFILE_DIR (/app/logs/profiles), вне шаблона /logs/*.json.
+
+Против стека (из корня репозитория):
+  docker-compose stop auth-service-generator payment-service-generator fraud-service-generator notification-service-generator
+  docker-compose --profile combined run --rm generators-combined python -m common.saturation --target es
+Локально, Logstash и Elasticsearch заменяет заглушка заданной пропускной способности:
+  python -m common.saturation --target stub --stub-capacity 3000
+"""
+
+import argparse
+import glob
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+from common.probe import ElasticsearchCanarySource, LagChecker, percentile
+from common.runner import load_service
+from common.sampling import WeightedChoice
+from common.sink import output_kinds_from_env, share_sink
+
+# Доли сервисов в суммарном потоке - как при обычном темпе генераторов
+SERVICE_SHARES = {
+    'auth-service': 0.21,
+    'payment-service': 0.67,
+    'fraud-service': 0.01,
+    'notification-service': 0.11,
+}
+
+# Функция события каждого генератора
+EVENT_FUNCTIONS = {
+    'auth-service': 'generate_auth_event',
+    'payment-service': 'generate_payment_event',
+    'fraud-service': 'generate_fraud_event',
+    'notification-service': 'generate_notification_event',
+}
+
+# Порядок проверок ступени: первая сработавшая и есть узкое место.
+# generator - сам харнесс не выдает нужный поток (CPU процесса), стек до предела не дошел
+BOTTLENECKS = ('generator', 'sink queue', 'elasticsearch rejections', 'logstash file input', 'ingest lag')
+
+# ---------- отставание и индексация ----------
+
+def file_sizes(pattern):
+    """Размеры файлов по шаблону: путь -> (inode, байт)"""
+    sizes = {}
+    for path in glob.glob(pattern):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue  # ротация между glob и stat
+        sizes[path] = (stat.st_ino, stat.st_size)
+    return sizes
+
+class SincedbBacklog:
+    """
+    Отставание Logstash file input: размер файлов минус позиции из sincedb.
+    Строка sincedb: inode major minor позиция [время путь]; файлы сопоставляются
+    по inode, пути в контейнере Logstash другие (/logs вместо /app/logs).
+    """
+
+    def __init__(self, pattern='/app/logs/*.json', sincedb='/app/logs/.sincedb-json'):
+        self.pattern = pattern
+        self.sincedb = sincedb
+        self._warned = False
+
+    def positions(self):
+        positions = {}
+        with open(self.sincedb, encoding='utf-8') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 4 and parts[0].isdigit():
+                    positions[int(parts[0])] = int(parts[3])
+        return positions
+
+    def bytes_behind(self):
+        """Байт еще не прочитано; None, если sincedb нет (Logstash еще не писал его)"""
+        try:
+            positions = self.positions()
+        except FileNotFoundError:
+            if not self._warned:
+                print(f"⚠️ {self.sincedb} not found: is the pipeline's sincedb_path on the logs volume?")
+                self._warned = True
+            return None
+        return sum(max(0, size - positions.get(inode, 0)) for inode, size in file_sizes(self.pattern).values())
+
+class ElasticsearchIngestStats:
+    """Счетчики индексации и отказов по всем узлам"""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.session = requests.Session()
+
+    def sample(self):
+        stats = self.session.get(f"{self.url}/_nodes/stats/indices,thread_pool,indexing_pressure",
+                                 timeout=10).json()
+        indexed = rejected = 0
+        for node in stats['nodes'].values():
+            indexed += node['indices']['indexing']['index_total']
+            rejected += node['thread_pool']['write']['rejected']
+            pressure = node.get('indexing_pressure', {}).get('memory', {}).get('total', {})
+            rejected += pressure.get('coordinating_rejections', 0) + pressure.get('primary_rejections', 0)
+        pools = self.session.get(f"{self.url}/_cat/thread_pool/write",
+                                 params={'format': 'json', 'h': 'node_name,active,queue,rejected'},
+                                 timeout=10).json()
+        return {
+            'indexed': indexed,
+            'rejected': rejected,
+            'write_queue': sum(int(pool['queue']) for pool in pools),
+        }
+
+class StubStack:
+    """
+    Локальная заглушка Logstash + Elasticsearch: поток читает новые строки
+    *.json не быстрее capacity строк/сек и "индексирует" их. Канарейки
+    отдаются через poll() как источник для LagChecker.
+    """
+
+    def __init__(self, pattern='/app/logs/*.json', capacity=2000.0, tick=0.1):
+        self.pattern = pattern
+        self.capacity = capacity
+        self.tick = tick
+        self.indexed = 0
+        # Уже существующие файлы читаются с конца, как после sincedb
+        self._offsets = {path: size for path, (_, size) in file_sizes(pattern).items()}
+        self._hits = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, name='stub-stack', daemon=True).start()
+
+    def _run(self):
+        budget = 0.0
+        while not self._stop.wait(self.tick):
+            budget = min(budget + self.capacity * self.tick, self.capacity)
+            for path in sorted(glob.glob(self.pattern)):
+                if budget < 1:
+                    break
+                budget -= self._read(path, int(budget))
+
+    def _read(self, path, limit):
+        read = 0
+        with open(path, 'rb') as f:
+            f.seek(self._offsets.get(path, 0))
+            while read < limit:
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    break
+                self._offsets[path] = f.tell()
+                read += 1
+                if b'"canary_seq"' in line:
+                    with self._lock:
+                        self._hits.append(json.loads(line))
+        self.indexed += read
+        return read
+
+    def poll(self):
+        with self._lock:
+            hits, self._hits = self._hits, []
+        return hits
+
+    def bytes_behind(self):
+        return sum(max(0, size - self._offsets.get(path, 0))
+                   for path, (_, size) in file_sizes(self.pattern).items())
+
+    def sample(self):
+        return {'indexed': self.indexed, 'rejected': 0, 'write_queue': 0}
+
+    def stop(self):
+        self._stop.set()
+
+def exporter_queues(url):
+    """banking_queue_size и banking_ingest_lag_quantile_seconds из /metrics exporter"""
+    from prometheus_client.parser import text_string_to_metric_families
+
+    values = {}
+    text = requests.get(url, timeout=5).text
+    for family in text_string_to_metric_families(text):
+        if family.name in ('banking_queue_size', 'banking_ingest_lag_quantile_seconds'):
+            for sample in family.samples:
+                label = sample.labels.get('queue_name') or f"lag_{sample.labels['service']}_{sample.labels['quantile']}"
+                values[label] = sample.value
+    return values
+
+# ---------- ступени ----------
+
+class Load:
+    """Генераторы в одном процессе и выдача событий с заданным суммарным темпом"""
+
+    def __init__(self, canary_rate=2.0):
+        self.sink = share_sink('saturation')
+        self.modules = {name: load_service(name) for name in SERVICE_SHARES}
+        self.picker = WeightedChoice(SERVICE_SHARES)
+        self.emitters = {
+            name: (getattr(module, EVENT_FUNCTIONS[name]), module.log_event)
+            for name, module in self.modules.items()
+        }
+        self.canaries = [module.canary for module in self.modules.values()]
+        self.canary_interval = 1.0 / canary_rate if canary_rate > 0 else None
+        self._canary_turn = 0
+
+    def emit(self, count):
+        for _ in range(count):
+            generate, log_event = self.emitters[self.picker.pick()]
+            log_event(generate())
+
+    def emit_canary(self):
+        self.canaries[self._canary_turn % len(self.canaries)].emit()
+        self._canary_turn += 1
+
+    def run(self, rate, seconds, on_second=None):
+        """Держит rate событий/сек seconds секунд; возвращает число выданных событий"""
+        started = time.monotonic()
+        emitted = 0
+        next_canary = next_second = started
+        while True:
+            now = time.monotonic()
+            if now - started >= seconds:
+                return emitted
+            due = int(rate * (now - started)) - emitted
+            if due > 0:
+                # Порциями, чтобы канарейки и замеры не ждали отстающий генератор
+                batch = min(due, max(1, int(rate * 0.05)))
+                self.emit(batch)
+                emitted += batch
+            if self.canary_interval and now >= next_canary:
+                self.emit_canary()
+                next_canary += self.canary_interval
+            if on_second and now >= next_second:
+                on_second()
+                next_second += 1.0
+            if due <= 0:
+                time.sleep(min(0.01, 1.0 / rate))
+
+def measure_step(load, rate, seconds, warmup, backlog, ingest, lags, exporter=None, json_pattern='/app/logs/*.json'):
+    """Одна ступень: warmup секунд разгона, затем замер"""
+    load.run(rate, warmup)
+
+    peaks = {'sink_depth': 0, 'backlog_bytes': 0}
+
+    def on_second():
+        peaks['sink_depth'] = max(peaks['sink_depth'], load.sink.depth())
+        behind = backlog.bytes_behind()
+        if behind is not None:
+            peaks['backlog_bytes'] = max(peaks['backlog_bytes'], behind)
+
+    lags.clear()
+    sink_before = load.sink.stats()
+    backlog_before = backlog.bytes_behind()
+    ingest_before = ingest.sample()
+    written_before = sum(size for _, size in file_sizes(json_pattern).values())
+    started = time.monotonic()
+
+    emitted = load.run(rate, seconds, on_second)
+
+    elapsed = time.monotonic() - started
+    sink_after = load.sink.stats()
+    backlog_after = backlog.bytes_behind()
+    ingest_after = ingest.sample()
+    written = sum(size for _, size in file_sizes(json_pattern).values()) - written_before
+    step_lags = sorted(lags)
+
+    step = {
+        'target_rate': rate,
+        'achieved_rate': round(emitted / elapsed, 1),
+        'indexed_rate': round((ingest_after['indexed'] - ingest_before['indexed']) / elapsed, 1),
+        'written_bytes_per_sec': round(written / elapsed),
+        'backlog_bytes': backlog_after,
+        'backlog_growth_bytes_per_sec': (round((backlog_after - backlog_before) / elapsed)
+                                         if backlog_before is not None and backlog_after is not None else None),
+        'backlog_peak_bytes': peaks['backlog_bytes'],
+        'es_rejections': ingest_after['rejected'] - ingest_before['rejected'],
+        'es_write_queue': ingest_after['write_queue'],
+        'sink_peak_depth': peaks['sink_depth'],
+        'sink_capacity': sink_after['capacity'],
+        'sink_blocked_seconds': round(sink_after['blocked_seconds'] - sink_before['blocked_seconds'], 3),
+        'sink_dropped': sum(sink_after[k] - sink_before[k] for k in ('dropped_oldest', 'dropped_newest', 'sampled_out')),
+        'lag_p50': percentile(step_lags, 50),
+        'lag_p95': percentile(step_lags, 95),
+        'lag_p99': percentile(step_lags, 99),
+        'lag_samples': len(step_lags),
+    }
+    if exporter:
+        try:
+            step['exporter'] = exporter_queues(exporter)
+        except (requests.RequestException, ValueError) as e:
+            print(f"⚠️ Exporter metrics not read: {e}")
+    return step
+
+def bottleneck(step, min_achieved=0.95, backlog_tolerance=0.05, max_lag=10.0):
+    """Что не справилось на ступени (по порядку BOTTLENECKS) или None"""
+    if step['achieved_rate'] < min_achieved * step['target_rate']:
+        return 'generator'
+    if step['sink_blocked_seconds'] > 0 or step['sink_dropped'] > 0 \
+            or step['sink_peak_depth'] >= step['sink_capacity'] / 2:
+        return 'sink queue'
+    if step['es_rejections'] > 0:
+        return 'elasticsearch rejections'
+    growth = step['backlog_growth_bytes_per_sec']
+    if growth is not None and growth > backlog_tolerance * step['written_bytes_per_sec']:
+        return 'logstash file input'
+    if step['lag_p95'] is not None and step['lag_p95'] > max_lag:
+        return 'ingest lag'
+    return None
+
+def ramp(start, factor, max_rate):
+    rate = start
+    while rate <= max_rate:
+        yield round(rate, 1)
+        rate *= factor
+
+def format_steps(steps):
+    lines = [f"{'target':>8}{'emitted':>9}{'indexed':>9}{'backlog KB':>12}{'growth KB/s':>13}"
+             f"{'rejects':>9}{'sink':>7}{'p50':>7}{'p95':>7}{'p99':>7}  verdict"]
+    for s in steps:
+        lags = ''.join(f"{s[k]:>7.2f}" if s[k] is not None else f"{'-':>7}" for k in ('lag_p50', 'lag_p95', 'lag_p99'))
+        backlog = f"{s['backlog_bytes'] / 1024:>12,.0f}" if s['backlog_bytes'] is not None else f"{'-':>12}"
+        growth = (f"{s['backlog_growth_bytes_per_sec'] / 1024:>13,.1f}"
+                  if s['backlog_growth_bytes_per_sec'] is not None else f"{'-':>13}")
+        lines.append(f"{s['target_rate']:>8,.0f}{s['achieved_rate']:>9,.0f}{s['indexed_rate']:>9,.0f}{backlog}{growth}"
+                     f"{s['es_rejections']:>9}{s['sink_peak_depth']:>7}{lags}  {s['bottleneck'] or 'ok'}")
+    return '\n'.join(lines)
+
+def warn_if_busy(pattern, seconds=2.0):
+    """Файлы растут без харнесса - значит, работают контейнеры генераторов"""
+    before = sum(size for _, size in file_sizes(pattern).values())
+    time.sleep(seconds)
+    grown = sum(size for _, size in file_sizes(pattern).values()) - before
+    if grown > 0:
+        print(f"⚠️ {pattern} grew by {grown} bytes in {seconds:.0f}s without load: "
+              f"stop the generator containers, results will be skewed")
+
+def main():
+    parser = argparse.ArgumentParser(description='Find the ingest rate where the stack saturates')
+    parser.add_argument('--target', choices=['es', 'stub'], default='es')
+    parser.add_argument('--es', default=os.getenv('ELASTICSEARCH_URL', 'http://elasticsearch:9200'))
+    parser.add_argument('--sincedb', default='/app/logs/.sincedb-json',
+                        help='sincedb Logstash file input на общем томе логов')
+    parser.add_argument('--stub-capacity', type=float, default=2000.0, help='событий/сек заглушки')
+    parser.add_argument('--exporter', help='URL /metrics exporter, например http://metrics-exporter:8080/metrics')
+    parser.add_argument('--start', type=float, default=50.0, help='поток первой ступени, событий/сек')
+    parser.add_argument('--factor', type=float, default=1.5, help='во сколько раз растет поток')
+    parser.add_argument('--max-rate', type=float, default=50000.0)
+    parser.add_argument('--step-seconds', type=float, default=60.0)
+    parser.add_argument('--warmup', type=float, default=10.0, help='секунд разгона ступени без замера')
+    parser.add_argument('--max-lag', type=float, default=10.0, help='предел p95 задержки канареек, сек')
+    parser.add_argument('--backlog-tolerance', type=float, default=0.05,
+                        help='допустимый рост отставания, доля от записанных байт')
+    parser.add_argument('--canary-rate', type=float, default=2.0)
+    # Не в /app/logs: Logstash file input читает /logs/*.json и проиндексировал бы отчет
+    parser.add_argument('--report', default=os.path.join(
+        os.getenv('PROFILE_DIR', '/app/logs/profiles'), f"saturation-{datetime.now():%Y%m%d-%H%M%S}.json"))
+    args = parser.parse_args()
+    if args.factor <= 1:
+        parser.error('--factor must be greater than 1')
+    # Отставание, скорость записи и заглушка считаются по файлам *.json: нужен выход file
+    if 'file' not in output_kinds_from_env():
+        parser.error(f"LOG_OUTPUT={os.getenv('LOG_OUTPUT')} has no file output: the ramp measures "
+                     f"the Logstash file input path, run it with LOG_OUTPUT=file or both")
+
+    json_pattern = '/app/logs/*.json'
+    warn_if_busy(json_pattern)
+
+    lags = []
+    load = Load(canary_rate=args.canary_rate)
+    if args.target == 'stub':
+        stack = StubStack(json_pattern, args.stub_capacity)
+        backlog = ingest = canary_source = stack
+    else:
+        backlog = SincedbBacklog(json_pattern, args.sincedb)
+        ingest = ElasticsearchIngestStats(args.es)
+        canary_source = ElasticsearchCanarySource(args.es)
+    checker = LagChecker(canary_source, on_lag=lambda service, seconds: lags.append(seconds))
+    stop = threading.Event()
+    threading.Thread(target=checker.run, args=(0.5, stop), name='saturation-probe', daemon=True).start()
+
+    print(f"🚦 Ramping from {args.start:g} events/s x{args.factor:g}, {args.step_seconds:g}s steps ({args.target})")
+    steps = []
+    try:
+        for rate in ramp(args.start, args.factor, args.max_rate):
+            step = measure_step(load, rate, args.step_seconds, args.warmup, backlog, ingest, lags,
+                                args.exporter, json_pattern)
+            step['bottleneck'] = bottleneck(step, backlog_tolerance=args.backlog_tolerance, max_lag=args.max_lag)
+            steps.append(step)
+            print(format_steps(steps).splitlines()[-1])
+            if step['bottleneck']:
+                break
+    except KeyboardInterrupt:
+        print("\n⏹️ Interrupted, reporting completed steps")
+    except (requests.RequestException, KeyError, ValueError) as e:
+        print(f"❌ Stack stats unavailable: {e}")
+    finally:
+        stop.set()
+
+    sustainable = [s for s in steps if not s['bottleneck']]
+    knee = next((s for s in steps if s['bottleneck']), None)
+    report = {
+        'target': args.target,
+        'finished': datetime.now().isoformat(),
+        'max_sustainable_rate': sustainable[-1]['achieved_rate'] if sustainable else None,
+        'knee_rate': knee['target_rate'] if knee else None,
+        'first_bottleneck': knee['bottleneck'] if knee else None,
+        'steps': steps,
+    }
+    print(format_steps(steps))
+    if knee:
+        print(f"🏁 Max sustainable rate {report['max_sustainable_rate'] or 0:,.0f} events/s, "
+              f"knee at {knee['target_rate']:,.0f} events/s: {knee['bottleneck']}")
+    else:
+        print("🏁 No knee found: raise --max-rate")
+    os.makedirs(os.path.dirname(args.report) or '.', exist_ok=True)
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Report written to {args.report}")
+    load.sink.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Banking Event Schema Registry
+Единое описание полей всех событий: из него строятся маппинги Elasticsearch,
+banking-template.json и быстрые валидаторы для генераторов
+"""
+
+import argparse
+import json
+import sys
+
+# Виды полей: маппинг Elasticsearch и допустимые python типы значения.
+# display - поле только для показа в Discover: не индексируется и не агрегируется.
+FIELD_KINDS = {
+    'keyword': ({'type': 'keyword', 'ignore_above': 256}, (str,)),
+    'text': ({'type': 'text', 'norms': False}, (str,)),
+    'display': ({'type': 'keyword', 'index': False, 'doc_values': False}, (str,)),
+    'ip': ({'type': 'ip'}, (str,)),
+    'integer': ({'type': 'integer'}, (int,)),
+    'long': ({'type': 'long'}, (int,)),
+    'double': ({'type': 'double'}, (int, float)),
+    'boolean': ({'type': 'boolean'}, (bool,)),
+    # ISO8601 из генераторов и "2026-10-16 14:00:00,123" из текстовых логов
+    'date': ({'type': 'date', 'format': 'strict_date_optional_time||yyyy-MM-dd HH:mm:ss,SSS||epoch_millis'}, (str,)),
+}
+
+def field(kind, required=False, many=False, nullable=False):
+    """Описание одного поля схемы"""
+    if kind not in FIELD_KINDS:
+        raise ValueError(f"Unknown field kind: {kind}")
+    return {'kind': kind, 'required': required, 'many': many, 'nullable': nullable}
+
+# Сервис -> суффикс data stream banking-logs-<suffix>; остальное уходит в general
+INDEX_SUFFIXES = {
+    'auth-service': 'auth',
+    'payment-service': 'payments',
+    'fraud-service': 'fraud',
+    'notification-service': 'notifications',
+}
+DEFAULT_INDEX_SUFFIX = 'general'
+
+# Поля, которые есть у событий всех сервисов
+COMMON_FIELDS = {
+    'timestamp': field('date', required=True),
+    'service': field('keyword', required=True),
+    'level': field('keyword', required=True),
+    'message': field('text'),
+}
+
+# Поля, которые добавляют json-logger и Logstash. В ES они маппятся,
+# но в генераторах не проверяются.
+ENVELOPE_FIELDS = {
+    '@timestamp': field('date'),
+    '@version': field('display'),
+    'asctime': field('display'),
+    'levelname': field('keyword'),
+    'name': field('keyword'),
+    'type': field('keyword'),
+    'tags': field('keyword', many=True),
+    'log_format': field('keyword'),
+    'index_suffix': field('keyword'),
+    'message_text': field('text'),
+}
+
+# Канареечные события замера задержки доставки (common/probe.py)
+PROBE_FIELDS = {
+    'canary_run': field('keyword'),
+    'canary_seq': field('long'),
+    'canary_emitted_ns': field('long'),
+}
+
+# Схемы сервисов: discriminator - поле с типом события,
+# events - какие поля обязательны для каждого типа
+SERVICE_SCHEMAS = {
+    'auth-service': {
+        'discriminator': 'event_type',
+        'fields': {
+            'event_type': field('keyword', required=True),
+            'user_id': field('keyword', required=True),
+            'username': field('keyword', required=True),
+            'session_id': field('keyword', required=True),
+            'client_ip': field('ip', required=True),
+            'user_agent': field('keyword', required=True),
+            'location': field('keyword'),
+            'device_fingerprint': field('keyword'),
+            'two_factor_used': field('boolean'),
+            'failure_reason': field('keyword'),
+            'attempt_count': field('integer'),
+            'failed_attempts': field('integer'),
+            'lock_duration': field('keyword'),
+            'auto_unlock': field('boolean'),
+            'risk_score': field('integer'),
+            'suspicious_factors': field('keyword', many=True),
+            'sms_sent': field('boolean'),
+            'app_notification': field('boolean'),
+        },
+        'events': {
+            'login_success': ['message', 'location', 'device_fingerprint', 'two_factor_used'],
+            'login_failed': ['message', 'failure_reason', 'attempt_count'],
+            'account_locked': ['message', 'failed_attempts', 'lock_duration', 'auto_unlock'],
+            'password_reset': [],
+            'two_factor_required': ['message', 'sms_sent', 'app_notification'],
+            'suspicious_login': ['message', 'risk_score', 'suspicious_factors'],
+            'logout': [],
+        },
+    },
+    'payment-service': {
+        'discriminator': 'payment_type',
+        'fields': {
+            'transaction_id': field('keyword', required=True),
+            'payment_type': field('keyword', required=True),
+            'sender_account': field('keyword', required=True),
+            'sender_iban': field('keyword', required=True),
+            'sender_name': field('display', required=True),
+            'recipient_account': field('keyword', required=True),
+            'recipient_iban': field('keyword', required=True),
+            'recipient_name': field('display', required=True),
+            'amount': field('double', required=True),
+            'currency': field('keyword', required=True),
+            'processing_time_ms': field('integer', required=True),
+            'status': field('keyword', required=True),
+            'fee': field('double'),
+            'authorization_code': field('display'),
+            'merchant_category': field('keyword', nullable=True),
+            'suspicious_amount': field('boolean'),
+            'compliance_check': field('boolean'),
+            'error_code': field('keyword'),
+            'retry_count': field('integer'),
+            'can_retry': field('boolean'),
+            'service_type': field('keyword'),
+            'swift_code': field('keyword'),
+            'correspondent_bank': field('keyword'),
+            'exchange_rate': field('double'),
+            'card_number': field('keyword'),
+            'terminal_id': field('keyword'),
+            'merchant_name': field('keyword'),
+            'night_transaction': field('boolean'),
+        },
+        'events': {
+            'transfer': ['message'],
+            'card_payment': ['message', 'card_number', 'terminal_id', 'merchant_name'],
+            'utility_payment': ['message', 'service_type'],
+            'salary_payment': ['message'],
+            'large_transfer': ['message'],
+            'international_transfer': ['message', 'swift_code', 'correspondent_bank', 'exchange_rate'],
+        },
+    },
+    'fraud-service': {
+        'discriminator': 'event_type',
+        'fields': {
+            'event_type': field('keyword', required=True),
+            'alert_id': field('keyword', required=True),
+            'risk_score': field('integer', required=True),
+            # У алертов о схемах отмывания пользователя нет: участники - счета (ring_accounts)
+            'user_id': field('keyword'),
+            'transaction_id': field('keyword', required=True),
+            'amount': field('double'),
+            'factors': field('keyword', many=True),
+            'card_number': field('keyword'),
+            'merchant': field('keyword'),
+            'location': field('keyword'),
+            'ring_pattern': field('keyword'),
+            'ring_accounts': field('keyword', many=True),
+            'ring_transactions': field('keyword', many=True),
+            'ring_size': field('integer'),
+            'ring_duration_seconds': field('double'),
+        },
+        'events': {
+            'suspicious_transaction': ['user_id', 'message', 'amount', 'factors'],
+            'card_fraud_detected': ['user_id', 'message', 'card_number', 'merchant', 'location'],
+            'account_takeover': ['user_id'],
+            'money_laundering': ['message', 'amount', 'ring_pattern', 'ring_accounts',
+                                 'ring_transactions', 'ring_size', 'ring_duration_seconds'],
+            'identity_theft': ['user_id'],
+            'false_positive': ['user_id'],
+        },
+    },
+    'notification-service': {
+        'discriminator': 'event_type',
+        'fields': {
+            'event_type': field('keyword', required=True),
+            'notification_id': field('keyword', required=True),
+            'user_id': field('keyword', required=True),
+            'phone': field('keyword'),
+            'email': field('keyword'),
+            'subject': field('keyword'),
+            'error_code': field('keyword'),
+        },
+        'events': {
+            'sms_sent': ['message', 'phone'],
+            'email_sent': ['message', 'email', 'subject'],
+            'push_sent': ['message'],
+            'sms_failed': ['message', 'phone', 'error_code'],
+            'email_failed': ['message', 'email', 'subject', 'error_code'],
+        },
+    },
+}
+
+def service_fields(service):
+    """Все поля событий сервиса, включая общие"""
+    return {**COMMON_FIELDS, **SERVICE_SCHEMAS[service]['fields']}
+
+def all_fields():
+    """Объединенный набор полей всех сервисов; одно имя - один вид"""
+    merged = {**ENVELOPE_FIELDS, **PROBE_FIELDS}
+    for service in SERVICE_SCHEMAS:
+        for name, spec in service_fields(service).items():
+            known = merged.get(name)
+            if known and known['kind'] != spec['kind']:
+                raise ValueError(
+                    f"Field {name} is {known['kind']} in one schema and {spec['kind']} in {service}"
+                )
+            merged.setdefault(name, spec)
+    return merged
+
+def build_mappings(dynamic='false'):
+    """Строит маппинг ES. dynamic=false: неизвестные поля хранятся в _source, но не индексируются"""
+    properties = {
+        name: dict(FIELD_KINDS[spec['kind']][0])
+        for name, spec in sorted(all_fields().items())
+    }
+    # geoip заполняет Logstash, набор полей зависит от базы - оставляем динамическим.
+    # Строкой, как dynamic отдает Elasticsearch: иначе setup.py видит расхождение при каждом запуске
+    properties['geoip'] = {
+        'dynamic': 'true',
+        'properties': {
+            'location': {'type': 'geo_point'},
+            'country_name': {'type': 'keyword'},
+            'city_name': {'type': 'keyword'},
+            'continent_code': {'type': 'keyword'},
+        }
+    }
+    return {'dynamic': dynamic, 'properties': properties}
+
+# Значения по умолчанию для banking-template.json; setup.py подставляет свои
+DEFAULT_SETTINGS = {
+    'number_of_shards': 1,
+    'number_of_replicas': 0,
+    'refresh_interval': '5s',
+    'lifecycle': {'name': 'banking-logs'},
+}
+
+def build_index_template(settings=None, dynamic='false'):
+    """Composable index template для data streams banking-logs-*"""
+    template_settings = dict(settings or DEFAULT_SETTINGS)
+    # Сортировка по времени ускоряет запросы "последние N событий" и сжимает соседние документы
+    template_settings['sort'] = {'field': '@timestamp', 'order': 'desc'}
+    return {
+        'index_patterns': ['banking-logs-*'],
+        'data_stream': {},
+        'priority': 200,
+        'template': {
+            'settings': template_settings,
+            'mappings': build_mappings(dynamic),
+        }
+    }
+
+def compile_validator(service):
+    """
+    Генерирует и компилирует функцию validate(event) -> list[str] для сервиса.
+    Проверки разворачиваются в плоский код без циклов по схеме.
+    """
+    schema = SERVICE_SCHEMAS[service]
+    fields = service_fields(service)
+    namespace = {'MISSING': object(), 'KNOWN': frozenset(fields)}
+    lines = ['def validate(event):', '    errors = []', '    get = event.get']
+
+    for i, (name, spec) in enumerate(fields.items()):
+        types_name = f'T{i}'
+        namespace[types_name] = FIELD_KINDS[spec['kind']][1]
+        lines.append(f'    v = get({name!r}, MISSING)')
+        if spec['required']:
+            lines.append('    if v is MISSING:')
+            lines.append(f'        errors.append("missing required field {name}")')
+        else:
+            lines.append('    if v is MISSING:')
+            lines.append('        pass')
+        if spec['nullable']:
+            lines.append('    elif v is None:')
+            lines.append('        pass')
+        if spec['many']:
+            lines.append(f'    elif type(v) is not list or any(type(x) not in {types_name} for x in v):')
+        else:
+            lines.append(f'    elif type(v) not in {types_name}:')
+        lines.append(f'        errors.append("field {name}: unexpected value %r" % (v,))')
+
+    namespace['EVENTS'] = {
+        kind: tuple(required) for kind, required in schema['events'].items()
+    }
+    discriminator = schema['discriminator']
+    lines += [
+        '    for key in event.keys() - KNOWN:',
+        '        errors.append("unknown field %s" % key)',
+        f'    kind = get({discriminator!r})',
+        '    required = EVENTS.get(kind)',
+        '    if required is None:',
+        f'        errors.append("unknown {discriminator} %r" % (kind,))',
+        '    else:',
+        '        for name in required:',
+        '            if name not in event:',
+        '                errors.append("%s requires field %s" % (kind, name))',
+        '    return errors',
+    ]
+
+    exec(compile('\n'.join(lines), f'<schema:{service}>', 'exec'), namespace)
+    return namespace['validate']
+
+def main():
+    """CLI: печатает или записывает banking-template.json"""
+    parser = argparse.ArgumentParser(description='Banking event schema tools')
+    parser.add_argument('--output', '-o', help='куда записать index template (по умолчанию stdout)')
+    parser.add_argument('--dynamic', default='false', choices=['true', 'false', 'strict'],
+                        help='поведение для полей, которых нет в схеме')
+    args = parser.parse_args()
+
+    template = json.dumps(build_index_template(dynamic=args.dynamic), indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(template + '\n')
+        print(f"✅ Template written to {args.output}", file=sys.stderr)
+    else:
+        print(template)
+
+if __name__ == "__main__":
+    main()
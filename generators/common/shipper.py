@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Logstash Network Shipper
+Отправка событий напрямую в Logstash beats input по протоколу Lumberjack v2:
+пачки (window) с подтверждениями, переподключение и ограниченный spool на время обрыва
+
+Запуск из каталога generators: python -m common.shipper listen|bench
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+
+# Кадры протокола Lumberjack v2
+PROTOCOL_VERSION = b'2'
+FRAME_WINDOW = b'W'
+FRAME_JSON = b'J'
+FRAME_COMPRESSED = b'C'
+FRAME_ACK = b'A'
+
+# Переподключение: не чаще, чем раз в delay, delay растет до максимума
+RECONNECT_INITIAL = 0.5
+RECONNECT_MAX = 30.0
+
+def encode_window(payloads, compress_level=0):
+    """Кодирует пачку JSON payload'ов (bytes) в кадры W + J..J (опционально внутри C)"""
+    frames = []
+    for seq, payload in enumerate(payloads, start=1):
+        frames.append(PROTOCOL_VERSION + FRAME_JSON + struct.pack('>II', seq, len(payload)))
+        frames.append(payload)
+    body = b''.join(frames)
+    if compress_level:
+        compressed = zlib.compress(body, compress_level)
+        body = PROTOCOL_VERSION + FRAME_COMPRESSED + struct.pack('>I', len(compressed)) + compressed
+    return PROTOCOL_VERSION + FRAME_WINDOW + struct.pack('>I', len(payloads)) + body
+
+class LumberjackOutput:
+    """
+    Выход для BackgroundSink: события копятся в spool и уходят окнами по window_size,
+    окно удаляется из spool только после ACK от Logstash.
+    background=True - отправка в своем потоке: подключение и ожидание ACK не держат
+    поток-писатель sink'а (и файловые выходы на нем). Без него write_payloads
+    отправляет сам, и отправитель ждет Logstash (replay, pipeline_bench).
+    """
+
+    def __init__(self, host, port, formatter, window_size=500, spool_capacity=100000,
+                 compress_level=0, timeout=10.0, background=False):
+        self.host = host
+        self.port = port
+        self.formatter = formatter
+        self.window_size = window_size
+        self.compress_level = compress_level
+        self.timeout = timeout
+
+        self._spool = deque()
+        self._spool_capacity = spool_capacity
+        self._cond = threading.Condition()
+        self._closed = False
+        self._sock = None
+        self._next_connect = 0.0
+        self._reconnect_delay = RECONNECT_INITIAL
+
+        self.counters = {
+            'acked': 0,
+            'windows': 0,
+            'spool_dropped': 0,
+            'connects': 0,
+            'send_errors': 0,
+        }
+
+        self._thread = None
+        if background:
+            self._thread = threading.Thread(target=self._run, name=f"lumberjack-{host}:{port}", daemon=True)
+            self._thread.start()
+
+    def write_batch(self, records):
+        self.write_payloads([self.formatter.format(record).encode('utf-8') for record in records])
+
+    def write_payloads(self, payloads):
+        """Отправляет уже готовые JSON документы (bytes)"""
+        with self._cond:
+            self._spool.extend(payloads)
+            self._trim()
+            self._cond.notify()
+        if self._thread is None:
+            self._drain()
+
+    def _trim(self):
+        # Spool полон: теряем самые старые события, а не блокируем генератор
+        while len(self._spool) > self._spool_capacity:
+            self._spool.popleft()
+            self.counters['spool_dropped'] += 1
+
+    def _run(self):
+        """Поток отправки: ждет событий, между попытками подключения - паузу backoff"""
+        while True:
+            with self._cond:
+                while not self._spool and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                if self._sock is None:
+                    self._cond.wait(max(0.0, self._next_connect - time.monotonic()))
+            self._drain()
+
+    def _connect(self):
+        now = time.monotonic()
+        if now < self._next_connect:
+            return False
+        try:
+            self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._reconnect_delay = RECONNECT_INITIAL
+            self.counters['connects'] += 1
+            return True
+        except OSError as e:
+            print(f"⚠️ Logstash {self.host}:{self.port} unavailable ({e}), "
+                  f"retry in {self._reconnect_delay:.1f}s, spooled {len(self._spool)}")
+            self._next_connect = now + self._reconnect_delay
+            self._reconnect_delay = min(self._reconnect_delay * 2, RECONNECT_MAX)
+            return False
+
+    def _disconnect(self):
+        if self._sock:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+
+    def _read_exact(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self._sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("connection closed by peer")
+            data += chunk
+        return data
+
+    def _wait_ack(self, last_seq):
+        """Ждет ACK на последний номер окна; Logstash может присылать промежуточные"""
+        while True:
+            header = self._read_exact(6)
+            if header[:2] != PROTOCOL_VERSION + FRAME_ACK:
+                raise ConnectionError(f"unexpected frame {header[:2]!r}")
+            seq = struct.unpack('>I', header[2:])[0]
+            if seq >= last_seq:
+                return
+
+    def _drain(self):
+        """Отправляет spool окнами, пока есть соединение"""
+        while True:
+            if self._sock is None and not self._connect():
+                return
+            with self._cond:
+                if not self._spool:
+                    return
+                window = [self._spool.popleft() for _ in range(min(self.window_size, len(self._spool)))]
+            try:
+                self._sock.sendall(encode_window(window, self.compress_level))
+                self._wait_ack(len(window))
+            except OSError as e:
+                # Окно возвращается в начало spool и уйдет повторно после переподключения
+                with self._cond:
+                    self._spool.extendleft(reversed(window))
+                    self._trim()
+                self.counters['send_errors'] += 1
+                print(f"⚠️ Logstash connection lost: {e}")
+                self._disconnect()
+                self._next_connect = time.monotonic() + self._reconnect_delay
+                return
+            self.counters['acked'] += len(window)
+            self.counters['windows'] += 1
+
+    def close(self):
+        if self._thread is not None:
+            with self._cond:
+                self._closed = True
+                self._cond.notify()
+            self._thread.join(self.timeout)
+            if self._thread.is_alive():
+                print(f"⚠️ Logstash sender did not stop, {len(self._spool)} events may be lost")
+                return
+        # Последняя попытка дослать spool
+        self._next_connect = 0.0
+        self._drain()
+        if self._spool:
+            print(f"⚠️ {len(self._spool)} events were not delivered to Logstash")
+        self._disconnect()
+
+    @classmethod
+    def from_env(cls, formatter):
+        """Параметры подключения из LOGSTASH_HOST / LOGSTASH_PORT / SHIPPER_*"""
+        return cls(
+            os.getenv('LOGSTASH_HOST', 'logstash'),
+            int(os.getenv('LOGSTASH_PORT', '5044')),
+            formatter,
+            window_size=int(os.getenv('SHIPPER_WINDOW_SIZE', '500')),
+            spool_capacity=int(os.getenv('SHIPPER_SPOOL_CAPACITY', '100000')),
+            compress_level=int(os.getenv('SHIPPER_COMPRESS_LEVEL', '0')),
+            background=True,
+        )
+
+class ListenerStub:
+    """Минимальный Lumberjack v2 сервер: принимает окна, считает события, шлет ACK"""
+
+    def __init__(self, host='127.0.0.1', port=5044, on_event=None):
+        self.on_event = on_event
+        self.received = 0
+        self._server = socket.create_server((host, port))
+        self.port = self._server.getsockname()[1]
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    @staticmethod
+    def _read_exact(stream, size):
+        data = stream.read(size)
+        if len(data) < size:
+            raise ConnectionError("connection closed")
+        return data
+
+    def _read_frames(self, stream, window, seq):
+        """Читает кадры, пока не наберется окно; возвращает последний seq"""
+        while seq < window:
+            kind = self._read_exact(stream, 2)[1:2]
+            if kind == FRAME_JSON:
+                seq, size = struct.unpack('>II', self._read_exact(stream, 8))
+                payload = self._read_exact(stream, size)
+                self.received += 1
+                if self.on_event:
+                    self.on_event(json.loads(payload))
+            elif kind == FRAME_COMPRESSED:
+                size = struct.unpack('>I', self._read_exact(stream, 4))[0]
+                inner = zlib.decompress(self._read_exact(stream, size))
+                seq = self._read_frames(io.BytesIO(inner), window, seq)
+            else:
+                raise ConnectionError(f"unexpected frame {kind!r}")
+        return seq
+
+    def _serve(self, conn):
+        stream = conn.makefile('rb')
+        try:
+            while True:
+                header = self._read_exact(stream, 2)
+                if header != PROTOCOL_VERSION + FRAME_WINDOW:
+                    raise ConnectionError(f"expected window frame, got {header!r}")
+                window = struct.unpack('>I', self._read_exact(stream, 4))[0]
+                last = self._read_frames(stream, window, 0)
+                conn.sendall(PROTOCOL_VERSION + FRAME_ACK + struct.pack('>I', last))
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            conn.close()
+
+    def close(self):
+        self._server.close()
+
+def benchmark(events, port):
+    """Сравнивает пропускную способность sink -> файл и sink -> Lumberjack (до ACK)"""
+    import tempfile
+    from pythonjsonlogger import jsonlogger
+    from common.sink import BackgroundSink, FileOutput, SinkHandler
+
+    formatter = jsonlogger.JsonFormatter(fmt='%(asctime)s %(levelname)s %(name)s %(message)s')
+    stub = ListenerStub(port=port)
+    sample = {'service': 'payment-service', 'amount': 1234.5, 'currency': 'RUB',
+              'transaction_id': 'bench', 'status': 'success'}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        outputs = {
+            'file': lambda: FileOutput(os.path.join(tmp, 'bench.json'), formatter),
+            'lumberjack': lambda: LumberjackOutput('127.0.0.1', stub.port, formatter),
+        }
+        for name, make_output in outputs.items():
+            logger = logging.getLogger(f'shipper-bench-{name}')
+            logger.propagate = False
+            sink = BackgroundSink(f'bench-{name}', capacity=events)
+            logger.addHandler(SinkHandler(sink, make_output()))
+
+            started = time.perf_counter()
+            for i in range(events):
+                logger.warning("Benchmark event", extra=dict(sample, seq=i))
+            sink.close(timeout=None)
+            elapsed = time.perf_counter() - started
+            print(f"📊 {name:<11} {events / elapsed:>10,.0f} events/s ({elapsed:.2f}s)")
+
+    print(f"✅ Stub received {stub.received} events over Lumberjack")
+    stub.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Lumberjack shipper tools')
+    sub = parser.add_subparsers(dest='command', required=True)
+    listen = sub.add_parser('listen', help='запустить stub-сервер, печатать события/сек')
+    listen.add_argument('--port', type=int, default=5044)
+    bench = sub.add_parser('bench', help='сравнить файл и сетевую отправку')
+    bench.add_argument('--events', type=int, default=100000)
+    bench.add_argument('--port', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'listen':
+        stub = ListenerStub(host='0.0.0.0', port=args.port)
+        print(f"👂 Lumberjack stub listening on :{stub.port}")
+        last = 0
+        try:
+            while True:
+                time.sleep(5)
+                print(f"📊 {(stub.received - last) / 5:,.0f} events/s, total {stub.received}")
+                last = stub.received
+        except KeyboardInterrupt:
+            stub.close()
+    else:
+        benchmark(args.events, args.port)
+
+if __name__ == "__main__":
+    main()
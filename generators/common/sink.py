@@ -0,0 +1,271 @@
+"""
+Background Log Sink
+Неблокирующая запись логов: генератор кладет записи в ограниченную очередь,
+отдельный поток забирает их пачками и пишет в выходы (файлы и т.д.)
+"""
+
+import atexit
+import logging
+import os
+import random
+import signal
+import threading
+import time
+from collections import deque
+
+# Что делать, когда очередь заполнена:
+#   block       - генератор ждет, пока писатель освободит место
+#   drop_oldest - выбрасываем самую старую запись из очереди
+#   drop_newest - выбрасываем новую запись
+#   sample      - выше порога заполнения принимаем записи с убывающей вероятностью
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'drop_newest', 'sample')
+
+class BackgroundSink:
+    """Ограниченная очередь записей и поток-писатель, который сбрасывает их пачками"""
+
+    def __init__(self, name, capacity=10000, policy='block', batch_size=500,
+                 flush_interval=0.2, sample_threshold=0.5):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.name = name
+        self.capacity = capacity
+        self.policy = policy
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sample_threshold = sample_threshold
+
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._outputs = []
+        self._closed = False
+
+        self.counters = {
+            'enqueued': 0,
+            'written': 0,
+            'batches': 0,
+            'dropped_oldest': 0,
+            'dropped_newest': 0,
+            'sampled_out': 0,
+            'blocked_seconds': 0.0,
+            'write_errors': 0,
+            'max_depth': 0,
+        }
+
+        self._thread = threading.Thread(target=self._run, name=f"{name}-sink", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add_output(self, output):
+        """Регистрирует выход; у выхода должны быть write_batch(records) и close()"""
+        self._outputs.append(output)
+        return output
+
+    def put(self, output, record):
+        """Кладет запись для выхода в очередь. Возвращает False, если запись отброшена"""
+        with self._lock:
+            if self._closed:
+                # Писатель уже закрыт (выход процесса): запись не примется, но видна в счетчиках
+                self.counters['dropped_newest'] += 1
+                return False
+            depth = len(self._queue)
+
+            if self.policy == 'sample' and depth >= self.capacity * self.sample_threshold:
+                # Вероятность приема линейно падает от 1 на пороге до 0 при полной очереди
+                free = (self.capacity - depth) / (self.capacity * (1 - self.sample_threshold))
+                if random.random() >= free:
+                    self.counters['sampled_out'] += 1
+                    return False
+
+            if depth >= self.capacity:
+                if self.policy == 'block':
+                    started = time.monotonic()
+                    while len(self._queue) >= self.capacity and not self._closed:
+                        self._not_full.wait()
+                    self.counters['blocked_seconds'] += time.monotonic() - started
+                    if self._closed:
+                        # Писатель уже дописал очередь и вышел: запись никто не заберет
+                        self.counters['dropped_newest'] += 1
+                        return False
+                elif self.policy == 'drop_oldest':
+                    self._queue.popleft()
+                    self.counters['dropped_oldest'] += 1
+                else:
+                    self.counters['dropped_newest'] += 1
+                    return False
+
+            self._queue.append((output, record))
+            self.counters['enqueued'] += 1
+            if len(self._queue) > self.counters['max_depth']:
+                self.counters['max_depth'] = len(self._queue)
+            self._not_empty.notify()
+            return True
+
+    def _take_batch(self):
+        """Ждет записи и забирает до batch_size штук"""
+        with self._lock:
+            if not self._queue and not self._closed:
+                self._not_empty.wait(self.flush_interval)
+            batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            self._not_full.notify_all()
+            return batch
+
+    def _write(self, batch):
+        # Группируем по выходам, сохраняя порядок записей внутри каждого выхода
+        grouped = {}
+        for output, record in batch:
+            grouped.setdefault(id(output), (output, []))[1].append(record)
+
+        # written - только записанные; записи пачки, на которой выход упал, идут в write_errors
+        for output, records in grouped.values():
+            try:
+                output.write_batch(records)
+                self.counters['written'] += len(records)
+            except Exception as e:
+                self.counters['write_errors'] += len(records)
+                print(f"❌ Sink {self.name} write error: {e}")
+
+        self.counters['batches'] += 1
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch:
+                self._write(batch)
+            elif self._closed:
+                return
+
+    def depth(self):
+        return len(self._queue)
+
+    def stats(self):
+        """Снимок счетчиков и текущей глубины очереди"""
+        with self._lock:
+            return dict(self.counters, depth=len(self._queue), capacity=self.capacity)
+
+    def describe(self):
+        """Короткая строка для периодического вывода в консоль"""
+        s = self.stats()
+        dropped = s['dropped_oldest'] + s['dropped_newest'] + s['sampled_out']
+        return f"queue {s['depth']}/{s['capacity']}, written {s['written']}, dropped {dropped}"
+
+    def close(self, timeout=10.0):
+        """Дописывает очередь и закрывает выходы"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+        self._thread.join(timeout)
+        for output in self._outputs:
+            try:
+                output.close()
+            except Exception as e:
+                print(f"❌ Sink {self.name} close error: {e}")
+
+def _exit_on_signal(signum, frame):
+    print(f"⏹️ {signal.Signals(signum).name} received, flushing log queue")
+    raise SystemExit(128 + signum)
+
+def exit_on_sigterm():
+    """
+    SIGTERM (docker stop, compose down) -> SystemExit. По умолчанию SIGTERM
+    завершает процесс без atexit, и все, что лежит в очереди sink'а, теряется.
+    SystemExit проходит через finally и atexit: close() дописывает очередь.
+    Вызывается из main() процесса, в главном потоке
+    """
+    signal.signal(signal.SIGTERM, _exit_on_signal)
+
+class FileOutput:
+    """Файл, в который пачка записей уходит одним write"""
+
+    def __init__(self, path, formatter):
+        self.path = path
+        self.formatter = formatter
+        self._stream = open(path, 'a', encoding='utf-8')
+
+    def write_batch(self, records):
+        lines = []
+        for record in records:
+            lines.append(self.formatter.format(record))
+            lines.append('\n')
+        self._stream.write(''.join(lines))
+        self._stream.flush()
+
+    def close(self):
+        self._stream.close()
+
+class SinkHandler(logging.Handler):
+    """logging.Handler, который только ставит запись в очередь sink'а"""
+
+    def __init__(self, sink, output):
+        super().__init__()
+        self.sink = sink
+        self.output = sink.add_output(output)
+
+    def handle(self, record):
+        # Без блокировки handler'а: очередь sink'а сама потокобезопасна
+        if self.filter(record):
+            self.emit(record)
+        return record
+
+    def emit(self, record):
+        self.sink.put(self.output, record)
+
+# Общий sink процесса (share_sink): несколько генераторов пишут через один поток
+_shared_sink = None
+
+def sink_from_env(name):
+    """Создает sink с параметрами из переменных окружения SINK_*"""
+    if _shared_sink is not None:
+        return _shared_sink
+    return BackgroundSink(
+        name,
+        capacity=int(os.getenv('SINK_CAPACITY', '10000')),
+        policy=os.getenv('SINK_POLICY', 'block'),
+        batch_size=int(os.getenv('SINK_BATCH_SIZE', '500')),
+        flush_interval=float(os.getenv('SINK_FLUSH_INTERVAL', '0.2')),
+    )
+
+def share_sink(name):
+    """Дальнейшие sink_from_env возвращают один sink name (все генераторы в одном процессе)"""
+    global _shared_sink
+    _shared_sink = None
+    _shared_sink = sink_from_env(name)
+    return _shared_sink
+
+def output_kinds_from_env():
+    """Виды выходов из LOG_OUTPUT, both раскрыт в file,tcp"""
+    kinds = [kind.strip() for kind in os.getenv('LOG_OUTPUT', 'file').split(',')]
+    if 'both' in kinds:
+        kinds[kinds.index('both'):kinds.index('both') + 1] = ['file', 'tcp']
+    return kinds
+
+def outputs_from_env(path, formatter):
+    """
+    Выходы для JSON событий по LOG_OUTPUT (через запятую):
+      file - файл path, который читает Logstash file input
+      tcp  - отправка в Logstash beats input (Lumberjack с подтверждениями, свой поток)
+      both - то же, что file,tcp
+      partitioned - файлы по часам <service>/<час>.json с индексом для выборки окна времени
+      archive - сжатый архив для офлайн-аналитики (ARCHIVE_FORMAT=zstd|gzip|parquet)
+    """
+    service = os.path.splitext(os.path.basename(path))[0]
+    outputs = []
+    for kind in output_kinds_from_env():
+        if kind == 'file':
+            outputs.append(FileOutput(path, formatter))
+        elif kind == 'tcp':
+            from common.shipper import LumberjackOutput
+            outputs.append(LumberjackOutput.from_env(formatter))
+        elif kind == 'partitioned':
+            from common.partition import PartitionedFileOutput
+            outputs.append(PartitionedFileOutput.from_env(os.path.dirname(path), service, formatter))
+        elif kind == 'archive':
+            from common.archive import ArchiveOutput
+            outputs.append(ArchiveOutput.from_env(service, formatter))
+        else:
+            raise ValueError(f"Unknown LOG_OUTPUT: {kind}")
+    return outputs
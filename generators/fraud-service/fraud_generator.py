@@ -9,46 +9,92 @@ import random
 import time
 import logging
 import os
+import sys
+import uuid
 from datetime import datetime
-from faker import Faker
 from pythonjsonlogger import jsonlogger
 
-fake = Faker('ru_RU')
+# Общие модули лежат в generators/common (в контейнере - в /app/common)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import population, schema
+from common.probe import canary_from_env
+from common.profiling import install_profiling
+from common.routing import pre_routing_from_env
+from common.sampling import WeightedChoice, picker_from_env
+from common.sink import FileOutput, SinkHandler, exit_on_sigterm, outputs_from_env, sink_from_env
+from common.transfer_graph import feed_from_env, graph_from_env
 
 # Конфигурация логирования
 log_dir = "/app/logs"
 os.makedirs(log_dir, exist_ok=True)
 
-json_handler = logging.FileHandler(f"{log_dir}/fraud-service.json")
+# Запись на диск идет в фоновом потоке: генератор только кладет события в очередь.
+# Размер очереди и политика переполнения задаются SINK_CAPACITY / SINK_POLICY.
+sink = sink_from_env('fraud-service')
+
 json_formatter = jsonlogger.JsonFormatter(fmt='%(asctime)s %(levelname)s %(name)s %(message)s')
-json_handler.setFormatter(json_formatter)
+# JSON события: файл для Logstash file input и/или прямая отправка (LOG_OUTPUT=file,tcp)
+json_handlers = [
+    SinkHandler(sink, output)
+    for output in outputs_from_env(f"{log_dir}/fraud-service.json", json_formatter)
+]
 
-text_handler = logging.FileHandler(f"{log_dir}/fraud-service.log")
 text_formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s')
-text_handler.setFormatter(text_formatter)
+text_handler = SinkHandler(sink, FileOutput(f"{log_dir}/fraud-service.log", text_formatter))
 
 json_logger = logging.getLogger('fraud-service-json')
-json_logger.addHandler(json_handler)
+for handler in json_handlers:
+    json_logger.addHandler(handler)
 json_logger.setLevel(logging.INFO)
+# index_suffix, tags и @timestamp проставляются здесь, а не в Logstash (PRE_ROUTING)
+pre_routing_from_env(json_logger)
+
+# Канареечные события для замера задержки доставки до Elasticsearch (CANARY_RATE в секунду)
+canary = canary_from_env('fraud-service', json_logger)
 
 text_logger = logging.getLogger('fraud-service')
 text_logger.addHandler(text_handler)
 text_logger.setLevel(logging.INFO)
 
+# В режиме отладки каждое событие проверяется по общей схеме
+validate_event = None
+if os.getenv('LOG_LEVEL', 'INFO').upper() == 'DEBUG':
+    validate_event = schema.compile_validator('fraud-service')
+
+# Торговцы и города для алертов по картам: снимки популяций (python -m common.population build)
+COMPANIES = population.load('companies').column('name')
+CITIES = population.load('cities').column('name')
+USER_IDS = population.load('users').column('user_id')
+
+# Те же имена picker'ов, что в auth и payment: горячие пользователи и торговцы совпадают
+USER_PICKER = picker_from_env(USER_IDS, 'users')
+MERCHANT_PICKER = picker_from_env(COMPANIES, 'companies-merchant')
+CITY_PICKER = picker_from_env(CITIES, 'cities')
+
 # Типы мошеннических активностей
 FRAUD_EVENTS = {
     'suspicious_transaction': {'level': 'WARN', 'weight': 40},
     'card_fraud_detected': {'level': 'ERROR', 'weight': 20},
     'account_takeover': {'level': 'CRITICAL', 'weight': 10},
-    'money_laundering': {'level': 'CRITICAL', 'weight': 5},
+    # Не случайные: алерты по кольцам переводов из графа (detect_laundering)
+    'money_laundering': {'level': 'CRITICAL', 'weight': 0},
     'identity_theft': {'level': 'ERROR', 'weight': 15},
     'false_positive': {'level': 'INFO', 'weight': 10}
 }
 
+# Alias таблица по весам событий строится один раз
+FRAUD_EVENT_PICKER = WeightedChoice({event: info['weight'] for event, info in FRAUD_EVENTS.items() if info['weight']})
+
+# Граф переводов за окно AML_WINDOW_SECONDS по логу payment-service (PAYMENT_FEED)
+TRANSFER_GRAPH = graph_from_env()
+PAYMENT_FEED = feed_from_env(log_dir)
+
+# Базовый риск по схеме: кольцо и сбор на транзитный счет подозрительнее длинной цепочки
+RING_RISK = {'cycle': 90, 'fan_in': 85, 'fan_out': 85, 'layering_chain': 80}
+
 def generate_fraud_event():
     """Генерирует событие fraud detection"""
-    event_weights = [FRAUD_EVENTS[event]['weight'] for event in FRAUD_EVENTS]
-    event_type = random.choices(list(FRAUD_EVENTS.keys()), weights=event_weights)[0]
+    event_type = FRAUD_EVENT_PICKER.pick()
     
     timestamp = datetime.now()
     
@@ -56,10 +102,10 @@ def generate_fraud_event():
         'timestamp': timestamp.isoformat(),
         'service': 'fraud-service',
         'event_type': event_type,
-        'alert_id': fake.uuid4(),
+        'alert_id': str(uuid.uuid4()),
         'risk_score': random.randint(1, 100),
-        'user_id': f'user_{random.randint(1, 500):04d}',
-        'transaction_id': fake.uuid4(),
+        'user_id': USER_PICKER.pick(),
+        'transaction_id': str(uuid.uuid4()),
         'level': FRAUD_EVENTS[event_type]['level']
     }
     
@@ -72,14 +118,42 @@ def generate_fraud_event():
     elif event_type == 'card_fraud_detected':
         event_data.update({
             'message': 'Card fraud detected',
-            'card_number': fake.credit_card_number()[-4:],
-            'merchant': fake.company(),
-            'location': fake.city()
+            'card_number': f"{random.randint(0, 9999):04d}",
+            'merchant': MERCHANT_PICKER.pick(),
+            'location': CITY_PICKER.pick()
         })
     
     return event_data
 
+def detect_laundering():
+    """Новые переводы из лога payment-service в граф; по каждой найденной схеме - алерт"""
+    events = []
+    for sender, recipient, amount, ts, transaction_id in PAYMENT_FEED.poll():
+        for ring in TRANSFER_GRAPH.add_transfer(sender, recipient, amount, ts, transaction_id):
+            accounts = ring['accounts']
+            events.append({
+                'timestamp': datetime.now().isoformat(),
+                'service': 'fraud-service',
+                'event_type': 'money_laundering',
+                'alert_id': str(uuid.uuid4()),
+                'risk_score': min(100, RING_RISK[ring['pattern']] + len(accounts)),
+                'transaction_id': ring['transactions'][-1],
+                'level': FRAUD_EVENTS['money_laundering']['level'],
+                'message': f"Money laundering pattern {ring['pattern']}: {', '.join(accounts)}",
+                'ring_pattern': ring['pattern'],
+                'ring_accounts': accounts,
+                'ring_transactions': ring['transactions'],
+                'ring_size': len(accounts),
+                'amount': ring['amount'],
+                'ring_duration_seconds': ring['duration_seconds'],
+            })
+    return events
+
 def log_event(event_data):
+    if validate_event:
+        for error in validate_event(event_data):
+            print(f"⚠️ Schema violation: {error}")
+
     level = event_data['level']
     message = event_data.get('message', f"Fraud event: {event_data['event_type']}")
     
@@ -100,26 +174,40 @@ def log_event(event_data):
         json_logger.critical(message, extra=log_data)
         text_logger.critical(message)
 
+# Счетчик событий процесса: run_cycle вызывают и main, и общий runner (python -m common.runner)
+event_count = 0
+
+def run_cycle():
+    """Один цикл генерации; возвращает паузу до следующего цикла в секундах"""
+    global event_count
+    
+    # Fraud события происходят реже
+    events_per_cycle = random.randint(0, 2)
+    events = [generate_fraud_event() for _ in range(events_per_cycle)]
+    # Кольца по переводам, которые payment-service записал с прошлого цикла
+    events += detect_laundering()
+    
+    for event in events:
+        log_event(event)
+        event_count += 1
+        
+        if event_count % 50 == 0:
+            print(f"🚨 Generated {event_count} fraud events ({sink.describe()}, {TRANSFER_GRAPH.describe()})")
+    
+    return random.uniform(10.0, 60.0)  # 10-60 секунд между событиями
+
 def main():
     print("🚨 Starting Banking Fraud Detection Service Log Generator...")
     print(f"📁 Logs will be written to: {log_dir}")
-    
-    event_count = 0
+    # Профилирование по SIGUSR1/SIGUSR2 или PROFILE_ON_START (common/profiling.py)
+    install_profiling('fraud-service')
+    # docker stop: дописать очередь sink'а перед выходом
+    exit_on_sigterm()
+    canary.start()
     
     try:
         while True:
-            # Fraud события происходят реже
-            events_per_cycle = random.randint(0, 2)
-            
-            for _ in range(events_per_cycle):
-                event = generate_fraud_event()
-                log_event(event)
-                event_count += 1
-                
-                if event_count % 50 == 0:
-                    print(f"🚨 Generated {event_count} fraud events")
-            
-            time.sleep(random.uniform(10.0, 60.0))  # 10-60 секунд между событиями
+            time.sleep(run_cycle())
             
     except KeyboardInterrupt:
         print(f"\n✅ Fraud service generator stopped. Total events: {event_count}")
@@ -4,12 +4,17 @@ Banking Metrics Exporter for Prometheus
 Экспортирует метрики банковских сервисов для Prometheus
 """
 
+import os
+import sys
+import threading
 import time
 import random
 from prometheus_client import start_http_server, Gauge, Counter, Histogram
-from faker import Faker
 
-fake = Faker()
+# Общие модули лежат в generators/common (в контейнере - в /app/common)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.probe import LagChecker, source_from_env, stall_after_from_env
+from common.profiling import install_profiling
 
 # Определяем метрики
 REQUEST_COUNT = Counter('banking_requests_total', 'Total requests', ['service', 'method', 'status'])
@@ -19,6 +24,18 @@ TRANSACTION_AMOUNT = Gauge('banking_transaction_amount_total', 'Total transactio
 ERROR_RATE = Gauge('banking_error_rate', 'Error rate percentage', ['service'])
 QUEUE_SIZE = Gauge('banking_queue_size', 'Queue size', ['queue_name'])
 
+# Задержка доставки событий генераторов до поиска в Elasticsearch (по канарейкам)
+INGEST_LAG = Histogram(
+    'banking_ingest_lag_seconds', 'Time from event emit to searchable in Elasticsearch', ['service'],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+)
+INGEST_LAG_QUANTILE = Gauge(
+    'banking_ingest_lag_quantile_seconds', 'Ingest lag quantile over the probe window', ['service', 'quantile']
+)
+CANARY_RECEIVED = Counter('banking_canary_received_total', 'Canary events found in Elasticsearch', ['service'])
+CANARY_LOST = Counter('banking_canary_lost_total', 'Canary events never found in Elasticsearch', ['service'])
+INGEST_STALLED = Gauge('banking_ingest_stalled', 'No new canaries found for the stall period (1 - stalled)', ['service'])
+
 # Банковские сервисы
 SERVICES = ['auth-service', 'payment-service', 'fraud-service', 'notification-service']
 
@@ -76,27 +93,73 @@ def update_metrics():
     new_transaction = random.uniform(1000, 500000)  # Новая транзакция
     TRANSACTION_AMOUNT.set(current_total + new_transaction)
 
+def ingest_checker_from_env():
+    """LagChecker, который выгружает задержки в метрики (INGEST_PROBE=0 - выключено)"""
+    if os.getenv('INGEST_PROBE', '1') != '1':
+        return None
+
+    def on_lag(service, seconds):
+        INGEST_LAG.labels(service=service).observe(seconds)
+        CANARY_RECEIVED.labels(service=service).inc()
+
+    def on_lost(service, count):
+        CANARY_LOST.labels(service=service).inc(count)
+
+    return LagChecker(source_from_env(), on_lag=on_lag, on_lost=on_lost, stall_after=stall_after_from_env())
+
+def start_ingest_probe():
+    """Запускает фоновую проверку канареек с периодом INGEST_PROBE_INTERVAL"""
+    checker = ingest_checker_from_env()
+    if checker is None:
+        return None
+    interval = float(os.getenv('INGEST_PROBE_INTERVAL', '1'))
+    threading.Thread(target=checker.run, args=(interval,), name='ingest-probe', daemon=True).start()
+    print(f"🐤 Ingest lag probe started ({type(checker.source).__name__})")
+    return checker
+
+def update_ingest_lag_metrics(checker):
+    """Перцентили задержки за окно проверки"""
+    for service, report in checker.report().items():
+        INGEST_STALLED.labels(service=service).set(1 if report['stalled'] else 0)
+        for quantile in ('p50', 'p95', 'p99', 'max'):
+            if report[quantile] is not None:
+                INGEST_LAG_QUANTILE.labels(service=service, quantile=quantile).set(report[quantile])
+
+# Проверка канареек; main и общий runner (python -m common.runner) запускают ее по-своему
+checker = None
+metrics_count = 0
+
+def run_cycle():
+    """Одно обновление метрик; возвращает паузу до следующего в секундах"""
+    global metrics_count
+    update_metrics()
+    if checker:
+        update_ingest_lag_metrics(checker)
+    metrics_count += 1
+    
+    if metrics_count % 60 == 0:  # Каждую минуту
+        print(f"📈 Updated metrics {metrics_count} times")
+    
+    # Обновляем метрики каждые 5 секунд
+    return 5
+
 def main():
     """Основной цикл экспорта метрик"""
-    port = 8080
+    global checker
+    port = int(os.getenv('METRICS_PORT', '8080'))
     print(f"📊 Starting Banking Metrics Exporter on port {port}")
     print(f"🔗 Metrics available at: http://localhost:{port}/metrics")
     
+    # Профилирование по SIGUSR1/SIGUSR2 или PROFILE_ON_START (common/profiling.py)
+    install_profiling('metrics-exporter')
+    
     # Запускаем HTTP сервер для Prometheus
     start_http_server(port)
-    
-    metrics_count = 0
+    checker = start_ingest_probe()
     
     try:
         while True:
-            update_metrics()
-            metrics_count += 1
-            
-            if metrics_count % 60 == 0:  # Каждую минуту
-                print(f"📈 Updated metrics {metrics_count} times")
-            
-            # Обновляем метрики каждые 5 секунд
-            time.sleep(5)
+            time.sleep(run_cycle())
             
     except KeyboardInterrupt:
         print(f"\n✅ Metrics exporter stopped. Total updates: {metrics_count}")
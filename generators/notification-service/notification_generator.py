@@ -8,31 +8,60 @@ import random
 import time
 import logging
 import os
+import sys
+import uuid
 from datetime import datetime
-from faker import Faker
 from pythonjsonlogger import jsonlogger
 
-fake = Faker('ru_RU')
+# Общие модули лежат в generators/common (в контейнере - в /app/common)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import population, schema
+from common.probe import canary_from_env
+from common.profiling import install_profiling
+from common.routing import pre_routing_from_env
+from common.sampling import WeightedChoice, picker_from_env
+from common.sink import FileOutput, SinkHandler, exit_on_sigterm, outputs_from_env, sink_from_env
 
 log_dir = "/app/logs"
 os.makedirs(log_dir, exist_ok=True)
 
-json_handler = logging.FileHandler(f"{log_dir}/notification-service.json")
+# Запись на диск идет в фоновом потоке: генератор только кладет события в очередь.
+# Размер очереди и политика переполнения задаются SINK_CAPACITY / SINK_POLICY.
+sink = sink_from_env('notification-service')
+
 json_formatter = jsonlogger.JsonFormatter(fmt='%(asctime)s %(levelname)s %(name)s %(message)s')
-json_handler.setFormatter(json_formatter)
+# JSON события: файл для Logstash file input и/или прямая отправка (LOG_OUTPUT=file,tcp)
+json_handlers = [
+    SinkHandler(sink, output)
+    for output in outputs_from_env(f"{log_dir}/notification-service.json", json_formatter)
+]
 
-text_handler = logging.FileHandler(f"{log_dir}/notification-service.log")
 text_formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s')
-text_handler.setFormatter(text_formatter)
+text_handler = SinkHandler(sink, FileOutput(f"{log_dir}/notification-service.log", text_formatter))
 
 json_logger = logging.getLogger('notification-service-json')
-json_logger.addHandler(json_handler)
+for handler in json_handlers:
+    json_logger.addHandler(handler)
 json_logger.setLevel(logging.INFO)
+# index_suffix, tags и @timestamp проставляются здесь, а не в Logstash (PRE_ROUTING)
+pre_routing_from_env(json_logger)
+
+# Канареечные события для замера задержки доставки до Elasticsearch (CANARY_RATE в секунду)
+canary = canary_from_env('notification-service', json_logger)
 
 text_logger = logging.getLogger('notification-service')
 text_logger.addHandler(text_handler)
 text_logger.setLevel(logging.INFO)
 
+# В режиме отладки каждое событие проверяется по общей схеме
+validate_event = None
+if os.getenv('LOG_LEVEL', 'INFO').upper() == 'DEBUG':
+    validate_event = schema.compile_validator('notification-service')
+
+# Получатели уведомлений: снимок популяции пользователей (python -m common.population build)
+BANK_USERS = population.load('users')
+USER_PICKER = picker_from_env(BANK_USERS, 'users')
+
 NOTIFICATION_TYPES = {
     'sms_sent': {'level': 'INFO', 'weight': 50},
     'email_sent': {'level': 'INFO', 'weight': 30},
@@ -41,24 +70,29 @@ NOTIFICATION_TYPES = {
     'email_failed': {'level': 'ERROR', 'weight': 2}
 }
 
+# Alias таблица по весам событий строится один раз
+NOTIFICATION_TYPE_PICKER = WeightedChoice({event: info['weight'] for event, info in NOTIFICATION_TYPES.items()})
+
 def generate_notification_event():
-    event_weights = [NOTIFICATION_TYPES[event]['weight'] for event in NOTIFICATION_TYPES]
-    event_type = random.choices(list(NOTIFICATION_TYPES.keys()), weights=event_weights)[0]
+    event_type = NOTIFICATION_TYPE_PICKER.pick()
     
+    # Телефон и email берутся у того же пользователя
+    user = USER_PICKER.pick()
+
     event_data = {
         'timestamp': datetime.now().isoformat(),
         'service': 'notification-service',
         'event_type': event_type,
-        'notification_id': fake.uuid4(),
-        'user_id': f'user_{random.randint(1, 500):04d}',
+        'notification_id': str(uuid.uuid4()),
+        'user_id': user['user_id'],
         'level': NOTIFICATION_TYPES[event_type]['level']
     }
     
     if 'sms' in event_type:
-        event_data['phone'] = fake.phone_number()
+        event_data['phone'] = user['phone']
         event_data['message'] = "Код подтверждения: " + str(random.randint(100000, 999999))
     elif 'email' in event_type:
-        event_data['email'] = fake.email()
+        event_data['email'] = user['email']
         event_data['subject'] = random.choice(['Операция по карте', 'Пополнение счета', 'Изменение тарифа'])
     
     if 'failed' in event_type:
@@ -70,6 +104,10 @@ def generate_notification_event():
     return event_data
 
 def log_event(event_data):
+    if validate_event:
+        for error in validate_event(event_data):
+            print(f"⚠️ Schema violation: {error}")
+
     level = event_data['level']
     message = event_data.get('message', f"Notification event: {event_data['event_type']}")
     
@@ -84,25 +122,37 @@ def log_event(event_data):
         json_logger.error(message, extra=log_data)
         text_logger.error(message)
 
+# Счетчик событий процесса: run_cycle вызывают и main, и общий runner (python -m common.runner)
+event_count = 0
+
+def run_cycle():
+    """Один цикл генерации; возвращает паузу до следующего цикла в секундах"""
+    global event_count
+    
+    events_per_cycle = random.randint(1, 4)
+    
+    for _ in range(events_per_cycle):
+        event = generate_notification_event()
+        log_event(event)
+        event_count += 1
+        
+        if event_count % 100 == 0:
+            print(f"📱 Generated {event_count} notification events ({sink.describe()})")
+    
+    return random.uniform(2.0, 15.0)
+
 def main():
     print("📱 Starting Banking Notification Service Log Generator...")
     print(f"📁 Logs will be written to: {log_dir}")
-    
-    event_count = 0
+    # Профилирование по SIGUSR1/SIGUSR2 или PROFILE_ON_START (common/profiling.py)
+    install_profiling('notification-service')
+    # docker stop: дописать очередь sink'а перед выходом
+    exit_on_sigterm()
+    canary.start()
     
     try:
         while True:
-            events_per_cycle = random.randint(1, 4)
-            
-            for _ in range(events_per_cycle):
-                event = generate_notification_event()
-                log_event(event)
-                event_count += 1
-                
-                if event_count % 100 == 0:
-                    print(f"📱 Generated {event_count} notification events")
-            
-            time.sleep(random.uniform(2.0, 15.0))
+            time.sleep(run_cycle())
             
     except KeyboardInterrupt:
         print(f"\n✅ Notification service generator stopped. Total events: {event_count}")
@@ -9,57 +9,79 @@ import random
 import time
 import logging
 import os
+import string
+import sys
+import uuid
 from datetime import datetime, timedelta
-from faker import Faker
 from pythonjsonlogger import jsonlogger
 
-# Настройка Faker для русских данных
-fake = Faker('ru_RU')
+# Общие модули лежат в generators/common (в контейнере - в /app/common)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import population, schema
+from common.idcache import id_cache_from_env
+from common.probe import canary_from_env
+from common.profiling import install_profiling
+from common.retry import DelayQueue, backoff_delay
+from common.routing import pre_routing_from_env
+from common.sampling import WeightedChoice, picker_from_env
+from common.sink import FileOutput, SinkHandler, exit_on_sigterm, outputs_from_env, sink_from_env
+from common.transfer_graph import laundering_scenario
 
 # Конфигурация логирования
 log_dir = "/app/logs"
 os.makedirs(log_dir, exist_ok=True)
 
+# Запись на диск идет в фоновом потоке: генератор только кладет события в очередь.
+# Размер очереди и политика переполнения задаются SINK_CAPACITY / SINK_POLICY.
+sink = sink_from_env('payment-service')
+
 # JSON logger для структурированных логов
-json_handler = logging.FileHandler(f"{log_dir}/payment-service.json")
 json_formatter = jsonlogger.JsonFormatter(
     fmt='%(asctime)s %(levelname)s %(name)s %(message)s'
 )
-json_handler.setFormatter(json_formatter)
+# JSON события: файл для Logstash file input и/или прямая отправка (LOG_OUTPUT=file,tcp)
+json_handlers = [
+    SinkHandler(sink, output)
+    for output in outputs_from_env(f"{log_dir}/payment-service.json", json_formatter)
+]
 
 # Plain text logger для обычных логов
-text_handler = logging.FileHandler(f"{log_dir}/payment-service.log")
 text_formatter = logging.Formatter(
     '%(asctime)s [%(levelname)s] %(name)s: %(message)s'
 )
-text_handler.setFormatter(text_formatter)
+text_handler = SinkHandler(sink, FileOutput(f"{log_dir}/payment-service.log", text_formatter))
 
 # Создаём логгеры
 json_logger = logging.getLogger('payment-service-json')
-json_logger.addHandler(json_handler)
+for handler in json_handlers:
+    json_logger.addHandler(handler)
 json_logger.setLevel(logging.INFO)
+# index_suffix, tags и @timestamp проставляются здесь, а не в Logstash (PRE_ROUTING)
+pre_routing_from_env(json_logger)
+
+# Канареечные события для замера задержки доставки до Elasticsearch (CANARY_RATE в секунду)
+canary = canary_from_env('payment-service', json_logger)
 
 text_logger = logging.getLogger('payment-service')
 text_logger.addHandler(text_handler)
 text_logger.setLevel(logging.INFO)
 
-# Банковские счета (IBAN для России)
-def generate_iban():
-    """Генерирует корректный российский IBAN"""
-    bank_code = random.choice(['044525974', '044525225', '044525593'])  # ВТБ, Сбербанк, Альфа
-    account = ''.join([str(random.randint(0, 9)) for _ in range(20)])
-    return f"RU{random.randint(10, 99)}{bank_code}{account}"
-
-BANK_ACCOUNTS = [
-    {
-        'account_id': f'acc_{i:06d}',
-        'iban': generate_iban(),
-        'balance': random.uniform(1000, 1000000),
-        'owner_name': fake.name(),
-        'account_type': random.choice(['current', 'savings', 'business'])
-    }
-    for i in range(1, 1001)  # 1000 счетов
-]
+# В режиме отладки каждое событие проверяется по общей схеме
+validate_event = None
+if os.getenv('LOG_LEVEL', 'INFO').upper() == 'DEBUG':
+    validate_event = schema.compile_validator('payment-service')
+
+# Банковские счета и компании: снимки популяций (python -m common.population build),
+# открываются через mmap без Faker
+BANK_ACCOUNTS = population.load('accounts')
+COMPANIES = population.load('companies').column('name')
+
+# Несколько счетов (зарплатные, крупные торговцы) дают большую часть операций:
+# у отправителей и получателей свои горячие множества (ENTITY_SKEW / SKEW_<NAME>)
+SENDER_PICKER = picker_from_env(BANK_ACCOUNTS, 'accounts-sender')
+RECIPIENT_PICKER = picker_from_env(BANK_ACCOUNTS, 'accounts-recipient')
+MERCHANT_PICKER = picker_from_env(COMPANIES, 'companies-merchant')
+BANK_PICKER = picker_from_env(COMPANIES, 'companies-bank')
 
 # Типы платежей и их характеристики
 PAYMENT_TYPES = {
@@ -107,7 +129,7 @@ PAYMENT_TYPES = {
     }
 }
 
-# Ошибки платежей
+# Ошибки платежей (duplicate_transaction не случайна - ее выдает проверка processed_transactions)
 PAYMENT_ERRORS = [
     'insufficient_funds',
     'account_blocked', 
@@ -116,10 +138,36 @@ PAYMENT_ERRORS = [
     'network_timeout',
     'fraud_detected',
     'invalid_amount',
-    'service_unavailable',
-    'duplicate_transaction'
+    'service_unavailable'
 ]
 
+# Поля исхода попытки: при повторе пересчитываются, остальные поля платежа сохраняются
+OUTCOME_FIELDS = (
+    'timestamp', 'status', 'level', 'message', 'fee', 'authorization_code', 'merchant_category',
+    'suspicious_amount', 'compliance_check', 'error_code', 'can_retry', 'night_transaction',
+    'processing_time_ms'
+)
+
+# Повторы неуспешных платежей: backoff с jitter, не больше RETRY_MAX_ATTEMPTS попыток
+RETRY_MAX_ATTEMPTS = int(os.getenv('RETRY_MAX_ATTEMPTS', '3'))
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', '1'))
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', '60'))
+retry_queue = DelayQueue(int(os.getenv('RETRY_QUEUE_CAPACITY', '10000')))
+
+# Доля таймаутов, после которых платеж на самом деле прошел, и доля повторных
+# отправок уже успешных платежей - источники настоящих дубликатов
+TIMEOUT_COMMITTED_RATE = float(os.getenv('TIMEOUT_COMMITTED_RATE', '0.5'))
+DOUBLE_SUBMIT_RATE = float(os.getenv('DOUBLE_SUBMIT_RATE', '0.01'))
+
+# Проведенные платежи для обнаружения дубликатов, память ограничена (DEDUP_CACHE / DEDUP_CAPACITY)
+processed_transactions = id_cache_from_env()
+
+# Схемы отмывания (цепочки, кольца, fan-in/fan-out через малоактивные счета) среди обычных
+# переводов: их ищет граф переводов fraud-service. 0 - без схем
+LAUNDERING_RINGS_PER_HOUR = float(os.getenv('LAUNDERING_RINGS_PER_HOUR', '2'))
+laundering_queue = DelayQueue()
+next_ring = time.monotonic() + random.expovariate(LAUNDERING_RINGS_PER_HOUR / 3600) if LAUNDERING_RINGS_PER_HOUR > 0 else None
+
 # Получатели платежей
 RECIPIENTS = [
     'ООО "Газпром энергосбыт"',
@@ -149,41 +197,42 @@ def get_current_hour_activity_multiplier():
     else:  # Утренние часы
         return 1.0
 
+# Alias таблица по весам типов платежей строится один раз
+PAYMENT_TYPE_PICKER = WeightedChoice({ptype: info['weight'] for ptype, info in PAYMENT_TYPES.items()})
+UTILITY_PICKER = picker_from_env(RECIPIENTS, 'utility-recipients')
+
 def generate_payment_event():
-    """Генерирует одно событие платежа"""
+    """Генерирует одно событие платежа (первая попытка)"""
     
     # Выбираем тип платежа на основе весов
-    payment_weights = [PAYMENT_TYPES[ptype]['weight'] for ptype in PAYMENT_TYPES]
-    payment_type = random.choices(list(PAYMENT_TYPES.keys()), weights=payment_weights)[0]
+    payment_type = PAYMENT_TYPE_PICKER.pick()
     payment_info = PAYMENT_TYPES[payment_type]
     
     # Выбираем случайные счета
-    sender_account = random.choice(BANK_ACCOUNTS)
-    recipient_account = random.choice(BANK_ACCOUNTS)
+    sender_account = SENDER_PICKER.pick()
+    recipient_account = RECIPIENT_PICKER.pick()
     
     # Убеждаемся что отправитель и получатель разные
     while recipient_account['account_id'] == sender_account['account_id']:
-        recipient_account = random.choice(BANK_ACCOUNTS)
+        recipient_account = RECIPIENT_PICKER.pick()
     
     # Генерируем сумму платежа
     amount = round(random.uniform(payment_info['min_amount'], payment_info['max_amount']), 2)
+    return build_payment_event(payment_type, sender_account, recipient_account, amount)
+
+def build_payment_event(payment_type, sender_account, recipient_account, amount, succeed=False):
+    """Событие платежа с заданными типом, счетами и суммой; succeed - без случайной ошибки"""
     
     # Определяем валюту
     currency = 'RUB'
     if payment_type == 'international_transfer':
         currency = random.choice(['USD', 'EUR', 'CNY', 'KZT'])
     
-    # Проверяем на ошибку
-    is_error = random.random() < payment_info['error_rate']
-    
     # Базовые данные события
-    timestamp = datetime.now()
-    transaction_id = fake.uuid4()
-    
     event_data = {
-        'timestamp': timestamp.isoformat(),
+        'timestamp': datetime.now().isoformat(),
         'service': 'payment-service',
-        'transaction_id': transaction_id,
+        'transaction_id': str(uuid.uuid4()),
         'payment_type': payment_type,
         'sender_account': sender_account['account_id'],
         'sender_iban': sender_account['iban'],
@@ -192,20 +241,94 @@ def generate_payment_event():
         'recipient_iban': recipient_account['iban'],
         'recipient_name': recipient_account['owner_name'],
         'amount': amount,
-        'currency': currency,
-        'processing_time_ms': random.randint(50, 2000)
+        'currency': currency
     }
     
+    # Дополнительные поля для разных типов платежей
+    if payment_type == 'utility_payment':
+        event_data['recipient_name'] = UTILITY_PICKER.pick()
+        event_data['service_type'] = random.choice(['electricity', 'gas', 'water', 'internet', 'mobile'])
+        
+    elif payment_type == 'international_transfer':
+        event_data['swift_code'] = ''.join(random.choices(string.ascii_uppercase, k=8)) + f"{random.randint(0, 999):03d}"
+        event_data['correspondent_bank'] = BANK_PICKER.pick()
+        event_data['exchange_rate'] = round(random.uniform(50, 100), 4) if currency != 'RUB' else 1.0
+        
+    elif payment_type == 'card_payment':
+        event_data['card_number'] = f"{random.randint(0, 9999):04d}"  # Последние 4 цифры
+        event_data['terminal_id'] = f"TERM-{random.randint(0, 99999):05d}"
+        event_data['merchant_name'] = MERCHANT_PICKER.pick()
+    
+    apply_outcome(event_data, succeed)
+    return event_data
+
+def pick_quiet_accounts(count):
+    """Индексы счетов, редких и среди отправителей, и среди получателей: мулы не тонут в обычных переводах"""
+    picked = []
+    while len(picked) < count:
+        index = SENDER_PICKER.cold_index()
+        if RECIPIENT_PICKER.rank(index) >= RECIPIENT_PICKER.n // 2 and index not in picked:
+            picked.append(index)
+    return picked
+
+def schedule_laundering_ring():
+    """Ставит переводы одной схемы в очередь по их задержкам от текущего момента"""
+    pattern, transfers = laundering_scenario(pick_quiet_accounts)
+    started = time.monotonic()
+    for delay, sender, recipient, amount in transfers:
+        laundering_queue.push(started + delay, (sender, recipient, amount))
+    print(f"🕵️ Laundering scenario {pattern} scheduled: {len(transfers)} transfers")
+
+def laundering_payment_event(sender, recipient, amount):
+    """
+    Перевод схемы: обычный transfer, крупные суммы - large_transfer.
+    Всегда успешен и не повторяется: упавшее или задвоенное звено разорвало бы
+    цепочку, и fraud-service не нашел бы схему, которую payment-service запустил
+    """
+    payment_type = 'transfer' if amount <= PAYMENT_TYPES['transfer']['max_amount'] else 'large_transfer'
+    return build_payment_event(payment_type, BANK_ACCOUNTS[sender], BANK_ACCOUNTS[recipient], amount, succeed=True)
+
+def retry_payment_event(previous):
+    """Повторная попытка того же платежа: тот же transaction_id, новый исход"""
+    event_data = {key: value for key, value in previous.items() if key not in OUTCOME_FIELDS}
+    event_data['timestamp'] = datetime.now().isoformat()
+    event_data['retry_count'] = previous.get('retry_count', 0) + 1
+    apply_outcome(event_data)
+    return event_data
+
+def apply_outcome(event_data, succeed=False):
+    """Обрабатывает попытку платежа: успех, ошибка или отказ как дубликата уже проведенного"""
+    payment_info = PAYMENT_TYPES[event_data['payment_type']]
+    transaction_id = event_data['transaction_id']
+    amount = event_data['amount']
+    currency = event_data['currency']
+    retry_count = event_data.get('retry_count', 0)
+    event_data['processing_time_ms'] = random.randint(50, 2000)
+    
+    # Дубликат определяется по состоянию: платеж с этим id уже проведен
+    if transaction_id in processed_transactions:
+        event_data.update({
+            'status': 'failed',
+            'level': 'ERROR',
+            'error_code': 'duplicate_transaction',
+            'message': "Payment failed: duplicate_transaction",
+            'retry_count': retry_count,
+            'can_retry': False
+        })
+        
     # Обработка успешного платежа
-    if not is_error:
+    elif succeed or random.random() >= payment_info['error_rate']:
+        processed_transactions.add(transaction_id)
         event_data.update({
             'status': 'success',
             'level': payment_info['level'],
             'message': f"Payment processed successfully: {amount} {currency}",
             'fee': round(amount * random.uniform(0.001, 0.01), 2),
-            'authorization_code': fake.bothify('AUTH-######'),
-            'merchant_category': random.choice(['5411', '5812', '4900', '6011']) if payment_type == 'card_payment' else None
+            'authorization_code': f"AUTH-{random.randint(0, 999999):06d}",
+            'merchant_category': random.choice(['5411', '5812', '4900', '6011']) if event_data['payment_type'] == 'card_payment' else None
         })
+        if retry_count:
+            event_data['retry_count'] = retry_count
         
         # Специальная обработка для подозрительных сумм
         if amount > 1000000:
@@ -219,41 +342,42 @@ def generate_payment_event():
     # Обработка ошибки платежа
     else:
         error_code = random.choice(PAYMENT_ERRORS)
+        # Таймаут ответа: платеж мог пройти, и повтор клиента окажется дубликатом
+        if error_code == 'network_timeout' and random.random() < TIMEOUT_COMMITTED_RATE:
+            processed_transactions.add(transaction_id)
         event_data.update({
             'status': 'failed',
             'level': 'ERROR',
             'error_code': error_code,
             'message': f"Payment failed: {error_code}",
-            'retry_count': random.randint(0, 3),
+            'retry_count': retry_count,
             'can_retry': error_code not in ['fraud_detected', 'account_blocked']
         })
     
-    # Дополнительные поля для разных типов платежей
-    if payment_type == 'utility_payment':
-        event_data['recipient_name'] = random.choice(RECIPIENTS)
-        event_data['service_type'] = random.choice(['electricity', 'gas', 'water', 'internet', 'mobile'])
-        
-    elif payment_type == 'international_transfer':
-        event_data['swift_code'] = fake.bothify('????????###')
-        event_data['correspondent_bank'] = fake.company()
-        event_data['exchange_rate'] = round(random.uniform(50, 100), 4) if currency != 'RUB' else 1.0
-        
-    elif payment_type == 'card_payment':
-        event_data['card_number'] = fake.credit_card_number()[-4:]  # Последние 4 цифры
-        event_data['terminal_id'] = fake.bothify('TERM-#####')
-        event_data['merchant_name'] = fake.company()
-    
     # Ночные платежи отмечаем как подозрительные
-    if 0 <= timestamp.hour <= 6:
+    if 0 <= datetime.fromisoformat(event_data['timestamp']).hour <= 6:
         event_data['night_transaction'] = True
         if event_data['status'] == 'success':
             event_data['level'] = 'WARN'
             event_data['message'] += " [Night transaction - requires review]"
-    
-    return event_data
+
+def schedule_retry(event_data):
+    """Ставит повтор платежа в очередь с задержкой"""
+    attempt = event_data.get('retry_count', 0)
+    if event_data['status'] == 'failed':
+        if event_data['can_retry'] and attempt < RETRY_MAX_ATTEMPTS:
+            delay = backoff_delay(attempt, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+            retry_queue.push(time.monotonic() + delay, event_data)
+    elif random.random() < DOUBLE_SUBMIT_RATE:
+        # Клиент не дождался ответа и отправил уже проведенный платеж еще раз
+        retry_queue.push(time.monotonic() + random.uniform(0.5, 5.0), event_data)
 
 def log_event(event_data):
     """Записывает событие в логи"""
+    if validate_event:
+        for error in validate_event(event_data):
+            print(f"⚠️ Schema violation: {error}")
+
     level = event_data['level']
     message = event_data.get('message', f"Payment event: {event_data['payment_type']}")
     
@@ -272,32 +396,65 @@ def log_event(event_data):
         json_logger.error(message, extra=log_data)
         text_logger.error(message)
 
+# Счетчик событий процесса: run_cycle вызывают и main, и общий runner (python -m common.runner)
+event_count = 0
+next_cycle = time.monotonic()
+
+def run_cycle():
+    """Один цикл: повторы, время которых подошло, и новые платежи в своем темпе; возвращает паузу в секундах"""
+    global event_count, next_cycle, next_ring
+    
+    # Сначала повторы, время которых подошло
+    events = [retry_payment_event(previous) for previous in retry_queue.pop_due(time.monotonic())]
+    
+    # Переводы схем отмывания, которым подошло время, и новая схема по расписанию
+    ring_events = [laundering_payment_event(*transfer) for transfer in laundering_queue.pop_due(time.monotonic())]
+    if next_ring is not None and time.monotonic() >= next_ring:
+        schedule_laundering_ring()
+        next_ring = time.monotonic() + random.expovariate(LAUNDERING_RINGS_PER_HOUR / 3600)
+    
+    # Новые платежи - в своем темпе, ранние пробуждения ради повторов его не ускоряют
+    if time.monotonic() >= next_cycle:
+        # Учитываем активность по времени суток
+        activity_multiplier = get_current_hour_activity_multiplier()
+        
+        # Генерируем события
+        events_per_cycle = max(1, int(random.randint(2, 8) * activity_multiplier))
+        events += [generate_payment_event() for _ in range(events_per_cycle)]
+        
+        # Пауза между циклами (от 0.5 до 5 секунд)
+        next_cycle = time.monotonic() + random.uniform(0.5, 5.0) / activity_multiplier
+    
+    # Повторы и двойные отправки - только у обычных платежей, переводы схем идут после них
+    retryable = len(events)
+    for index, event in enumerate(events + ring_events):
+        log_event(event)
+        if index < retryable:
+            schedule_retry(event)
+        event_count += 1
+        
+        if event_count % 100 == 0:
+            print(f"📊 Generated {event_count} payment events ({sink.describe()}, "
+                  f"retries queued {len(retry_queue)}, dropped {retry_queue.dropped}, "
+                  f"{processed_transactions.describe()})")
+    
+    # Спим до следующего цикла, ближайшего повтора или перевода схемы
+    wake_at = min(next_cycle, retry_queue.next_due() or next_cycle, laundering_queue.next_due() or next_cycle)
+    return max(0.0, wake_at - time.monotonic())
+
 def main():
     """Основной цикл генерации логов"""
     print("💰 Starting Banking Payment Service Log Generator...")
     print(f"📁 Logs will be written to: {log_dir}")
-    
-    event_count = 0
+    # Профилирование по SIGUSR1/SIGUSR2 или PROFILE_ON_START (common/profiling.py)
+    install_profiling('payment-service')
+    # docker stop: дописать очередь sink'а перед выходом
+    exit_on_sigterm()
+    canary.start()
     
     try:
         while True:
-            # Учитываем активность по времени суток
-            activity_multiplier = get_current_hour_activity_multiplier()
-            
-            # Генерируем события
-            events_per_cycle = max(1, int(random.randint(2, 8) * activity_multiplier))
-            
-            for _ in range(events_per_cycle):
-                event = generate_payment_event()
-                log_event(event)
-                event_count += 1
-                
-                if event_count % 100 == 0:
-                    print(f"📊 Generated {event_count} payment events")
-            
-            # Пауза между циклами (от 0.5 до 5 секунд)
-            sleep_time = random.uniform(0.5, 5.0) / activity_multiplier
-            time.sleep(sleep_time)
+            time.sleep(run_cycle())
             
     except KeyboardInterrupt:
         print(f"\n✅ Payment service generator stopped. Total events: {event_count}")
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Модули common импортируются как из каталога generators (python -m common.<модуль>)
+GENERATORS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, GENERATORS_DIR)
@@ -0,0 +1,47 @@
+"""Запуск из каталога generators: python -m pytest tests"""
+
+import json
+import logging
+import os
+from datetime import datetime
+
+import pytest
+
+from common.archive import ArchiveOutput, iter_files, read_archive
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps({'message': record.getMessage(), 'amount': getattr(record, 'amount', None)})
+
+def payment_record(amount, message='payment'):
+    return logging.makeLogRecord({
+        'msg': message, 'levelname': 'INFO', 'service': 'payment-service',
+        'timestamp': datetime.now().isoformat(), 'amount': amount,
+    })
+
+def test_unclosed_segment_is_recovered(tmp_path):
+    pytest.importorskip('zstandard')
+    # flush_seconds=0: сжатый блок уходит в .tmp после каждой пачки, close() не вызывается (SIGKILL)
+    output = ArchiveOutput('payment-service', os.fspath(tmp_path), JsonFormatter(), fmt='zstd', flush_seconds=0)
+    output.write_batch([payment_record(float(i)) for i in range(100)])
+    day = datetime.now().strftime('%Y-%m-%d')
+    assert iter_files(os.fspath(tmp_path), 'payment-service', day) == []
+
+    ArchiveOutput('payment-service', os.fspath(tmp_path), JsonFormatter(), fmt='zstd')
+    amounts = [a for batch in read_archive(os.fspath(tmp_path), 'payment-service', day, columns=['amount'])
+               for a in batch['amount']]
+    assert amounts == [float(i) for i in range(100)]
+    assert not any(name.endswith('.tmp') for _, _, names in os.walk(tmp_path) for name in names)
+
+def test_bad_parquet_row_does_not_poison_buffer(tmp_path):
+    pytest.importorskip('pyarrow')
+    output = ArchiveOutput('payment-service', os.fspath(tmp_path), JsonFormatter(), fmt='parquet', row_group_size=1)
+    output.write_batch([payment_record('not a number')])
+    output.write_batch([payment_record(10.0), payment_record(20.0)])
+    output.close()
+
+    day = datetime.now().strftime('%Y-%m-%d')
+    amounts = [a for batch in read_archive(os.fspath(tmp_path), 'payment-service', day, columns=['amount'])
+               for a in batch['amount']]
+    assert output.dropped_rows == 1
+    assert amounts == [10.0, 20.0]
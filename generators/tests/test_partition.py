@@ -0,0 +1,35 @@
+"""Запуск из каталога generators: python -m pytest tests"""
+
+import json
+import logging
+import os
+
+from common.partition import PartitionedFileOutput, query
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps({'timestamp': record.timestamp, 'message': record.getMessage()})
+
+def write(base_dir, timestamps, index_every=1000):
+    output = PartitionedFileOutput(base_dir, 'payment-service', JsonFormatter(), index_every=index_every)
+    output.write_batch([logging.makeLogRecord({'timestamp': ts, 'msg': ts}) for ts in timestamps])
+    output.close()
+
+def timestamps(lines):
+    return [json.loads(line)['timestamp'] for line in lines]
+
+def test_out_of_order_record_near_end_bound(tmp_path):
+    # 14:00:00.900 - канарейка, записанная другим потоком после события следующей секунды
+    write(os.fspath(tmp_path), ['2026-10-16T14:00:00.500000', '2026-10-16T14:00:01.200000',
+                                '2026-10-16T14:00:00.900000', '2026-10-16T14:00:02.000000'])
+    found = query(os.fspath(tmp_path), 'payment-service', '2026-10-16T14:00:00', '2026-10-16T14:00:01')
+    assert timestamps(found) == ['2026-10-16T14:00:00.500000', '2026-10-16T14:00:00.900000']
+
+def test_out_of_order_record_near_start_bound(tmp_path):
+    # Опоздавшая секунда не ломает порядок индекса: окно с 14:00:02 находит все свои события
+    write(os.fspath(tmp_path), ['2026-10-16T14:00:01.000000', '2026-10-16T14:00:03.000000',
+                                '2026-10-16T14:00:01.500000', '2026-10-16T14:00:02.500000',
+                                '2026-10-16T14:00:04.000000'], index_every=1)
+    found = query(os.fspath(tmp_path), 'payment-service', '2026-10-16T14:00:02', '2026-10-16T14:00:05')
+    assert timestamps(found) == ['2026-10-16T14:00:03.000000', '2026-10-16T14:00:02.500000',
+                                 '2026-10-16T14:00:04.000000']
@@ -0,0 +1,33 @@
+"""Запуск из каталога generators: python -m pytest tests"""
+
+import json
+import os
+
+from common.replay import FileReplaySink, iter_events, replay
+
+def write_lines(path, timestamps):
+    with open(path, 'w', encoding='utf-8') as f:
+        for ts in timestamps:
+            f.write(json.dumps({'timestamp': ts, 'service': 'payment-service'}) + '\n')
+
+def test_out_of_order_record_near_end_bound(tmp_path):
+    # 14:00:00.900 - канарейка, записанная другим потоком после события следующей секунды
+    path = os.fspath(tmp_path / 'payment-service.json')
+    write_lines(path, ['2026-10-16T14:00:00.500000', '2026-10-16T14:00:01.200000',
+                       '2026-10-16T14:00:00.900000', '2026-10-16T14:00:02.000000'])
+    found = [ts for ts, _ in iter_events([path], '2026-10-16T14:00:00', '2026-10-16T14:00:01')]
+    assert found == ['2026-10-16T14:00:00.500000', '2026-10-16T14:00:00.900000']
+
+def test_replay_window_keeps_late_record(tmp_path):
+    path = os.fspath(tmp_path / 'payment-service.json')
+    write_lines(path, ['2026-10-16T14:00:00.500000', '2026-10-16T14:00:01.200000',
+                       '2026-10-16T14:00:00.900000'])
+    output = os.fspath(tmp_path / 'replay.json')
+    sink = FileReplaySink(output)
+    count, _ = replay([path], sink, speed=0, start='2026-10-16T14:00:00', end='2026-10-16T14:00:01',
+                      rewrite=False)
+    sink.close()
+    assert count == 2
+    with open(output, encoding='utf-8') as f:
+        assert [json.loads(line)['timestamp'] for line in f] == ['2026-10-16T14:00:00.500000',
+                                                                 '2026-10-16T14:00:00.900000']
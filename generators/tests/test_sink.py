@@ -0,0 +1,58 @@
+"""Запуск из каталога generators: python -m pytest tests"""
+
+import logging
+import os
+import signal
+import subprocess
+import sys
+import textwrap
+
+from conftest import GENERATORS_DIR
+
+# Процесс с медленным выходом: к моменту SIGTERM в очереди остается почти все
+SLOW_WRITER = textwrap.dedent("""
+    import logging, sys, time
+    from common.sink import BackgroundSink, FileOutput, SinkHandler, exit_on_sigterm
+
+    class SlowOutput(FileOutput):
+        def write_batch(self, records):
+            time.sleep(0.01)
+            super().write_batch(records)
+
+    sink = BackgroundSink('test', capacity=100000, batch_size=20)
+    logger = logging.getLogger('sigterm')
+    logger.addHandler(SinkHandler(sink, SlowOutput(sys.argv[1], logging.Formatter('%(message)s'))))
+    logger.setLevel(logging.INFO)
+    exit_on_sigterm()
+    for i in range(int(sys.argv[2])):
+        logger.info('record %d', i)
+    print('ready', flush=True)
+    while True:
+        time.sleep(1)
+""")
+
+def test_sigterm_flushes_queue(tmp_path):
+    path = tmp_path / 'out.log'
+    count = 3000
+    process = subprocess.Popen([sys.executable, '-c', SLOW_WRITER, str(path), str(count)],
+                               cwd=GENERATORS_DIR, stdout=subprocess.PIPE, text=True)
+    try:
+        assert process.stdout.readline().strip() == 'ready'
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=30) == 128 + signal.SIGTERM
+    finally:
+        process.kill()
+        process.stdout.close()
+
+    lines = path.read_text(encoding='utf-8').splitlines()
+    assert lines == [f'record {i}' for i in range(count)]
+
+def test_put_after_close_is_dropped(tmp_path):
+    from common.sink import BackgroundSink, FileOutput
+
+    sink = BackgroundSink('test')
+    output = sink.add_output(FileOutput(os.fspath(tmp_path / 'out.log'), logging.Formatter('%(message)s')))
+    record = logging.LogRecord('test', logging.INFO, __file__, 0, 'late', None, None)
+    sink.close()
+    assert sink.put(output, record) is False
+    assert sink.stats()['dropped_newest'] == 1
@@ -4,114 +4,446 @@
 Создает Data Views, дашборды и визуализации
 """
 
+import math
+import os
+import random
 import requests
 import json
 import time
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Схема событий общая с генераторами (в контейнере лежит в /app/common)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'generators'))
+from common import schema
 
 KIBANA_URL = "http://kibana:5601"
 ELASTICSEARCH_URL = "http://elasticsearch:9200"
 
-def wait_for_services():
-    """Ждет запуска Elasticsearch и Kibana"""
-    print("🔄 Waiting for Elasticsearch...")
-    while True:
+# Сколько максимум ждем готовности сервисов (секунды)
+READY_TIMEOUT = float(os.getenv('READY_TIMEOUT', '600'))
+
+# Экспоненциальный backoff для проверок готовности
+BACKOFF_INITIAL = 0.25
+BACKOFF_MAX = 5.0
+
+KIBANA_HEADERS = {
+    'Content-Type': 'application/json',
+    'kbn-xsrf': 'true'
+}
+
+# Ожидаемый суммарный поток событий (событий/сек) и средний размер документа.
+# Из них считаются шардирование, rollover и настройки индексации.
+TARGET_INGEST_RATE = float(os.getenv('TARGET_INGEST_RATE', '50'))
+AVG_EVENT_BYTES = int(os.getenv('AVG_EVENT_BYTES', '700'))
+
+# Сроки жизненного цикла данных
+WARM_AFTER_DAYS = int(os.getenv('ILM_WARM_AFTER_DAYS', '2'))
+RETENTION_DAYS = int(os.getenv('ILM_RETENTION_DAYS', '30'))
+
+# Data streams, в которые пишет Logstash (banking-logs-<index_suffix>)
+DATA_STREAMS = list(schema.INDEX_SUFFIXES.values()) + [schema.DEFAULT_INDEX_SUFFIX]
+
+# Целевой размер primary шарда и сколько событий/сек выдерживает один шард
+TARGET_SHARD_GB = 30
+SHARD_INGEST_CAPACITY = 5000
+
+ILM_POLICY_NAME = "banking-logs"
+
+# Что делать с полями, которых нет в схеме: false - хранить только в _source,
+# strict - отклонять документ
+MAPPING_DYNAMIC = os.getenv('MAPPING_DYNAMIC', 'false')
+
+# Фиксированные id, чтобы повторный запуск находил уже созданные объекты
+DATA_VIEW_ID = "banking-logs"
+DASHBOARD_ID = "banking-security-overview"
+SUMMARY_DATA_VIEW_ID = "banking-summary"
+SUMMARY_DASHBOARD_ID = "banking-summaries"
+
+# Сводки поддерживаются continuous transforms: дашборды читают их вместо сырых
+# banking-logs-*, и время запроса не растет вместе с объемом данных.
+# Интервал -> как часто transform ищет новые данные и сколько хранить сводку (None - бессрочно)
+SUMMARY_INTERVALS = {
+    '1m': {'frequency': '1m', 'retention': f"{os.getenv('SUMMARY_MINUTE_RETENTION_DAYS', '14')}d"},
+    '1h': {'frequency': '5m', 'retention': None},
+}
+
+# Сколько ждать опоздавшие события, прежде чем считать бакет закрытым
+SUMMARY_SYNC_DELAY = os.getenv('SUMMARY_SYNC_DELAY', '60s')
+
+# Служебные события, которые в сводки не попадают: канарейки замера задержки (common/probe.py)
+SUMMARY_EXCLUDE = [{'exists': {'field': 'canary_seq'}}]
+
+def _terms(field):
+    # missing_bucket: события без поля (например, платежи без event_type) тоже считаются
+    return {'terms': {'field': field, 'missing_bucket': True}}
+
+def _count():
+    return {'value_count': {'field': '@timestamp'}}
+
+# Сводка -> источник, необязательные query (filter) и exclude (must_not), группировка
+# (к ней добавляется бакет по @timestamp) и агрегаты
+SUMMARIES = {
+    'events': {
+        'description': 'Event counts by service, level and event type',
+        'source': 'banking-logs-*',
+        'group_by': {
+            'service': _terms('service'),
+            'level': _terms('level'),
+            'event_type': _terms('event_type'),
+        },
+        'aggregations': {'events': _count()},
+    },
+    'payments': {
+        'description': 'Payment amounts and processing time',
+        'source': 'banking-logs-payments',
+        'group_by': {
+            'payment_type': _terms('payment_type'),
+            'currency': _terms('currency'),
+            'status': _terms('status'),
+        },
+        'aggregations': {
+            'payments': _count(),
+            'amount_sum': {'sum': {'field': 'amount'}},
+            'amount_avg': {'avg': {'field': 'amount'}},
+            'amount_max': {'max': {'field': 'amount'}},
+            'amount_percentiles': {'percentiles': {'field': 'amount', 'percents': [50, 95, 99]}},
+            'fee_sum': {'sum': {'field': 'fee'}},
+            'processing_ms_percentiles': {
+                'percentiles': {'field': 'processing_time_ms', 'percents': [50, 95, 99]}
+            },
+        },
+    },
+    'failures': {
+        'description': 'Failure rate by service',
+        'source': 'banking-logs-*',
+        'group_by': {'service': _terms('service')},
+        'aggregations': {
+            'events': _count(),
+            # error_code однозначное поле: число значений = число неуспешных событий
+            'failed': {'value_count': {'field': 'error_code'}},
+            'failure_rate': {'bucket_script': {
+                'buckets_path': {'failed': 'failed', 'events': 'events'},
+                'script': 'params.events > 0 ? params.failed / params.events : 0'
+            }},
+        },
+    },
+    'errors': {
+        'description': 'Failures by error code',
+        'source': 'banking-logs-*',
+        'query': {'exists': {'field': 'error_code'}},
+        'group_by': {
+            'service': _terms('service'),
+            'error_code': {'terms': {'field': 'error_code'}},
+        },
+        'aggregations': {'failures': _count()},
+    },
+    'risk-users': {
+        'description': 'Risk score per user',
+        'source': 'banking-logs-*',
+        'query': {'exists': {'field': 'risk_score'}},
+        # Алерты о схемах отмывания относятся к счетам, а не к пользователю
+        'exclude': [{'term': {'event_type': 'money_laundering'}}],
+        'group_by': {'user_id': {'terms': {'field': 'user_id'}}},
+        'aggregations': {
+            'alerts': _count(),
+            'max_risk_score': {'max': {'field': 'risk_score'}},
+            'avg_risk_score': {'avg': {'field': 'risk_score'}},
+        },
+        # Поминутно по пользователям сводка почти не меньше сырых данных
+        'intervals': ['1h'],
+    },
+}
+
+def wait_until(name, probe, timeout=READY_TIMEOUT):
+    """Опрашивает probe() с экспоненциальным backoff, пока он не вернет True"""
+    print(f"🔄 Waiting for {name}...")
+    started = time.monotonic()
+    delay = BACKOFF_INITIAL
+    while time.monotonic() - started < timeout:
         try:
-            response = requests.get(f"{ELASTICSEARCH_URL}/_cluster/health", timeout=5)
-            if response.status_code == 200:
-                print("✅ Elasticsearch ready")
-                break
-        except:
+            if probe():
+                print(f"✅ {name} ready ({time.monotonic() - started:.1f}s)")
+                return True
+        except requests.RequestException:
             pass
-        time.sleep(5)
-    
-    print("🔄 Waiting for Kibana...")
-    while True:
+        # Полный jitter, чтобы параллельные проверки не били в такт
+        time.sleep(random.uniform(0, delay))
+        delay = min(delay * 2, BACKOFF_MAX)
+    print(f"❌ {name} not ready after {timeout:.0f}s")
+    return False
+
+def elasticsearch_ready():
+    """Кластер отвечает и имеет статус yellow или green"""
+    response = requests.get(
+        f"{ELASTICSEARCH_URL}/_cluster/health",
+        params={'wait_for_status': 'yellow', 'timeout': '2s'},
+        timeout=5
+    )
+    return response.json().get('status') in ('yellow', 'green')
+
+def kibana_ready():
+    """Kibana сообщает overall.level == available"""
+    response = requests.get(f"{KIBANA_URL}/api/status", timeout=5)
+    if response.status_code != 200:
+        return False
+    overall = response.json().get('status', {}).get('overall', {})
+    return overall.get('level') == 'available'
+
+def wait_for_elasticsearch():
+    return wait_until("Elasticsearch", elasticsearch_ready)
+
+def wait_for_kibana():
+    return wait_until("Kibana", kibana_ready)
+
+def _flatten_settings(settings, prefix=''):
+    """Приводит index settings к плоскому виду index.x -> str, как их отдает ES"""
+    flat = {}
+    for key, value in settings.items():
+        full_key = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten_settings(value, f"{full_key}."))
+        else:
+            if not full_key.startswith('index.'):
+                full_key = f"index.{full_key}"
+            flat[full_key] = str(value).lower() if isinstance(value, bool) else str(value)
+    return flat
+
+def _json_document(value):
+    """Строка с JSON объектом или массивом (visState, panelsJSON...) -> разобранное значение, иначе None"""
+    if not isinstance(value, str) or not value.lstrip().startswith(('{', '[')):
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        return None
+
+def _contains(expected, actual):
+    """Проверяет, что все заданные нами значения уже присутствуют в actual"""
+    # Kibana при миграциях пересериализует JSON в строковых атрибутах (порядок ключей,
+    # пробелы, новые поля): сравниваем разобранные документы, а не строки
+    parsed = _json_document(expected)
+    if parsed is not None and isinstance(actual, str):
+        current = _json_document(actual)
+        return current is not None and _contains(parsed, current)
+    if isinstance(expected, dict):
+        return isinstance(actual, dict) and all(
+            key in actual and _contains(value, actual[key])
+            for key, value in expected.items()
+        )
+    if isinstance(expected, list):
+        return (isinstance(actual, list) and len(expected) == len(actual)
+                and all(_contains(e, a) for e, a in zip(expected, actual)))
+    return expected == actual
+
+def ingest_tuning(target_rate=TARGET_INGEST_RATE, event_bytes=AVG_EVENT_BYTES):
+    """Подбирает настройки индексации и условия rollover под целевой поток"""
+    # Поток делится между data streams, но payments заметно крупнее остальных,
+    # поэтому считаем с запасом по половине общего потока на один stream
+    stream_rate = max(target_rate / 2, 0.1)
+
+    shards = max(1, math.ceil(stream_rate / SHARD_INGEST_CAPACITY))
+
+    # Rollover по возрасту: сколько дней нужно, чтобы шард дорос до целевого размера.
+    # На малом потоке это не дает плодить крошечные шарды каждый день.
+    bytes_per_day = stream_rate * event_bytes * 86400 / shards
+    days_to_fill = TARGET_SHARD_GB * 1024 ** 3 / bytes_per_day
+    max_age_days = min(max(int(days_to_fill), 1), max(RETENTION_DAYS // 2, 1))
+
+    if target_rate < 100:
+        refresh_interval = "1s"
+    elif target_rate < 1000:
+        refresh_interval = "5s"
+    elif target_rate < 10000:
+        refresh_interval = "15s"
+    else:
+        refresh_interval = "30s"
+
+    settings = {
+        "number_of_shards": shards,
+        "number_of_replicas": 0,
+        "refresh_interval": refresh_interval,
+        "lifecycle": {"name": ILM_POLICY_NAME}
+    }
+    # При большом потоке fsync на каждый bulk-запрос становится узким местом
+    if target_rate >= 1000:
+        settings["translog"] = {"durability": "async", "sync_interval": "5s"}
+    else:
+        settings["translog"] = {"durability": "request"}
+
+    rollover = {
+        "max_primary_shard_size": f"{TARGET_SHARD_GB}gb",
+        "max_age": f"{max_age_days}d"
+    }
+    return settings, rollover
+
+def create_ilm_policy():
+    """Создает ILM политику: rollover, force-merge и сжатие в warm, удаление"""
+    print("♻️ Creating ILM policy...")
+
+    _, rollover = ingest_tuning()
+    policy = {
+        "policy": {
+            "phases": {
+                "hot": {
+                    "min_age": "0ms",
+                    "actions": {
+                        "rollover": rollover
+                    }
+                },
+                "warm": {
+                    "min_age": f"{WARM_AFTER_DAYS}d",
+                    "actions": {
+                        "forcemerge": {
+                            "max_num_segments": 1,
+                            "index_codec": "best_compression"
+                        },
+                        "readonly": {}
+                    }
+                },
+                "delete": {
+                    "min_age": f"{RETENTION_DAYS}d",
+                    "actions": {
+                        "delete": {}
+                    }
+                }
+            }
+        }
+    }
+
+    try:
+        url = f"{ELASTICSEARCH_URL}/_ilm/policy/{ILM_POLICY_NAME}"
+        existing = requests.get(url, timeout=30)
+        if existing.status_code == 200:
+            current = existing.json().get(ILM_POLICY_NAME, {})
+            if _contains(policy['policy'], current.get('policy', {})):
+                print("✅ ILM policy up to date")
+                return True
+
+        response = requests.put(url, json=policy, timeout=30)
+
+        if response.status_code in [200, 201]:
+            print(f"✅ ILM policy created (rollover: {rollover})")
+            return True
+        else:
+            print(f"❌ Failed to create ILM policy: {response.status_code}")
+            print(response.text)
+            return False
+    except Exception as e:
+        print(f"❌ Error creating ILM policy: {e}")
+        return False
+
+def create_data_streams():
+    """Создает data streams заранее, чтобы первая запись Logstash не создала обычный индекс"""
+    print("🌊 Creating data streams...")
+
+    ok = True
+    for suffix in DATA_STREAMS:
+        name = f"banking-logs-{suffix}"
         try:
-            response = requests.get(f"{KIBANA_URL}/api/status", timeout=5)
-            if response.status_code == 200:
-                print("✅ Kibana ready")
-                break
-        except:
-            pass
-        time.sleep(5)
+            existing = requests.get(f"{ELASTICSEARCH_URL}/_data_stream/{name}", timeout=30)
+            if existing.status_code == 200:
+                continue
+            response = requests.put(f"{ELASTICSEARCH_URL}/_data_stream/{name}", timeout=30)
+            # 400 resource_already_exists - поток уже создан параллельной записью
+            if response.status_code not in [200, 201, 400]:
+                print(f"❌ Failed to create data stream {name}: {response.status_code}")
+                ok = False
+        except Exception as e:
+            print(f"❌ Error creating data stream {name}: {e}")
+            ok = False
+
+    if ok:
+        print("✅ Data streams ready")
+    return ok
 
 def create_data_view():
     """Создает Data View для банковских логов"""
     print("📊 Creating Kibana Data View...")
-    
-    headers = {
-        'Content-Type': 'application/json',
-        'kbn-xsrf': 'true'
-    }
-    
+    return ensure_data_view(DATA_VIEW_ID, "banking-logs-*", "Banking Logs")
+
+def ensure_data_view(view_id, title, name):
+    """Создает или обновляет Data View с фиксированным id"""
     data_view = {
         "data_view": {
-            "title": "banking-logs-*",
-            "name": "Banking Logs",
+            "id": view_id,
+            "title": title,
+            "name": name,
             "timeFieldName": "@timestamp"
         }
     }
-    
+
     try:
-        response = requests.post(
-            f"{KIBANA_URL}/api/data_views/data_view",
-            headers=headers,
-            json=data_view,
+        existing = requests.get(
+            f"{KIBANA_URL}/api/data_views/data_view/{view_id}",
+            headers=KIBANA_HEADERS,
             timeout=30
         )
-        
+        if existing.status_code == 200:
+            current = existing.json().get('data_view', {})
+            wanted = {k: v for k, v in data_view['data_view'].items() if k != 'id'}
+            if _contains(wanted, current):
+                print(f"✅ Data View {name} up to date")
+                return True
+            response = requests.post(
+                f"{KIBANA_URL}/api/data_views/data_view/{view_id}",
+                headers=KIBANA_HEADERS,
+                json={"data_view": wanted},
+                timeout=30
+            )
+        else:
+            response = requests.post(
+                f"{KIBANA_URL}/api/data_views/data_view",
+                headers=KIBANA_HEADERS,
+                json=data_view,
+                timeout=30
+            )
+
         if response.status_code in [200, 409]:  # 409 = уже существует
-            print("✅ Data View created successfully")
+            print(f"✅ Data View {name} created successfully")
             return True
         else:
-            print(f"❌ Failed to create Data View: {response.status_code}")
+            print(f"❌ Failed to create Data View {name}: {response.status_code}")
             print(response.text)
             return False
     except Exception as e:
-        print(f"❌ Error creating Data View: {e}")
+        print(f"❌ Error creating Data View {name}: {e}")
         return False
 
 def create_index_template():
     """Создает index template для правильного маппинга"""
     print("🔧 Creating Elasticsearch index template...")
-    
-    template = {
-        "index_patterns": ["banking-logs-*"],
-        "template": {
-            "settings": {
-                "number_of_shards": 1,
-                "number_of_replicas": 0
-            },
-            "mappings": {
-                "properties": {
-                    "@timestamp": {"type": "date"},
-                    "timestamp": {"type": "date"},
-                    "service": {"type": "keyword"},
-                    "level": {"type": "keyword"},
-                    "message": {"type": "text"},
-                    "user_id": {"type": "keyword"},
-                    "amount": {"type": "double"},
-                    "currency": {"type": "keyword"},
-                    "client_ip": {"type": "ip"},
-                    "risk_score": {"type": "integer"},
-                    "event_type": {"type": "keyword"},
-                    "status": {"type": "keyword"},
-                    "error_code": {"type": "keyword"}
-                }
-            }
-        }
-    }
-    
+
+    settings, _ = ingest_tuning()
+    template = schema.build_index_template(settings, dynamic=MAPPING_DYNAMIC)
+
     try:
+        existing = requests.get(
+            f"{ELASTICSEARCH_URL}/_index_template/banking-logs",
+            timeout=30
+        )
+        if existing.status_code == 200:
+            current = existing.json()['index_templates'][0]['index_template']
+            wanted = dict(template, template=dict(
+                template['template'],
+                settings=_flatten_settings(template['template']['settings'])
+            ))
+            current['template']['settings'] = _flatten_settings(
+                current.get('template', {}).get('settings', {})
+            )
+            if _contains(wanted, current):
+                print("✅ Index template up to date")
+                return True
+
         response = requests.put(
             f"{ELASTICSEARCH_URL}/_index_template/banking-logs",
             json=template,
             timeout=30
         )
-        
+
         if response.status_code in [200, 201]:
-            print("✅ Index template created")
+            print(f"✅ Index template created (target {TARGET_INGEST_RATE:g} events/s)")
             return True
         else:
             print(f"❌ Failed to create template: {response.status_code}")
@@ -123,12 +455,7 @@ def create_index_template():
 def create_sample_dashboard():
     """Создает образец дашборда в Kibana"""
     print("📈 Creating sample dashboard...")
-    
-    headers = {
-        'Content-Type': 'application/json',
-        'kbn-xsrf': 'true'
-    }
-    
+
     # Создаем дашборд через простой API
     dashboard = {
         "attributes": {
@@ -143,15 +470,23 @@ def create_sample_dashboard():
             }
         }
     }
-    
+
     try:
+        url = f"{KIBANA_URL}/api/saved_objects/dashboard/{DASHBOARD_ID}"
+        existing = requests.get(url, headers=KIBANA_HEADERS, timeout=30)
+        if existing.status_code == 200:
+            if _contains(dashboard['attributes'], existing.json().get('attributes', {})):
+                print("✅ Sample dashboard up to date")
+                return True
+
         response = requests.post(
-            f"{KIBANA_URL}/api/saved_objects/dashboard",
-            headers=headers,
+            url,
+            params={'overwrite': 'true'},
+            headers=KIBANA_HEADERS,
             json=dashboard,
             timeout=30
         )
-        
+
         if response.status_code in [200, 409]:
             print("✅ Sample dashboard created")
             return True
@@ -163,32 +498,289 @@ def create_sample_dashboard():
         print(f"❌ Error creating dashboard: {e}")
         return False
 
+def summary_index(name, interval):
+    return f"banking-summary-{name}-{interval}"
+
+def build_transform(name, interval):
+    """Тело continuous transform для сводки name с бакетами interval"""
+    spec = SUMMARIES[name]
+    options = SUMMARY_INTERVALS[interval]
+
+    query = {'bool': {'must_not': SUMMARY_EXCLUDE + spec.get('exclude', [])}}
+    if 'query' in spec:
+        query['bool']['filter'] = [spec['query']]
+    source = {'index': [spec['source']], 'query': query}
+    group_by = {
+        '@timestamp': {'date_histogram': {'field': '@timestamp', 'fixed_interval': interval}},
+        **spec['group_by']
+    }
+    transform = {
+        'description': f"{spec['description']} per {interval}",
+        'source': source,
+        'dest': {'index': summary_index(name, interval)},
+        'frequency': options['frequency'],
+        'sync': {'time': {'field': '@timestamp', 'delay': SUMMARY_SYNC_DELAY}},
+        'pivot': {'group_by': group_by, 'aggregations': spec['aggregations']},
+    }
+    if options['retention']:
+        transform['retention_policy'] = {'time': {'field': '@timestamp', 'max_age': options['retention']}}
+    return transform
+
+def ensure_transform(transform_id, transform):
+    """Создает и запускает transform; если конфигурация изменилась - пересоздает вместе со сводкой"""
+    url = f"{ELASTICSEARCH_URL}/_transform/{transform_id}"
+    existing = requests.get(url, timeout=30)
+    if existing.status_code == 200:
+        current = existing.json()['transforms'][0]
+        if _contains(transform, current):
+            created = False
+        else:
+            # pivot нельзя обновить на месте: старые документы сводки имеют другую форму
+            print(f"🔄 Transform {transform_id} changed, recreating")
+            requests.post(f"{url}/_stop", params={'force': 'true', 'wait_for_completion': 'true'}, timeout=60)
+            requests.delete(url, params={'force': 'true', 'delete_dest_index': 'true'}, timeout=60)
+            created = True
+    else:
+        created = True
+
+    if created:
+        # defer_validation: источник может быть еще пустым, проверка полей - при первом запуске
+        response = requests.put(url, params={'defer_validation': 'true'}, json=transform, timeout=30)
+        if response.status_code not in [200, 201]:
+            print(f"❌ Failed to create transform {transform_id}: {response.status_code}")
+            print(response.text)
+            return False
+
+    response = requests.post(f"{url}/_start", timeout=30)
+    # 409 - transform уже запущен
+    if response.status_code not in [200, 409]:
+        print(f"❌ Failed to start transform {transform_id}: {response.status_code}")
+        print(response.text)
+        return False
+    print(f"✅ Transform {transform_id} {'created' if created else 'up to date'}")
+    return True
+
+def create_summary_transforms():
+    """Создает continuous transforms для минутных и часовых сводок"""
+    print("🧮 Creating summary transforms...")
+
+    ok = True
+    for name, spec in SUMMARIES.items():
+        for interval in spec.get('intervals', SUMMARY_INTERVALS):
+            transform_id = summary_index(name, interval)
+            try:
+                ok = ensure_transform(transform_id, build_transform(name, interval)) and ok
+            except Exception as e:
+                print(f"❌ Error creating transform {transform_id}: {e}")
+                ok = False
+    return ok
+
+def tsvb_visualization(vis_id, title, index, metrics, split_field=None, vis_type='timeseries',
+                       chart_type='line', stacked='none', interval='>=1m'):
+    """
+    Saved object TSVB визуализации. TSVB обращается к индексу сводки по имени,
+    поэтому панель не зависит от Data View и полей, которых еще нет.
+    Отображается последняя метрика из metrics (предыдущие - аргументы для math).
+    """
+    series = {
+        'id': f"{vis_id}-series",
+        'color': '#54B399',
+        'split_mode': 'terms' if split_field else 'everything',
+        'metrics': [dict(metric, id=metric.get('id', f"m{i}")) for i, metric in enumerate(metrics)],
+        'chart_type': chart_type,
+        'line_width': 1,
+        'point_size': 1,
+        'fill': 0.5 if stacked != 'none' else 0,
+        'stacked': stacked,
+        'formatter': 'number',
+    }
+    if split_field:
+        series.update({'terms_field': split_field, 'terms_size': '10',
+                       'terms_order_by': series['metrics'][-1]['id']})
+
+    params = {
+        'id': vis_id,
+        'type': vis_type,
+        'index_pattern': index,
+        'use_kibana_indexes': False,
+        'time_field': '@timestamp',
+        'interval': interval,
+        'drop_last_bucket': 0,
+        'axis_position': 'left',
+        'show_legend': 1,
+        'show_grid': 1,
+        'tooltip_mode': 'show_all',
+        'series': [series],
+    }
+    return {
+        'type': 'visualization',
+        'id': vis_id,
+        'attributes': {
+            'title': title,
+            'visState': json.dumps({'title': title, 'type': 'metrics', 'aggs': [], 'params': params}),
+            'uiStateJSON': '{}',
+            'description': '',
+            'version': 1,
+            'kibanaSavedObjectMeta': {'searchSourceJSON': json.dumps({'query': {'query': '', 'language': 'kuery'}, 'filter': []})},
+        },
+    }
+
+def summary_visualizations():
+    """Панели дашборда сводок"""
+    events_1m = summary_index('events', '1m')
+    payments_1m = summary_index('payments', '1m')
+    return [
+        tsvb_visualization('banking-summary-events-by-service', 'Events per minute by service', events_1m,
+                           [{'type': 'sum', 'field': 'events'}], split_field='service'),
+        tsvb_visualization('banking-summary-events-by-level', 'Events by level', events_1m,
+                           [{'type': 'sum', 'field': 'events'}], split_field='level',
+                           chart_type='bar', stacked='stacked'),
+        tsvb_visualization('banking-summary-payment-volume', 'Payment volume by currency', payments_1m,
+                           [{'type': 'sum', 'field': 'amount_sum'}], split_field='currency'),
+        # Перцентили не складываются: берем максимум по группам минуты как оценку сверху
+        tsvb_visualization('banking-summary-payment-p95', 'Payment amount p95 by type', payments_1m,
+                           [{'type': 'max', 'field': 'amount_percentiles.95'}], split_field='payment_type'),
+        tsvb_visualization('banking-summary-failure-rate', 'Failure rate by service', summary_index('failures', '1m'), [
+            {'id': 'failed', 'type': 'sum', 'field': 'failed'},
+            {'id': 'events', 'type': 'sum', 'field': 'events'},
+            {'id': 'rate', 'type': 'math', 'script': 'params.events > 0 ? params.failed / params.events : 0',
+             'variables': [{'id': 'v-failed', 'name': 'failed', 'field': 'failed'},
+                           {'id': 'v-events', 'name': 'events', 'field': 'events'}]},
+        ], split_field='service'),
+        tsvb_visualization('banking-summary-errors', 'Failures by error code', summary_index('errors', '1m'),
+                           [{'type': 'sum', 'field': 'failures'}], split_field='error_code',
+                           chart_type='bar', stacked='stacked'),
+        tsvb_visualization('banking-summary-risk-users', 'Top risk users', summary_index('risk-users', '1h'),
+                           [{'type': 'max', 'field': 'max_risk_score'}], split_field='user_id',
+                           vis_type='top_n', interval='>=1h'),
+    ]
+
+def create_summary_dashboard():
+    """Создает Data View сводок, визуализации и дашборд поверх banking-summary-*"""
+    print("📈 Creating summary dashboard...")
+
+    if not ensure_data_view(SUMMARY_DATA_VIEW_ID, "banking-summary-*", "Banking Summaries"):
+        return False
+
+    visualizations = summary_visualizations()
+    panels = []
+    references = []
+    for i, vis in enumerate(visualizations):
+        panels.append({
+            'version': '8.11.0',
+            'type': 'visualization',
+            'gridData': {'x': (i % 2) * 24, 'y': (i // 2) * 15, 'w': 24, 'h': 15, 'i': str(i)},
+            'panelIndex': str(i),
+            'embeddableConfig': {},
+            'panelRefName': f"panel_{i}",
+        })
+        references.append({'name': f"panel_{i}", 'type': 'visualization', 'id': vis['id']})
+
+    dashboard = {
+        'type': 'dashboard',
+        'id': SUMMARY_DASHBOARD_ID,
+        'attributes': {
+            'title': 'Banking Summaries',
+            'description': 'Dashboards over per-minute and per-hour summary indices (banking-summary-*)',
+            'panelsJSON': json.dumps(panels),
+            'optionsJSON': '{"useMargins":true,"syncColors":false,"hidePanelTitles":false}',
+            'version': 1,
+            'timeRestore': True,
+            'timeFrom': 'now-24h',
+            'timeTo': 'now',
+            'kibanaSavedObjectMeta': {
+                'searchSourceJSON': '{"query":{"query":"","language":"kuery"},"filter":[]}'
+            }
+        },
+        'references': references,
+    }
+    objects = visualizations + [dashboard]
+
+    try:
+        existing = requests.post(
+            f"{KIBANA_URL}/api/saved_objects/_bulk_get",
+            headers=KIBANA_HEADERS,
+            json=[{'type': obj['type'], 'id': obj['id']} for obj in objects],
+            timeout=30
+        )
+        if existing.status_code == 200:
+            current = existing.json().get('saved_objects', [])
+            if all(_contains(obj['attributes'], found.get('attributes', {}))
+                   for obj, found in zip(objects, current)):
+                print("✅ Summary dashboard up to date")
+                return True
+
+        response = requests.post(
+            f"{KIBANA_URL}/api/saved_objects/_bulk_create",
+            params={'overwrite': 'true'},
+            headers=KIBANA_HEADERS,
+            json=objects,
+            timeout=30
+        )
+        if response.status_code == 200:
+            print(f"✅ Summary dashboard created ({len(visualizations)} panels)")
+            return True
+        else:
+            print(f"❌ Failed to create summary dashboard: {response.status_code}")
+            print(f"Response: {response.text}")
+            return False
+    except Exception as e:
+        print(f"❌ Error creating summary dashboard: {e}")
+        return False
+
+# Граф настройки: шаг запускается, как только готовы все его зависимости.
+# Проверки готовности сервисов тоже являются шагами.
+SETUP_STEPS = {
+    'elasticsearch': {'func': wait_for_elasticsearch, 'requires': []},
+    'kibana': {'func': wait_for_kibana, 'requires': []},
+    'ilm_policy': {'func': create_ilm_policy, 'requires': ['elasticsearch']},
+    'index_template': {'func': create_index_template, 'requires': ['ilm_policy']},
+    'data_streams': {'func': create_data_streams, 'requires': ['index_template']},
+    'data_view': {'func': create_data_view, 'requires': ['kibana']},
+    'sample_dashboard': {'func': create_sample_dashboard, 'requires': ['kibana']},
+    'summary_transforms': {'func': create_summary_transforms, 'requires': ['data_streams']},
+    'summary_dashboard': {'func': create_summary_dashboard, 'requires': ['kibana']},
+}
+
+def run_steps(steps):
+    """Выполняет шаги параллельно с учетом зависимостей, возвращает {шаг: успех}"""
+    futures = {}  # шаг -> future: по нему шаги ждут зависимости
+    names = {}    # future -> шаг: по нему собираются результаты
+    submitted = threading.Event()
+
+    def run_step(name):
+        step = steps[name]
+        # Future зависимости может быть еще не создан, пока идет постановка шагов
+        submitted.wait()
+        for dependency in step['requires']:
+            if not futures[dependency].result():
+                print(f"⏭️ Skipping {name}: {dependency} failed")
+                return False
+        return step['func']()
+
+    # Каждый шаг занимает поток, пока ждет зависимости, поэтому потоков не меньше шагов
+    with ThreadPoolExecutor(max_workers=len(steps)) as executor:
+        for name in steps:
+            future = executor.submit(run_step, name)
+            futures[name] = future
+            names[future] = name
+        submitted.set()
+        return {names[future]: future.result() for future in as_completed(names)}
+
 def main():
     """Основная функция настройки"""
     print("🏦 Banking ELK Auto-Setup Starting...")
     print("=" * 50)
-    
-    # Ждем запуска сервисов
-    wait_for_services()
-    
-    # Даем время на полную инициализацию
-    print("⏳ Waiting for full initialization...")
-    time.sleep(30)
-    
-    # Создаем index template
-    if not create_index_template():
-        print("⚠️ Template creation failed, continuing...")
-    
-    # Создаем Data View
-    if not create_data_view():
-        print("⚠️ Data View creation failed, continuing...")
-    
-    # Создаем образец дашборда  
-    if not create_sample_dashboard():
-        print("⚠️ Dashboard creation failed, continuing...")
-    
+
+    started = time.monotonic()
+    results = run_steps(SETUP_STEPS)
+
+    for name, ok in results.items():
+        if not ok:
+            print(f"⚠️ Step {name} failed")
+
     print("=" * 50)
-    print("🎉 Setup completed!")
+    print(f"🎉 Setup completed in {time.monotonic() - started:.1f}s!")
     print("")
     print("📊 Access your services:")
     print("   Kibana:     http://localhost:5601")
@@ -197,6 +789,10 @@ def main():
     print("")
     print("💡 Data should appear in Kibana within 2-3 minutes")
     print("💡 Check Discover section for banking-logs-* data view")
+    print("💡 Banking Summaries dashboards read banking-summary-* (filled by transforms every minute)")
+
+    if not (results['elasticsearch'] and results['kibana']):
+        sys.exit(1)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()